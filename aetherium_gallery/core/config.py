@@ -24,7 +24,84 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "default-secret-should-be-overridden"
     DEBUG: bool = False
     GOOGLE_API_KEY: Optional[str] = None
-    
+
+    # Vector index persistence: new vectors go to an append-only log and the
+    # full index is only rewritten every VECTOR_CHECKPOINT_INTERVAL additions.
+    VECTOR_CHECKPOINT_INTERVAL: int = 500
+    # Memory-map the checkpointed index on startup instead of reading it into RAM;
+    # the model warmup copies it into memory before the first upload.
+    VECTOR_INDEX_MMAP: bool = True
+
+    # Embedding micro-batching: concurrent requests are grouped into one forward
+    # pass of up to EMBEDDING_BATCH_SIZE images, waiting at most EMBEDDING_MAX_WAIT_MS.
+    EMBEDDING_BATCH_SIZE: int = 16
+    EMBEDDING_MAX_WAIT_MS: float = 10.0
+    # Optional CPU inference optimizations (see scripts/benchmark_embeddings.py):
+    # int8 dynamic quantization, "torch_compile" / "torchscript" compilation,
+    # torch-side preprocessing, and the torch thread count (0 = torch default).
+    EMBEDDING_QUANTIZE: bool = False
+    EMBEDDING_COMPILE: str = "none"
+    EMBEDDING_FAST_PREPROCESS: bool = False
+    EMBEDDING_NUM_THREADS: int = 0
+
+    # Post-upload indexing runs on INDEXING_WORKERS background threads; uploads
+    # get 429 + Retry-After once INDEXING_QUEUE_SIZE images are waiting.
+    INDEXING_QUEUE_SIZE: int = 256
+    INDEXING_WORKERS: int = 4
+
+    # ANN index: the service starts on an exact IndexFlatIP and promotes itself to
+    # VECTOR_INDEX_TYPE ("flat", "ivf_flat", "ivf_pq" or "hnsw") in the background
+    # once it holds VECTOR_PROMOTION_THRESHOLD vectors.
+    VECTOR_INDEX_TYPE: str = "hnsw"
+    VECTOR_PROMOTION_THRESHOLD: int = 50000
+    VECTOR_IVF_NLIST: int = 0  # 0 = sized automatically from the vector count
+    VECTOR_PQ_M: int = 64
+    VECTOR_HNSW_M: int = 32
+    VECTOR_NPROBE: int = 16
+    VECTOR_EF_SEARCH: int = 64
+    # How promoted indexes store vectors: "float32", "fp16", "sq8" or "pq". PQ
+    # keeps an exact copy on disk and re-scores the top k * VECTOR_RERANK_FACTOR.
+    VECTOR_STORAGE: str = "float32"
+    VECTOR_RERANK_FACTOR: int = 4
+    # Deleted vectors are tombstoned; the index is compacted in the background
+    # once tombstones make up this fraction of it.
+    VECTOR_COMPACTION_THRESHOLD: float = 0.2
+    # Precomputed k-nearest-neighbour graph behind "related" and near-duplicate
+    # views; refreshed in the background when the index has changed.
+    KNN_GRAPH_K: int = 32
+    KNN_GRAPH_REFRESH_SECONDS: float = 300
+    # "Related images" on the detail page: IDF-weighted tag overlap and visual
+    # similarity, each weighted, over this many candidates from each source.
+    RELATED_TAG_WEIGHT: float = 0.5
+    RELATED_VISUAL_WEIGHT: float = 0.5
+    RELATED_CANDIDATES: int = 200
+    RELATED_CACHE_SIZE: int = 10000
+    # Visual clusters behind suggested albums: spherical k-means trained on at
+    # most CLUSTER_SAMPLE_PER_CENTROID vectors per centroid (CLUSTER_COUNT 0 =
+    # sized from the image count), re-run warm-started once this fraction of
+    # the index has changed.
+    CLUSTER_COUNT: int = 0
+    CLUSTER_SAMPLE_PER_CENTROID: int = 256
+    CLUSTER_REFRESH_DRIFT: float = 0.1
+    CLUSTER_CHECK_SECONDS: float = 60
+    # Gallery-wide album cohesion report (per-image outlier scores); 0 = only on demand.
+    COHESION_SWEEP_INTERVAL_HOURS: float = 24
+    # New images are placed on the Constellation Map with the saved UMAP model;
+    # a full refit starts once they make up this fraction of the fitted set (0 = never).
+    MAP_REFIT_DRIFT: float = 0.25
+    MAP_UPDATE_INTERVAL_SECONDS: float = 10
+    # "full" fits UMAP on every vector; "landmark" PCA-reduces them, fits UMAP on
+    # MAP_LANDMARKS stratified samples and interpolates the rest; "auto" switches
+    # to landmark above MAP_LANDMARK_THRESHOLD images.
+    MAP_PROJECTION: str = "auto"
+    MAP_LANDMARK_THRESHOLD: int = 50000
+    MAP_LANDMARKS: int = 20000
+    MAP_PCA_DIM: int = 64
+    MAP_QUALITY_SAMPLE: int = 2000  # 0 skips the quality report
+    # Map hover previews come from per-tile thumbnail sprite sheets.
+    MAP_ATLAS_TILES: int = 8  # tiles per side
+    MAP_SPRITE_SIZE: int = 64
+
     @property
     def UPLOAD_PATH(self) -> Path:
         path = BASE_DIR / self.UPLOAD_FOLDER
@@ -33,6 +33,11 @@ except Exception as e:
 class Base(DeclarativeBase):
     pass
 
+def _create_missing_indexes(connection):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
 async def init_db():
     """Initialize the database and create tables."""
     async with engine.begin() as conn:
@@ -40,6 +45,11 @@ async def init_db():
         # In production, use Alembic for migrations instead of dropping tables
         # await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
+        # create_all only indexes tables it creates; add indexes new since then to existing ones.
+        await conn.run_sync(_create_missing_indexes)
+        # Imported here: the feature models import Base from this module.
+        from ..features.images import full_text
+        await conn.run_sync(full_text.create_index)
     logger.info("Database tables created.")
 
 
@@ -1,9 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import RedirectResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
+from collections import Counter
 
 from aetherium_gallery.core.database import get_db
+from aetherium_gallery.features.images import service as image_service
 from . import service, schemas
 
 router = APIRouter(
@@ -21,6 +24,71 @@ async def read_albums_api(db: AsyncSession = Depends(get_db)):
 async def create_album_api(album: schemas.AlbumCreate, db: AsyncSession = Depends(get_db)):
     return await service.create_album(db, album)
 
+def _suggested_name(cluster_id: int, tag_counts: Counter) -> str:
+    top = [name for name, _ in tag_counts.most_common(2)]
+    return " & ".join(name.title() for name in top) if top else f"Visual Group {cluster_id}"
+
+def _image_clusters(request: Request):
+    image_clusters = getattr(request.app.state, "image_clusters", None)
+    if image_clusters is None:
+        raise HTTPException(status_code=503, detail="Image clustering is not available.")
+    return image_clusters
+
+async def _named_suggestions(db: AsyncSession, clusters: List[dict]) -> List[schemas.SuggestedAlbum]:
+    """Names come from the most common tags of each cluster's most typical images."""
+    central = {c["cluster_id"]: c["image_ids"][:50] for c in clusters}
+    cluster_of = {image_id: cluster_id for cluster_id, ids in central.items() for image_id in ids}
+    tag_counts = {cluster_id: Counter() for cluster_id in central}
+    for image_id, tag_name in await image_service.get_image_tag_names(db, image_ids=list(cluster_of)):
+        tag_counts[cluster_of[image_id]][tag_name] += 1
+    return [
+        schemas.SuggestedAlbum(
+            cluster_id=c["cluster_id"], name=_suggested_name(c["cluster_id"], tag_counts[c["cluster_id"]]),
+            size=c["size"], cohesion=c["cohesion"], cover_image_ids=c["image_ids"][:4],
+        )
+        for c in clusters
+    ]
+
+@router.get("/suggestions", response_model=List[schemas.SuggestedAlbum])
+async def read_album_suggestions_api(
+    request: Request, min_size: int = 5, limit: int = 20, db: AsyncSession = Depends(get_db)
+):
+    """
+    Suggested albums: visual clusters with at least `min_size` images that are
+    not in an album yet, largest first.
+    """
+    image_clusters = _image_clusters(request)
+    unsorted_ids = await image_service.get_unsorted_image_ids(db)
+    clusters = image_clusters.suggestions(unsorted_ids, min_size=max(1, min_size), limit=min(max(1, limit), 100))
+    return await _named_suggestions(db, clusters)
+
+@router.post("/suggestions/accept", response_model=List[schemas.AcceptedAlbum])
+async def accept_album_suggestions_api(
+    request: Request, acceptance: schemas.AcceptSuggestionsRequest, db: AsyncSession = Depends(get_db)
+):
+    """
+    Creates an album for each accepted cluster and moves the cluster's
+    unsorted images into it, all in one transaction.
+    """
+    image_clusters = _image_clusters(request)
+    accepted_ids = [a.cluster_id for a in acceptance.suggestions]
+    if len(set(accepted_ids)) != len(accepted_ids):
+        raise HTTPException(status_code=400, detail="Each cluster can be accepted only once.")
+    unsorted_ids = await image_service.get_unsorted_image_ids(db)
+    clusters = {c["cluster_id"]: c for c in image_clusters.suggestions(unsorted_ids, min_size=1, limit=len(image_clusters.ids))}
+    missing = [cluster_id for cluster_id in accepted_ids if cluster_id not in clusters]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Clusters {missing} have no unsorted images.")
+    unnamed = [clusters[a.cluster_id] for a in acceptance.suggestions if not a.name]
+    suggested_names = {s.cluster_id: s.name for s in await _named_suggestions(db, unnamed)}
+
+    groups = [(a.name or suggested_names[a.cluster_id], clusters[a.cluster_id]["image_ids"]) for a in acceptance.suggestions]
+    created = await service.create_albums_from_groups(db, groups)
+    return [
+        schemas.AcceptedAlbum(cluster_id=a.cluster_id, album=schemas.AlbumInfo.model_validate(album), image_count=count)
+        for a, (album, count) in zip(acceptance.suggestions, created)
+    ]
+
 @router.get("/{album_id}")
 async def read_album_api(album_id: int, db: AsyncSession = Depends(get_db)):
     result = await service.get_album(db, album_id)
@@ -29,8 +97,12 @@ async def read_album_api(album_id: int, db: AsyncSession = Depends(get_db)):
     return result
 
 @router.delete("/{album_id}", status_code=204)
-async def delete_album_api(album_id: int, db: AsyncSession = Depends(get_db)):
+async def delete_album_api(album_id: int, request: Request, db: AsyncSession = Depends(get_db)):
     deleted = await service.delete_album(db, album_id)
     if not deleted:
         raise HTTPException(status_code=404, detail="Album not found")
+    # Album images are removed with the album (delete-orphan cascade), so drop their vectors too.
+    vector_service = getattr(request.app.state, "vector_service", None)
+    if vector_service:
+        await run_in_threadpool(vector_service.remove_images, [image.id for image in deleted.images])
     return None
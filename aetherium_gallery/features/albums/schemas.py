@@ -35,6 +35,26 @@ class Album(AlbumBase):
 class AlbumReorderRequest(BaseModel):
     image_ids: List[int]
 
+class SuggestedAlbum(BaseModel):
+    cluster_id: int
+    name: str
+    size: int
+    cohesion: float
+    cover_image_ids: List[int]
+
+class SuggestionAcceptance(BaseModel):
+    cluster_id: int
+    # Defaults to the suggested name.
+    name: Optional[str] = Field(None, min_length=1, max_length=100)
+
+class AcceptSuggestionsRequest(BaseModel):
+    suggestions: List[SuggestionAcceptance]
+
+class AcceptedAlbum(BaseModel):
+    cluster_id: int
+    album: AlbumInfo
+    image_count: int
+
 # 1. Runtime import for the Image model
 from aetherium_gallery.features.images.schemas import Image
 from aetherium_gallery.features.tags.schemas import Tag
@@ -1,6 +1,6 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import selectinload, noload
 from sqlalchemy import func, case, update
 from typing import List, Optional, Dict
 import logging
@@ -22,6 +22,12 @@ async def get_album(db: AsyncSession, album_id: int) -> Optional[dict]:
     images = images_result.scalars().all()
     return {"album": album, "images": images}
 
+async def get_image_ids_for_album(db: AsyncSession, album_id: int) -> List[int]:
+    result = await db.execute(
+        select(Image.id).filter(Image.album_id == album_id).order_by(Image.order_index, Image.id)
+    )
+    return list(result.scalars().all())
+
 async def get_all_albums(db: AsyncSession) -> List:
     image_count_subquery = (
         select(Image.album_id, func.count(Image.id).label("image_count"))
@@ -50,3 +56,37 @@ async def delete_album(db: AsyncSession, album_id: int) -> Optional[models.Album
         await db.commit()
         return db_album
     return None
+
+async def create_albums_from_groups(db: AsyncSession, groups: List[tuple]) -> List[tuple]:
+    """
+    Creates one album per (name, image_ids) group in a single transaction and
+    moves the group's images into it; images already in an album are left
+    where they are. Names that are taken get a numeric suffix.
+    Returns (album, image_count) pairs.
+    """
+    taken = set((await db.execute(select(models.Album.name))).scalars().all())
+    created = []
+    for name, image_ids in groups:
+        unique_name, n = name, 2
+        while unique_name in taken:
+            unique_name, n = f"{name} ({n})", n + 1
+        taken.add(unique_name)
+        db_album = models.Album(name=unique_name)
+        db.add(db_album)
+        await db.flush()
+        images = []
+        for start in range(0, len(image_ids), 5000):
+            result = await db.execute(
+                select(Image)
+                .filter(Image.id.in_(image_ids[start:start + 5000]), Image.album_id.is_(None))
+                .options(noload("*"))  # only album_id and order_index change
+            )
+            images += result.scalars().all()
+        # Keep the suggested order (most typical first) as the album order.
+        position = {image_id: i for i, image_id in enumerate(image_ids)}
+        for image in images:
+            image.album_id = db_album.id
+            image.order_index = position[image.id]
+        created.append((db_album, len(images)))
+    await db.commit()
+    return created
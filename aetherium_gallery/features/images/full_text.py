@@ -0,0 +1,121 @@
+# aetherium_gallery/features/images/full_text.py
+
+import logging
+import re
+
+from markupsafe import Markup, escape
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Searched columns and their bm25() weights: prompt matches count most, negative prompt matches least.
+COLUMNS = ("prompt", "negative_prompt", "original_filename")
+WEIGHTS = (10.0, 2.0, 5.0)
+
+# PostgreSQL searches the same columns as one weighted tsvector (A > B > C),
+# matching the GIN expression index created by create_index().
+POSTGRES_DOCUMENT = (
+    "setweight(to_tsvector('simple', coalesce(prompt, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(original_filename, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(negative_prompt, '')), 'C')"
+)
+
+# Set by create_index() once the SQLite FTS5 table is in place.
+fts5_enabled = False
+
+# Snippet() wraps matches in these control characters; highlight() escapes
+# the text first and only then turns them into <mark> tags.
+MARK_START, MARK_END = "\x02", "\x03"
+
+# An external-content FTS5 table over images(id): it stores only the index,
+# and the triggers keep it in step with every insert, update and delete,
+# including bulk SQL statements that bypass the ORM.
+SQLITE_DDL = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS images_fts USING fts5(
+        prompt, negative_prompt, original_filename,
+        content='images', content_rowid='id',
+        tokenize="unicode61 remove_diacritics 2 tokenchars '_'"
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS images_fts_insert AFTER INSERT ON images BEGIN
+        INSERT INTO images_fts(rowid, prompt, negative_prompt, original_filename)
+        VALUES (new.id, new.prompt, new.negative_prompt, new.original_filename);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS images_fts_delete AFTER DELETE ON images BEGIN
+        INSERT INTO images_fts(images_fts, rowid, prompt, negative_prompt, original_filename)
+        VALUES ('delete', old.id, old.prompt, old.negative_prompt, old.original_filename);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS images_fts_update AFTER UPDATE OF prompt, negative_prompt, original_filename ON images BEGIN
+        INSERT INTO images_fts(images_fts, rowid, prompt, negative_prompt, original_filename)
+        VALUES ('delete', old.id, old.prompt, old.negative_prompt, old.original_filename);
+        INSERT INTO images_fts(rowid, prompt, negative_prompt, original_filename)
+        VALUES (new.id, new.prompt, new.negative_prompt, new.original_filename);
+    END
+    """,
+)
+
+def create_index(connection) -> bool:
+    """
+    Creates the full-text index if missing: on SQLite the FTS5 table and its
+    triggers (backfilled from `images` when the table is new), on PostgreSQL
+    a GIN index over POSTGRES_DOCUMENT. Returns False when there is none, i.e.
+    another database or an SQLite build without FTS5; search then uses LIKE.
+    """
+    global fts5_enabled
+    if connection.dialect.name == "postgresql":
+        connection.execute(text(f"CREATE INDEX IF NOT EXISTS ix_images_full_text ON images USING gin (({POSTGRES_DOCUMENT}))"))
+        return True
+    if connection.dialect.name != "sqlite":
+        return False
+    exists = connection.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'images_fts'")).first()
+    try:
+        for statement in SQLITE_DDL:
+            connection.execute(text(statement))
+    except Exception as e:
+        logger.warning(f"Full-text search index unavailable, falling back to LIKE search: {e}")
+        return False
+    if not exists:
+        connection.execute(text("INSERT INTO images_fts(images_fts) VALUES ('rebuild')"))
+        logger.info("Built the full-text search index from existing images.")
+    fts5_enabled = True
+    return True
+
+def query_terms(query: str) -> list[str]:
+    """The words of a user query, lowercased; punctuation and FTS operators are dropped."""
+    return [term.lower() for term in re.findall(r"\w+", query or "")]
+
+def match_query(terms: list[str]) -> str:
+    """An FTS5 MATCH expression requiring every term, each as a quoted prefix ("sunset"* "beach"*)."""
+    return " ".join(f'"{term}"*' for term in terms)
+
+def tsquery(terms: list[str]) -> str:
+    """The PostgreSQL to_tsquery() equivalent of match_query() (sunset:* & beach:*)."""
+    return " & ".join(f"{term}:*" for term in terms)
+
+def highlight(snippet: str | None) -> Markup | None:
+    """Escapes a marked-up snippet and wraps its matches in <mark>."""
+    if not snippet:
+        return None
+    return Markup(str(escape(snippet)).replace(MARK_START, Markup("<mark>")).replace(MARK_END, Markup("</mark>")))
+
+def like_snippet(values, terms: list[str], width: int = 80) -> str | None:
+    """
+    A snippet for the non-FTS search paths: text around the first match in the
+    first matching column, with every term marked like FTS5's snippet().
+    """
+    pattern = re.compile("|".join(re.escape(term) for term in terms), re.IGNORECASE) if terms else None
+    for value in values:
+        match = pattern.search(value) if pattern and value else None
+        if not match:
+            continue
+        start = max(match.start() - width // 2, 0)
+        end = min(start + width, len(value))
+        excerpt = pattern.sub(lambda m: f"{MARK_START}{m.group(0)}{MARK_END}", value[start:end])
+        return ("…" if start else "") + excerpt + ("…" if end < len(value) else "")
+    return None
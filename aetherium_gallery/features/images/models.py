@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Float, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Text, Float, Boolean, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from aetherium_gallery.core.database import Base
@@ -6,8 +6,17 @@ from aetherium_gallery.features.tags.models import image_tags_association
 
 class Image(Base):
     __tablename__ = "images"
+    # Composite indexes shaped like the hot queries (checked by scripts/check_query_plans.py):
+    # newest-first keyset pages, unfiltered or by safe mode / media type, and album views in order.
+    __table_args__ = (
+        Index("ix_images_upload_date_id", "upload_date", "id"),
+        Index("ix_images_is_nsfw_upload_date", "is_nsfw", "upload_date", "id"),
+        Index("ix_images_video_source_id_upload_date", "video_source_id", "upload_date", "id"),
+        Index("ix_images_album_id_order_index", "album_id", "order_index", "id"),
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    # No separate index: the integer primary key is SQLite's rowid.
+    id = Column(Integer, primary_key=True)
     filename = Column(String, unique=True, index=True, nullable=False)
     original_filename = Column(String, nullable=True)
     filepath = Column(String, nullable=False)
@@ -36,21 +45,21 @@ class Image(Base):
     user_rating = Column(Integer, nullable=True)
     notes = Column(Text, nullable=True)
     is_favorite = Column(Integer, default=0)
-    is_nsfw = Column(Boolean, default=False, nullable=False, index=True)
+    is_nsfw = Column(Boolean, default=False, nullable=False)
     # Used for custom sorting within an album
     order_index = Column(Integer, default=0, nullable=False)
 
     # --- RELATIONSHIPS ---
 
     # Many-to-One relationship to Album
-    album_id = Column(Integer, ForeignKey("albums.id"), nullable=True, index=True)
+    album_id = Column(Integer, ForeignKey("albums.id"), nullable=True)
     album = relationship("Album", back_populates="images", lazy="selectin")
     
     # Many-to-Many relationship to Tags
     tags = relationship("Tag", secondary=image_tags_association, back_populates="images", lazy="selectin")
     
     # One-to-One relationship to VideoSource
-    video_source_id = Column(Integer, ForeignKey("video_sources.id"), nullable=True, index=True)
+    video_source_id = Column(Integer, ForeignKey("video_sources.id"), nullable=True)
     video_source = relationship("VideoSource", back_populates="image_entry", lazy="selectin")
 
     def __repr__(self):
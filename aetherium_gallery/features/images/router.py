@@ -5,14 +5,17 @@ import logging
 import asyncio
 from typing import List, Optional
 from pathlib import Path
+import numpy as np
 from PIL import Image as PILImage
-from fastapi import APIRouter, Depends, File, UploadFile, HTTPException, Form, Request
+from fastapi import APIRouter, Depends, File, UploadFile, HTTPException, Form, Request, Response, Query
 from fastapi.responses import RedirectResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from aetherium_gallery.core.database import get_db
 from aetherium_gallery.core.config import settings
 from aetherium_gallery import utils
+from aetherium_gallery.features.albums import service as album_service
 from . import service, models, schemas
 
 logger = logging.getLogger(__name__)
@@ -42,6 +45,15 @@ async def handle_single_upload_api(
     if not (content_type and (content_type.startswith("image/") or content_type.startswith("video/"))):
         raise HTTPException(status_code=400, detail="Unsupported file type.")
 
+    # Refuse up front, before anything is written, while the indexing backlog is full.
+    indexing_queue = getattr(request.app.state, "indexing_queue", None)
+    if indexing_queue and content_type.startswith("image/") and indexing_queue.is_full():
+        raise HTTPException(
+            status_code=429,
+            detail="The indexing queue is full. Please retry shortly.",
+            headers={"Retry-After": str(indexing_queue.retry_after_seconds())},
+        )
+
     logger.info(f"Processing '{original_filename}'...")
 
     form_data = {
@@ -100,10 +112,12 @@ async def handle_single_upload_api(
         
         new_image_record = await service.create_image(db, image_data=final_image_data)
         
-        vector_service = getattr(request.app.state, "vector_service", None)
-        if vector_service and not content_type.startswith("video/") and saved_path.exists():
-             logger.info(f"Indexing new image (ID: {new_image_record.id}) for visual search...")
-             vector_service.add_image(image_id=new_image_record.id, image_path=saved_path)
+        if indexing_queue and not content_type.startswith("video/") and saved_path.exists():
+            # Embedding happens in the background; poll /api/images/{id}/index-status for progress.
+            if indexing_queue.submit(new_image_record.id, saved_path):
+                logger.info(f"Queued new image (ID: {new_image_record.id}) for visual search indexing.")
+            else:
+                logger.warning(f"Indexing queue filled up; image {new_image_record.id} was not queued and is marked failed until a reindex.")
         
         logger.info(f"Successfully processed and created entry for: {original_filename}")
 
@@ -118,10 +132,137 @@ async def handle_single_upload_api(
     return new_image_record
 
 @router.get("/", response_model=List[schemas.Image])
-async def read_images_api(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
-    images = await service.get_images(db, skip=skip, limit=limit)
+async def read_images_api(
+    response: Response, cursor: Optional[str] = None, limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Newest images first, one keyset page at a time: pass the X-Next-Cursor
+    header of a response as `cursor` to get the next page (no header: last page).
+    """
+    try:
+        images, next_cursor = await service.get_images(db, cursor=cursor, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return images
 
+# Upper bound on queries per batch call, so one request cannot monopolize the index lock.
+MAX_BATCH_QUERIES = 1000
+
+@router.post("/similar/batch", response_model=List[schemas.SimilarityResult])
+async def find_similar_batch_api(
+    request: Request,
+    batch: schemas.BatchSimilarityRequest,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Visual similarity for many images or vectors in one call, answered by a
+    single matrix search over the index. In "centroid" / "blend" mode the
+    queries are combined into one vector first.
+    """
+    vector_service = getattr(request.app.state, "vector_service", None)
+    if vector_service is None:
+        raise HTTPException(status_code=503, detail="Visual search service is not available.")
+
+    queries = list(batch.queries)
+    if batch.album_id is not None:
+        album_image_ids = await album_service.get_image_ids_for_album(db, album_id=batch.album_id)
+        queries += [schemas.SimilarityQuery(image_id=image_id, exclude_ids=album_image_ids) for image_id in album_image_ids]
+    if not queries:
+        raise HTTPException(status_code=400, detail="No queries given.")
+    if len(queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_QUERIES} queries per call.")
+
+    # 1. Resolve every query to a vector: stored vectors for image ids, given vectors as-is
+    found_ids, found_vectors = vector_service.get_vectors([q.image_id for q in queries if q.vector is None and q.image_id is not None])
+    stored = dict(zip(found_ids, found_vectors))
+    results, vectors, resolved = [], [], []
+    for i, q in enumerate(queries):
+        result = schemas.SimilarityResult(query_index=i, image_id=q.image_id)
+        if q.vector is not None:
+            if len(q.vector) != vector_service.embedding_dim:
+                result.error = f"Vector must have {vector_service.embedding_dim} dimensions."
+            else:
+                vectors.append(np.asarray(q.vector, dtype="float32"))
+                resolved.append(i)
+        elif q.image_id is None:
+            result.error = "Each query needs an image_id or a vector."
+        elif q.image_id not in stored:
+            result.error = "Image is not indexed."
+        else:
+            vectors.append(stored[q.image_id])
+            resolved.append(i)
+        results.append(result)
+    if not vectors:
+        return results
+
+    matrix = np.vstack(vectors)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+    id_filter = None
+    attribute_index = getattr(request.app.state, "attribute_index", None)
+    if attribute_index is not None:
+        id_filter = attribute_index.filter(safe_mode=batch.safe_mode, media_type=batch.media_type, album_id=batch.in_album_id)
+    elif batch.safe_mode or batch.media_type != "all" or batch.in_album_id is not None:
+        raise HTTPException(status_code=503, detail="Search filters are not available.")
+
+    def exclusions(q):
+        excluded = set(q.exclude_ids)
+        if batch.exclude_query_images and q.image_id is not None:
+            excluded.add(q.image_id)
+        return excluded
+
+    # 2. Combine into one query for centroid / blend, then search
+    if batch.mode != "each":
+        weights = np.array([queries[i].weight if batch.mode == "blend" else 1.0 for i in resolved], dtype="float32")
+        combined = weights @ matrix
+        combined /= max(float(np.linalg.norm(combined)), 1e-12)
+        excluded = set().union(*(exclusions(queries[i]) for i in resolved))
+        matches = await run_in_threadpool(
+            vector_service.find_similar_batch, combined[None, :], [excluded], batch.n_results, batch.threshold, id_filter
+        )
+        combined_result = schemas.SimilarityResult(matches=[schemas.SimilarityMatch(image_id=i, score=s) for i, s in matches[0]])
+        return [combined_result] + [r for r in results if r.error]
+
+    matches = await run_in_threadpool(
+        vector_service.find_similar_batch,
+        matrix,
+        [exclusions(queries[i]) for i in resolved],
+        [queries[i].n_results or batch.n_results for i in resolved],
+        [batch.threshold if queries[i].threshold is None else queries[i].threshold for i in resolved],
+        id_filter,
+    )
+    for i, row in zip(resolved, matches):
+        results[i].matches = [schemas.SimilarityMatch(image_id=image_id, score=score) for image_id, score in row]
+    return results
+
+@router.get("/indexing-queue", status_code=200)
+async def get_indexing_queue_stats_api(request: Request):
+    indexing_queue = getattr(request.app.state, "indexing_queue", None)
+    if indexing_queue is None:
+        raise HTTPException(status_code=503, detail="Indexing queue is not available.")
+    return indexing_queue.get_stats()
+
+@router.get("/{image_id}/index-status", status_code=200)
+async def get_image_index_status_api(image_id: int, request: Request):
+    """
+    Reports whether an image's vector is queued, being computed, indexed or
+    failed. Falls back to the index itself for images uploaded before this
+    process started, and for failed ones a reindex may have added since.
+    """
+    indexing_queue = getattr(request.app.state, "indexing_queue", None)
+    vector_service = getattr(request.app.state, "vector_service", None)
+
+    status = indexing_queue.status(image_id) if indexing_queue else None
+    if status is None or status["status"] == "failed":
+        indexed = vector_service is not None and vector_service.get_vector(image_id) is not None
+        if status is None or indexed:
+            status = {"status": "indexed" if indexed else "not_indexed", "error": None, "updated_at": None}
+    queue_depth = indexing_queue.get_stats()["queue_depth"] if indexing_queue else 0
+    return {"image_id": image_id, **status, "queue_depth": queue_depth}
+
 @router.get("/{image_id}", response_model=schemas.Image)
 async def read_image_api(image_id: int, db: AsyncSession = Depends(get_db)):
     db_image = await service.get_image(db, image_id=image_id)
@@ -131,11 +272,15 @@ async def read_image_api(image_id: int, db: AsyncSession = Depends(get_db)):
 
 @router.post("/bulk-update", status_code=200)
 async def bulk_update_images_api(
+    request: Request,
     action_request: schemas.BulkActionRequest,
     db: AsyncSession = Depends(get_db)
 ):
     try:
         affected_count = await service.bulk_update_images(db, action_request)
+        vector_service = getattr(request.app.state, "vector_service", None)
+        if vector_service and action_request.action == "delete":
+            await run_in_threadpool(vector_service.remove_images, action_request.image_ids)
         return {
             "message": f"Action '{action_request.action}' performed successfully.",
             "images_affected": affected_count
@@ -171,5 +316,9 @@ async def delete_image_api(image_id: int, request: Request, db: AsyncSession = D
     if deleted_record is None:
             raise HTTPException(status_code=404, detail="Image found initially but failed to delete from DB")
 
+    vector_service = getattr(request.app.state, "vector_service", None)
+    if vector_service:
+        await run_in_threadpool(vector_service.remove_images, [image_id])
+
     gallery_url = request.url_for('gallery_index')
     return RedirectResponse(url=gallery_url, status_code=303)
@@ -1,7 +1,7 @@
 # schemas.py - Pydantic models for image-related data structures
 from __future__ import annotations
 from pydantic import BaseModel, Field
-from typing import Optional, List,Any, TYPE_CHECKING
+from typing import Optional, List,Any, Literal, TYPE_CHECKING
 from datetime import datetime
 
 if TYPE_CHECKING:
@@ -67,6 +67,40 @@ class Image(ImageBase):
     class Config:
         from_attributes = True
 
+class SimilarityQuery(BaseModel):
+    # Exactly one of image_id (an indexed image) or vector (a raw embedding).
+    image_id: Optional[int] = None
+    vector: Optional[List[float]] = None
+    exclude_ids: List[int] = []
+    n_results: Optional[int] = Field(None, ge=1, le=500)
+    threshold: Optional[float] = None
+    weight: float = 1.0  # only used by mode="blend"
+
+class BatchSimilarityRequest(BaseModel):
+    queries: List[SimilarityQuery] = []
+    # Adds one query per image in this album (excluding the album's own images).
+    album_id: Optional[int] = None
+    # "each": one result list per query; "centroid": the mean of all queries;
+    # "blend": their weighted sum. The last two return a single result list.
+    mode: Literal["each", "centroid", "blend"] = "each"
+    n_results: int = Field(24, ge=1, le=500)
+    threshold: float = 0.5
+    exclude_query_images: bool = True
+    # Result filters, applied inside the index search.
+    safe_mode: bool = False
+    media_type: Literal["all", "image", "video"] = "all"
+    in_album_id: Optional[int] = None
+
+class SimilarityMatch(BaseModel):
+    image_id: int
+    score: float
+
+class SimilarityResult(BaseModel):
+    query_index: Optional[int] = None  # None for centroid / blend results
+    image_id: Optional[int] = None
+    error: Optional[str] = None
+    matches: List[SimilarityMatch] = []
+
 class BulkActionRequest(BaseModel):
     image_ids: List[int]
     action: str 
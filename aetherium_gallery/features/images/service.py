@@ -1,11 +1,15 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
-from sqlalchemy import or_, func, case, update
-from typing import List, Optional, Dict
+from sqlalchemy import or_, and_, func, case, update, table, column, literal_column, tuple_, type_coerce, String
+from typing import List, Optional, Dict, NamedTuple
+from markupsafe import Markup
+import base64
+import datetime
+import json
 import logging
 
-from . import models, schemas
+from . import models, schemas, full_text
 from aetherium_gallery.features.tags.models import Tag, image_tags_association
 from aetherium_gallery.features.albums.models import Album
 from aetherium_gallery.utils import (
@@ -28,28 +32,152 @@ async def get_image(db: AsyncSession, image_id: int) -> Optional[models.Image]:
     return result.scalars().first()
 
 
+async def get_images_by_ids(db: AsyncSession, image_ids: List[int]) -> List[models.Image]:
+    if not image_ids:
+        return []
+    result = await db.execute(
+        select(models.Image)
+        .options(
+            selectinload(models.Image.tags),
+            selectinload(models.Image.album),
+            selectinload(models.Image.video_source),
+        )
+        .filter(models.Image.id.in_(image_ids))
+    )
+    return result.scalars().all()
+
+
+class ImagePage(NamedTuple):
+    images: List[models.Image]
+    next_cursor: Optional[str]  # None on the last page
+
+
+def encode_cursor(sort_value, image_id: int) -> str:
+    """An opaque page cursor for the row after which the next page starts."""
+    if isinstance(sort_value, datetime.datetime):
+        sort_value = sort_value.isoformat()
+    payload = json.dumps([sort_value, image_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """(sort_value, image_id) from encode_cursor(); raises ValueError for anything else."""
+    try:
+        sort_value, image_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(image_id, int) or not isinstance(sort_value, (str, int, float)):
+            raise ValueError
+    except Exception:
+        raise ValueError("Invalid page cursor.")
+    return sort_value, image_id
+
+
+def _upload_date_key(db: AsyncSession):
+    """
+    upload_date as the database sorts it. SQLite keeps it as text, and the
+    server default has no microseconds while ORM-set values do, so there the
+    cursor compares the stored text rather than a re-rendered datetime.
+    """
+    if db.get_bind().dialect.name == "sqlite":
+        return type_coerce(models.Image.upload_date, String)
+    return models.Image.upload_date
+
+
+async def _keyset_page(
+    db: AsyncSession, query, sort_key, cursor: Optional[str], limit: int, ascending: bool = False
+) -> tuple:
+    """
+    Runs `query` (selecting images or ids first) ordered by (sort_key, id desc)
+    and starting after `cursor`, so every page costs the same however deep it
+    is, and rows added meanwhile are neither skipped nor repeated. Returns the
+    page's rows (sort key dropped) and the next cursor.
+    """
+    if cursor:
+        value, after_id = decode_cursor(cursor)
+        if isinstance(value, str) and not isinstance(sort_key.type, String):
+            value = datetime.datetime.fromisoformat(value)
+        if ascending:
+            query = query.where(or_(sort_key > value, and_(sort_key == value, models.Image.id < after_id)))
+        else:
+            query = query.where(tuple_(sort_key, models.Image.id) < tuple_(value, after_id))
+    query = query.add_columns(sort_key.label("page_key")).order_by(
+        sort_key.asc() if ascending else sort_key.desc(), models.Image.id.desc()
+    ).limit(limit + 1)
+    rows = (await db.execute(query)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last[-1], last[0] if isinstance(last[0], int) else last[0].id)
+    return [row[:-1] for row in rows], next_cursor
+
+
+def _filter_media(query, safe_mode: bool, media_type: str):
+    if safe_mode:
+        query = query.filter(models.Image.is_nsfw == False)
+    if media_type == "video":
+        query = query.filter(models.Image.video_source_id.isnot(None))
+    elif media_type == "image":
+        query = query.filter(models.Image.video_source_id.is_(None))
+    return query
+
+
 async def get_images(
     db: AsyncSession,
-    skip: int = 0,
+    cursor: Optional[str] = None,
     limit: int = 100,
     safe_mode: bool = False,
     media_type: str = "all",
-) -> List[models.Image]:
+) -> ImagePage:
+    """Newest images first, one keyset page after `cursor` (None: the first page)."""
     # ADDED: selectinload(models.Image.album)
     query = select(models.Image).options(
         selectinload(models.Image.tags),
         selectinload(models.Image.video_source),
         selectinload(models.Image.album),
     )
-    if safe_mode:
-        query = query.filter(models.Image.is_nsfw == False)
-    if media_type == "video":
-        query = query.filter(models.Image.video_source_id.isnot(None))
-    elif media_type == "image":
-        query = query.filter(models.Image.video_source_id.is_(None))
-    query = query.order_by(models.Image.upload_date.desc()).offset(skip).limit(limit)
-    result = await db.execute(query)
-    return result.scalars().all()
+    query = _filter_media(query, safe_mode, media_type)
+    rows, next_cursor = await _keyset_page(db, query, _upload_date_key(db), cursor, limit)
+    return ImagePage([row[0] for row in rows], next_cursor)
+
+
+async def get_images_by_tag(
+    db: AsyncSession,
+    tag_name: str,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    safe_mode: bool = False,
+    media_type: str = "all",
+) -> ImagePage:
+    """Newest images with the given tag first, one keyset page after `cursor`."""
+    # The join is driven from ix_image_tags_tag_id_image_id, so SQLite sorts
+    # only this tag's images by upload_date (a temp B-tree), never the gallery.
+    query = (
+        select(models.Image)
+        .join(image_tags_association, image_tags_association.c.image_id == models.Image.id)
+        .join(Tag, Tag.id == image_tags_association.c.tag_id)
+        .where(Tag.name == tag_name)
+        .options(
+            selectinload(models.Image.tags),
+            selectinload(models.Image.video_source),
+            selectinload(models.Image.album),
+        )
+    )
+    query = _filter_media(query, safe_mode, media_type)
+    rows, next_cursor = await _keyset_page(db, query, _upload_date_key(db), cursor, limit)
+    return ImagePage([row[0] for row in rows], next_cursor)
+
+
+async def count_images_by_tag(
+    db: AsyncSession, tag_name: str, safe_mode: bool = False, media_type: str = "all"
+) -> int:
+    query = (
+        select(func.count(models.Image.id))
+        .join(image_tags_association, image_tags_association.c.image_id == models.Image.id)
+        .join(Tag, Tag.id == image_tags_association.c.tag_id)
+        .where(Tag.name == tag_name)
+    )
+    result = await db.execute(_filter_media(query, safe_mode, media_type))
+    return result.scalar_one()
 
 
 async def create_image(db: AsyncSession, image_data: dict) -> models.Image:
@@ -119,34 +247,20 @@ async def update_image_order_in_album(
     return True
 
 
-async def get_related_images(
-    db: AsyncSession, source_image: models.Image, limit: int = 10
-) -> List[models.Image]:
-    if not source_image.tags:
-        return []
-    source_tag_ids = {tag.id for tag in source_image.tags}
-    subquery = (
-        select(
-            image_tags_association.c.image_id,
-            func.count(image_tags_association.c.tag_id).label("match_count"),
-        )
-        .where(image_tags_association.c.tag_id.in_(source_tag_ids))
-        .group_by(image_tags_association.c.image_id)
-        .order_by(func.count(image_tags_association.c.tag_id).desc())
-        .subquery()
-    )
-    query = (
-        select(models.Image)
-        .join(subquery, models.Image.id == subquery.c.image_id)
-        .filter(models.Image.id != source_image.id)
-        .options(
-            selectinload(models.Image.tags), selectinload(models.Image.video_source)
-        )
-        .order_by(subquery.c.match_count.desc())
-        .limit(limit)
-    )
+async def get_image_tag_pairs(db: AsyncSession, image_ids: Optional[List[int]] = None) -> List[tuple]:
+    """(image_id, tag_id) rows of the image-tag association, optionally only for `image_ids`."""
+    query = select(image_tags_association.c.image_id, image_tags_association.c.tag_id)
+    if image_ids is not None:
+        query = query.where(image_tags_association.c.image_id.in_(image_ids))
     result = await db.execute(query)
-    return result.scalars().all()
+    return result.all()
+
+
+class SearchResults(NamedTuple):
+    images: List[models.Image]
+    total: int
+    next_cursor: Optional[str]  # None on the last page
+    snippets: Dict[int, Markup]  # image id -> highlighted excerpt of the matching text
 
 
 async def search_images(
@@ -154,36 +268,77 @@ async def search_images(
     query: str,
     safe_mode: bool = False,
     media_type: str = "all",
-    skip: int = 0,
+    cursor: Optional[str] = None,
     limit: int = 100,
-) -> List[models.Image]:
-    if not query:
-        return []
-    search_term = f"%{query}%"
-    db_query = select(models.Image).filter(
-        or_(
-            models.Image.prompt.ilike(search_term),
-            models.Image.negative_prompt.ilike(search_term),
-            models.Image.original_filename.ilike(search_term),
+) -> SearchResults:
+    """
+    Full-text search over prompt, negative prompt and filename: every word of
+    the query must match the start of a word. Results are ranked by relevance
+    (BM25 on SQLite FTS5, ts_rank on PostgreSQL) and paginated by keyset
+    cursors on (rank, id); other databases, or SQLite without FTS5, fall back
+    to LIKE, newest first, paged on (upload_date, id).
+    """
+    terms = full_text.query_terms(query)
+    if not terms:
+        return SearchResults([], 0, None, {})
+    dialect = db.get_bind().dialect.name
+
+    # 1. Rank the matching ids (and get SQLite's snippets) in one indexed query
+    rank = snippet = None
+    if dialect == "sqlite" and full_text.fts5_enabled:
+        fts = table("images_fts", column("rowid"))
+        fts_table = literal_column("images_fts")
+        match = fts_table.op("MATCH")(full_text.match_query(terms))
+        rank = func.bm25(fts_table, *full_text.WEIGHTS)
+        snippet = func.snippet(fts_table, -1, full_text.MARK_START, full_text.MARK_END, "…", 16)
+        matched = select(models.Image.id).join(fts, fts.c.rowid == models.Image.id).where(match)
+    elif dialect == "postgresql":
+        document = literal_column(f"({full_text.POSTGRES_DOCUMENT})")
+        ts_query = func.to_tsquery("simple", full_text.tsquery(terms))
+        rank = -func.ts_rank(document, ts_query)
+        matched = select(models.Image.id).where(document.op("@@")(ts_query))
+    else:
+        matched = select(models.Image.id).where(*(
+            or_(
+                models.Image.prompt.ilike(f"%{term}%"),
+                models.Image.negative_prompt.ilike(f"%{term}%"),
+                models.Image.original_filename.ilike(f"%{term}%"),
+            )
+            for term in terms
+        ))
+    matched = _filter_media(matched, safe_mode, media_type)
+
+    total = (await db.execute(select(func.count()).select_from(matched.subquery()))).scalar_one()
+    page_query = matched.add_columns(snippet) if snippet is not None else matched
+    if rank is not None:
+        rows, next_cursor = await _keyset_page(db, page_query, rank, cursor, limit, ascending=True)
+    else:
+        rows, next_cursor = await _keyset_page(db, page_query, _upload_date_key(db), cursor, limit)
+    if not rows:
+        return SearchResults([], total, None, {})
+
+    # 2. Load the page's images, keeping the ranked order
+    ids = [row[0] for row in rows]
+    result = await db.execute(
+        select(models.Image)
+        .options(
+            selectinload(models.Image.tags),
+            selectinload(models.Image.video_source),
+            selectinload(models.Image.album),
         )
+        .filter(models.Image.id.in_(ids))
     )
-    # ADDED: selectinload(models.Image.album)
-    db_query = db_query.options(
-        selectinload(models.Image.tags),
-        selectinload(models.Image.video_source),
-        selectinload(models.Image.album),
-    )
-    if safe_mode:
-        db_query = db_query.filter(models.Image.is_nsfw == False)
-    if media_type == "video":
-        db_query = db_query.filter(models.Image.video_source_id.isnot(None))
-    elif media_type == "image":
-        db_query = db_query.filter(models.Image.video_source_id.is_(None))
-    db_query = (
-        db_query.order_by(models.Image.upload_date.desc()).offset(skip).limit(limit)
-    )
-    result = await db.execute(db_query)
-    return result.scalars().all()
+    by_id = {image.id: image for image in result.scalars().all()}
+    images = [by_id[image_id] for image_id in ids if image_id in by_id]
+    if snippet is not None:
+        marked = {row[0]: row[1] for row in rows}
+    else:
+        marked = {
+            image.id: full_text.like_snippet((image.prompt, image.original_filename, image.negative_prompt), terms)
+            for image in images
+        }
+    snippets = {image_id: full_text.highlight(text) for image_id, text in marked.items() if text}
+    return SearchResults(images, total, next_cursor, snippets)
 
 
 async def get_or_create_tags_by_name(
@@ -268,6 +423,104 @@ async def batch_update_image_coordinates(
         return 0
 
 
+async def get_indexable_images_after(
+    db: AsyncSession, after_id: int = 0, limit: int = 256
+) -> List[tuple]:
+    """
+    Keyset page of (id, filepath) for still images with id > after_id, in id
+    order. Only the two columns are loaded, so a full-gallery scan stays cheap.
+    """
+    query = (
+        select(models.Image.id, models.Image.filepath)
+        .filter(models.Image.id > after_id, models.Image.video_source_id.is_(None))
+        .order_by(models.Image.id)
+        .limit(limit)
+    )
+    result = await db.execute(query)
+    return result.all()
+
+
+async def count_indexable_images(db: AsyncSession, after_id: int = 0) -> int:
+    query = select(func.count(models.Image.id)).filter(
+        models.Image.id > after_id, models.Image.video_source_id.is_(None)
+    )
+    return (await db.execute(query)).scalar_one()
+
+
+async def get_unplotted_image_ids_after(
+    db: AsyncSession, after_id: int = 0, limit: int = 1000
+) -> List[int]:
+    """Keyset page of ids of still images with no map coordinates yet, in id order."""
+    query = (
+        select(models.Image.id)
+        .filter(
+            models.Image.id > after_id,
+            models.Image.map_x.is_(None),
+            models.Image.video_source_id.is_(None),
+        )
+        .order_by(models.Image.id)
+        .limit(limit)
+    )
+    result = await db.execute(query)
+    return result.scalars().all()
+
+
+async def get_map_points(db: AsyncSession) -> List[tuple]:
+    """(id, map_x, map_y) of every plotted image; only the three columns are loaded."""
+    query = select(models.Image.id, models.Image.map_x, models.Image.map_y).filter(
+        models.Image.map_x.isnot(None), models.Image.map_y.isnot(None)
+    )
+    result = await db.execute(query)
+    return result.all()
+
+
+async def get_filter_attributes(db: AsyncSession) -> List[tuple]:
+    """(id, is_nsfw, video_source_id, album_id) of every image, for the vector search filters."""
+    query = select(models.Image.id, models.Image.is_nsfw, models.Image.video_source_id, models.Image.album_id)
+    result = await db.execute(query)
+    return result.all()
+
+
+async def get_unsorted_image_ids(db: AsyncSession) -> List[int]:
+    """Ids of every image that is not in an album."""
+    result = await db.execute(select(models.Image.id).filter(models.Image.album_id.is_(None)))
+    return list(result.scalars().all())
+
+
+async def get_album_memberships(db: AsyncSession) -> List[tuple]:
+    """(id, album_id) of every image that is in an album."""
+    query = select(models.Image.id, models.Image.album_id).filter(models.Image.album_id.isnot(None))
+    result = await db.execute(query)
+    return result.all()
+
+
+async def get_image_tag_names(db: AsyncSession, image_ids: List[int]) -> List[tuple]:
+    """(image_id, tag name) rows for the given images."""
+    if not image_ids:
+        return []
+    query = (
+        select(image_tags_association.c.image_id, Tag.name)
+        .join(Tag, Tag.id == image_tags_association.c.tag_id)
+        .where(image_tags_association.c.image_id.in_(image_ids))
+    )
+    result = await db.execute(query)
+    return result.all()
+
+
+async def get_map_sprite_rows(db: AsyncSession) -> List[tuple]:
+    """(id, map_x, map_y, thumbnail_path, original_filename) of every plotted image, in id order."""
+    query = (
+        select(
+            models.Image.id, models.Image.map_x, models.Image.map_y,
+            models.Image.thumbnail_path, models.Image.original_filename,
+        )
+        .filter(models.Image.map_x.isnot(None), models.Image.map_y.isnot(None))
+        .order_by(models.Image.id)
+    )
+    result = await db.execute(query)
+    return result.all()
+
+
 async def get_all_plotted_images(db: AsyncSession) -> List[models.Image]:
     query = (
         select(models.Image)
@@ -1,12 +1,14 @@
-from sqlalchemy import Column, Integer, String, Table, ForeignKey
+from sqlalchemy import Column, Integer, String, Table, ForeignKey, Index
 from aetherium_gallery.core.database import Base
 
-# Association table for Many-to-Many relationship between Images and Tags
+# Association table for Many-to-Many relationship between Images and Tags.
+# The primary key serves image -> tags; the extra index serves tag -> images.
 image_tags_association = Table(
     'image_tags', 
     Base.metadata,
     Column('image_id', Integer, ForeignKey('images.id'), primary_key=True),
-    Column('tag_id', Integer, ForeignKey('tags.id'), primary_key=True)
+    Column('tag_id', Integer, ForeignKey('tags.id'), primary_key=True),
+    Index('ix_image_tags_tag_id_image_id', 'tag_id', 'image_id'),
 )
 
 class Tag(Base):
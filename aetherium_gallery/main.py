@@ -1,6 +1,7 @@
 # aetherium_gallery/main.py
 
 import os
+import asyncio
 import uvicorn
 import logging
 from contextlib import asynccontextmanager
@@ -8,12 +9,24 @@ from pathlib import Path
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
 
 # --- Import Order Matters ---
 from .core.config import settings, BASE_DIR
-from .core.database import init_db
-from .services.vector_service import VectorService
+from .core.database import init_db, AsyncSessionFactory
+from .services.vector_service import get_vector_service
+from .services.indexing_queue import IndexingQueue
+from .services.knn_graph import KnnGraph, maintain_forever as maintain_knn_graph
+from .services.constellation_map import ConstellationMap
+from .services.map_grid import MapGrid
+from .services.map_atlas import MapAtlas
+from .services.attribute_index import AttributeIndex
+from .services.related_images import RelatedImages
+from .services.image_clusters import ImageClusters
+from .services.album_centroids import AlbumCentroids
+from .services.cohesion_sweep import CohesionSweep
 from .features.images.router import router as images_api_router, upload_router as images_upload_router
+from .features.images import service as image_service
 from .features.albums.router import router as albums_api_router
 from .features.images.models import Image, VideoSource # Import models to register them
 from .features.albums.models import Album
@@ -45,20 +58,123 @@ async def lifespan(app: FastAPI):
     if CLEAR_INDEX_ON_STARTUP:
         logger.warning("Clearing old vector index files (DEV MODE)...")
         index_file = Path("./faiss_index.bin")
-        mapping_file = Path("./faiss_mapping.pkl")
-        if index_file.exists():
-            index_file.unlink()
-        if mapping_file.exists():
-            mapping_file.unlink()
+        mapping_file = Path("./faiss_ids.npy")
+        log_file = Path("./faiss_vectors.log")
+        raw_vectors_file = Path("./faiss_vectors.f32")
+        knn_graph_file = Path("./knn_graph.npz")
+        manifest_file = Path("./faiss_index.manifest.json")
+        # Checkpoint generations: faiss_index.000042.bin / faiss_ids.000042.npy
+        generations = [*Path(".").glob("faiss_index.*.bin"), *Path(".").glob("faiss_ids.*.npy")]
+        # Everything derived from the vectors goes too, or it would describe images the new index lacks.
+        derived = [
+            Path("./umap_model.pkl"), Path("./umap_model.json"), Path("./umap_fit_report.json"),
+            Path("./image_clusters.npz"), Path("./image_clusters.json"),
+            Path("./cohesion_report.npz"), Path("./cohesion_report.json"),
+        ]
+        for path in (index_file, mapping_file, manifest_file, log_file, raw_vectors_file, knn_graph_file, *generations, *derived):
+            if path.exists():
+                path.unlink()
+        logger.warning("Vector index cleared. Rebuild it with POST /api/tasks/reindex or `python -m aetherium_gallery.scripts.reindex`.")
 
     # --- Initialize Vector Service ---
+    # Only the (memory-mapped) index is opened here; the DINOv2 model loads in
+    # the background, so pages are served while torch is still warming up.
     try:
-        app.state.vector_service = VectorService()
-        logger.info("Vector Service initialized successfully.")
+        app.state.vector_service = await run_in_threadpool(get_vector_service)
+        app.state.vector_service.start_warmup()
+        logger.info("Vector Service initialized successfully; model warmup started.")
     except Exception as e:
         app.state.vector_service = None
         logger.error("FATAL: Vector Service failed to initialize.", exc_info=True)
 
+    # --- Album centroids: running vector sums behind album suggestions and cohesion ---
+    app.state.album_centroids = None
+    if app.state.vector_service:
+        app.state.album_centroids = AlbumCentroids(app.state.vector_service)
+        app.state.album_centroids.track_changes()
+    app.state.cohesion_sweep = None
+    app.state.cohesion_sweep_task = None
+    if app.state.vector_service:
+        app.state.cohesion_sweep = CohesionSweep(Path("./cohesion_report.npz"), settings.COHESION_SWEEP_INTERVAL_HOURS)
+        app.state.cohesion_sweep_task = asyncio.create_task(
+            app.state.cohesion_sweep.maintain_forever(app.state.vector_service)
+        )
+
+    app.state.indexing_queue = None
+    if app.state.vector_service:
+        app.state.indexing_queue = IndexingQueue(
+            app.state.vector_service,
+            max_size=settings.INDEXING_QUEUE_SIZE,
+            workers=settings.INDEXING_WORKERS,
+        )
+
+    # --- kNN graph for "related" and near-duplicate views ---
+    app.state.knn_graph = None
+    app.state.knn_graph_task = None
+    if app.state.vector_service:
+        app.state.knn_graph = await run_in_threadpool(KnnGraph.load_or_empty, Path("./knn_graph.npz"), settings.KNN_GRAPH_K)
+        app.state.knn_graph_task = asyncio.create_task(
+            maintain_knn_graph(app.state.knn_graph, app.state.vector_service, settings.KNN_GRAPH_REFRESH_SECONDS)
+        )
+
+    # --- Safe mode / media type / album filters for vector search ---
+    app.state.attribute_index = AttributeIndex()
+    async with AsyncSessionFactory() as db:
+        app.state.attribute_index.load(await image_service.get_filter_attributes(db))
+    app.state.attribute_index.track_changes()
+
+    # --- Related images: tag overlap and visual similarity, cached per image ---
+    app.state.related_images = RelatedImages(
+        app.state.vector_service,
+        app.state.knn_graph,
+        tag_weight=settings.RELATED_TAG_WEIGHT,
+        visual_weight=settings.RELATED_VISUAL_WEIGHT,
+        candidates=settings.RELATED_CANDIDATES,
+        cache_size=settings.RELATED_CACHE_SIZE,
+    )
+    async with AsyncSessionFactory() as db:
+        app.state.related_images.load(await image_service.get_image_tag_pairs(db))
+    app.state.related_images.track_changes()
+
+    # --- Constellation Map: new images are placed with the saved UMAP model ---
+    app.state.map_grid = MapGrid()
+    app.state.constellation_map = None
+    app.state.constellation_map_task = None
+    app.state.map_atlas = None
+    app.state.map_atlas_task = None
+    app.state.image_clusters = None
+    app.state.image_clusters_task = None
+    if app.state.vector_service:
+        app.state.constellation_map = ConstellationMap(
+            Path("./umap_model.pkl"),
+            refit_drift=settings.MAP_REFIT_DRIFT,
+            projection=settings.MAP_PROJECTION,
+            landmark_threshold=settings.MAP_LANDMARK_THRESHOLD,
+            landmarks=settings.MAP_LANDMARKS,
+            pca_dim=settings.MAP_PCA_DIM,
+            quality_sample=settings.MAP_QUALITY_SAMPLE,
+        )
+        app.state.constellation_map_task = asyncio.create_task(
+            app.state.constellation_map.maintain_forever(app.state.vector_service, settings.MAP_UPDATE_INTERVAL_SECONDS)
+        )
+        app.state.map_atlas = MapAtlas(
+            settings.UPLOAD_PATH / "atlas", tiles_per_side=settings.MAP_ATLAS_TILES, sprite_size=settings.MAP_SPRITE_SIZE,
+        )
+        app.state.map_atlas_task = asyncio.create_task(
+            app.state.map_atlas.maintain_forever(app.state.constellation_map, settings.MAP_UPDATE_INTERVAL_SECONDS)
+        )
+        # Visual clusters feed suggested albums and colour the map.
+        app.state.image_clusters = ImageClusters(
+            Path("./image_clusters.npz"),
+            n_clusters=settings.CLUSTER_COUNT,
+            sample_per_cluster=settings.CLUSTER_SAMPLE_PER_CENTROID,
+            refresh_drift=settings.CLUSTER_REFRESH_DRIFT,
+            map_grid=app.state.map_grid,
+        )
+        app.state.image_clusters_task = asyncio.create_task(
+            app.state.image_clusters.maintain_forever(app.state.vector_service, settings.CLUSTER_CHECK_SECONDS)
+        )
+
     try:
         app.state.caption_service = CaptionService()
         logger.info("Caption Service initialized successfully.")
@@ -70,6 +186,28 @@ async def lifespan(app: FastAPI):
 
     # --- Shutdown Logic ---
     logger.info("Application shutdown...")
+    reindex_task = getattr(app.state, "reindex_task", None)
+    if reindex_task and not reindex_task.done():
+        # Progress is saved per page, so the next run resumes where this one stopped.
+        reindex_task.cancel()
+    if app.state.knn_graph_task:
+        app.state.knn_graph_task.cancel()
+    if app.state.constellation_map_task:
+        app.state.constellation_map_task.cancel()
+        app.state.constellation_map.cancel_refit()
+    if app.state.map_atlas_task:
+        app.state.map_atlas_task.cancel()
+    if app.state.cohesion_sweep_task:
+        app.state.cohesion_sweep_task.cancel()
+        app.state.cohesion_sweep.cancel()
+    if app.state.image_clusters_task:
+        app.state.image_clusters_task.cancel()
+        app.state.image_clusters.cancel()
+    if app.state.indexing_queue:
+        app.state.indexing_queue.shutdown()
+    if app.state.vector_service:
+        # Fold any vectors still in the append log into a final checkpoint.
+        app.state.vector_service.close()
     app.state.vector_service = None
 
 # --- FastAPI App Instance ---
@@ -86,7 +224,7 @@ app.include_router(stats.router)
 app.include_router(images_upload_router)
 app.include_router(images_api_router)
 app.include_router(albums_api_router)
-# app.include_router(albums_api.router) # Decided to keep legacy for now or remove? 
+app.include_router(albums_api.router)  # /api/album/{id}/suggestions, /cohesion and /reorder
 # app.include_router(images_api.router)
 app.include_router(generation_api.router) 
 app.include_router(metadata_api.router)
@@ -100,8 +238,19 @@ async def generic_exception_handler(request: Request, exc: Exception):
 
 # --- Health Check ---
 @app.get("/health", tags=["Health"])
-async def health_check():
-    return {"status": "ok"}
+async def health_check(request: Request):
+    vector_service = getattr(request.app.state, "vector_service", None)
+    if vector_service is None:
+        return {"status": "ok", "model": {"ready": False, "loading": False, "error": "Vector Service is not available."}, "index": {"ready": False}}
+    return {"status": "ok", **vector_service.get_health()}
+
+@app.get("/health/ready", tags=["Health"])
+async def readiness_check(request: Request):
+    """Readiness probe: 503 until the vector index is open and the DINOv2 model has loaded."""
+    vector_service = getattr(request.app.state, "vector_service", None)
+    health = vector_service.get_health() if vector_service else {"model": {"ready": False}, "index": {"ready": False}}
+    ready = health["model"]["ready"] and health["index"]["ready"]
+    return JSONResponse(status_code=200 if ready else 503, content={"ready": ready, **health})
 
 # --- Run with Uvicorn ---
 if __name__ == "__main__":
@@ -1,8 +1,8 @@
 # aetherium_gallery/routers/api/albums.py
 
 from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.ext.asyncio import AsyncSession
-import numpy as np
 import logging
 
 # --- NEW ARCHITECTURE IMPORTS ---
@@ -14,9 +14,6 @@ from ...features.albums import schemas as album_schemas
 from ...features.images import service as image_service
 from ...features.albums import service as album_service
 
-# Import utility from vector service (assuming file location is shared/services)
-from ...services.vector_service import _normalize_vector
-
 router = APIRouter(
     prefix="/api/album",
     tags=["Albums API"],
@@ -24,6 +21,13 @@ router = APIRouter(
 
 logger = logging.getLogger(__name__)
 
+def _album_centroids(request: Request):
+    album_centroids = getattr(request.app.state, "album_centroids", None)
+    if album_centroids is None:
+        logger.error("[Creative Director] Vector service is not available.")
+        raise HTTPException(status_code=503, detail="Vector service is not available.")
+    return album_centroids
+
 @router.get("/{album_id}/suggestions", response_model=list[image_schemas.Image])
 async def get_album_suggestions(
     request: Request,
@@ -31,56 +35,44 @@ async def get_album_suggestions(
     db: AsyncSession = Depends(get_db)
 ):
     """
-    Analyzes the average aesthetic of an album and suggests other images 
-    from the gallery that match this aesthetic.
+    Suggests other images from the gallery that match the album's average
+    aesthetic: a single index search around its maintained centroid vector.
     """
-    logger.info("--- [Creative Director] STARTING SUGGESTION ANALYSIS ---")
-    
-    # Access vector_service from app state to ensure we get the initialized instance
-    vector_service = request.app.state.vector_service
-
-    if vector_service is None:
-        logger.error("[Creative Director] Vector service is not available.")
-        raise HTTPException(status_code=503, detail="Vector service is not available.")
+    album_centroids = _album_centroids(request)
 
     # 1. Get the IDs of all images currently in the album
     image_ids_in_album = await album_service.get_image_ids_for_album(db, album_id=album_id)
     if not image_ids_in_album:
         logger.info(f"[Creative Director] Album {album_id} is empty. No suggestions to generate.")
         return []
-    logger.info(f"[Creative Director] Found {len(image_ids_in_album)} images in album {album_id}: {image_ids_in_album}")
-
-    # 2. Get the vector embeddings for all images in the album
-    embeddings = vector_service.get_embeddings_for_ids(image_ids_in_album)
-    if embeddings is None or len(embeddings) == 0:
-        logger.warning(f"[Creative Director] No valid embeddings found for images in album {album_id}. Cannot continue.")
-        return []
-    logger.info(f"[Creative Director] Retrieved {embeddings.shape[0]} embeddings from vector service.")
-    
-    # 3. Calculate the "average aesthetic" vector
-    average_vector = np.mean(embeddings, axis=0)
-    normalized_average_vector = _normalize_vector(average_vector)
-    logger.info(f"[Creative Director] Calculated normalized average vector. Shape: {normalized_average_vector.shape}")
-
-    # 4. Use the average vector to search for similar images
-    # Exclude images that are already in the album
-    suggested_ids = vector_service.find_similar_images_by_vector(
-        query_vector=normalized_average_vector,
-        exclude_ids=image_ids_in_album,
-        n_results=24
-    )
 
+    # 2. Search around the album's centroid, excluding its own images
+    suggested_ids = await run_in_threadpool(album_centroids.suggest, album_id, image_ids_in_album, 24)
     if not suggested_ids:
-        logger.warning("[Creative Director] Vector search returned no suggestions. Check similarity scores in vector_service logs.")
+        logger.info(f"[Creative Director] No suggestions for album {album_id}.")
         return []
-    logger.info(f"[Creative Director] Vector search found {len(suggested_ids)} potential suggestions: {suggested_ids}")
 
-    # 5. Fetch the full image data for the suggested IDs
+    # 3. Fetch the full image data, most similar first
     suggested_images = await image_service.get_images_by_ids(db, image_ids=suggested_ids)
-    logger.info(f"[Creative Director] Fetched full data for {len(suggested_images)} images from database.")
-    logger.info("--- [Creative Director] ANALYSIS COMPLETE ---")
-    
-    return suggested_images
+    by_id = {image.id: image for image in suggested_images}
+    logger.info(f"[Creative Director] Suggested {len(by_id)} images for album {album_id}.")
+    return [by_id[image_id] for image_id in suggested_ids if image_id in by_id]
+
+@router.get("/{album_id}/cohesion")
+async def get_album_cohesion(
+    request: Request,
+    album_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Ranks the album's images by how well they fit it ("odd one out" first):
+    each image's cosine similarity to the mean of the other images.
+    """
+    album_centroids = _album_centroids(request)
+    image_ids_in_album = await album_service.get_image_ids_for_album(db, album_id=album_id)
+    if not image_ids_in_album and await album_service.get_album(db, album_id=album_id) is None:
+        raise HTTPException(status_code=404, detail="Album not found")
+    return await run_in_threadpool(album_centroids.cohesion, album_id, image_ids_in_album)
 
 @router.post("/{album_id}/reorder", status_code=200)
 async def reorder_album_images(
@@ -94,7 +86,7 @@ async def reorder_album_images(
     if not reorder_request.image_ids:
         return {"message": "No image IDs provided."}
 
-    success = await album_service.update_image_order_in_album(
+    success = await image_service.update_image_order_in_album(
         db, album_id=album_id, ordered_image_ids=reorder_request.image_ids
     )
 
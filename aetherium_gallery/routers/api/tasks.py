@@ -1,79 +1,52 @@
 # aetherium_gallery/routers/api/tasks.py
+import asyncio
 import logging
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.ext.asyncio import AsyncSession
-import umap
 import numpy as np
 from typing import List
 
 # --- NEW ARCHITECTURE IMPORTS ---
+from ...core.config import settings
 from ...core.database import get_db
 from ...features.images import schemas as image_schemas
 from ...features.images import service as image_service
+from ...services import index_factory
+from ...services.map_projection import PROJECTION_MODES
+from ...services.reindex import ReindexJob
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/tasks", tags=["Background Tasks API"])
 
-@router.post("/calculate-map", status_code=200)
-async def calculate_constellation_map(
-    request: Request,
-    db: AsyncSession = Depends(get_db)
-):
+@router.post("/calculate-map", status_code=202)
+async def calculate_constellation_map(request: Request, projection: str | None = None):
     """
-    Recalculates the 2D coordinates for the Constellation Map for all images.
-    This is a long-running, resource-intensive task.
+    Starts a full refit of the Constellation Map in a separate process and
+    returns immediately; poll GET /calculate-map. Between refits, new images are
+    placed on the existing map in the background with the saved model.
+    `projection` overrides MAP_PROJECTION ("full", "landmark" or "auto"); a
+    landmark fit reports its quality against a full fit on a subset.
     """
-    logger.info("Starting Constellation Map calculation...")
     vector_service = request.app.state.vector_service
-    if not vector_service:
+    constellation_map = getattr(request.app.state, "constellation_map", None)
+    if not vector_service or constellation_map is None:
         raise HTTPException(status_code=503, detail="Vector Service is not available.")
+    if constellation_map.is_refitting:
+        raise HTTPException(status_code=409, detail="A map calculation is already running.")
+    if projection is not None and projection not in PROJECTION_MODES:
+        raise HTTPException(status_code=400, detail=f"projection must be one of {PROJECTION_MODES}.")
+
+    logger.info("Starting Constellation Map calculation...")
+    constellation_map.start_refit(vector_service, projection)
+    return {"message": "Map calculation started.", **constellation_map.to_dict()}
 
-    # 1. Export all vectors and their IDs from the vector service
-    all_vectors, all_ids = vector_service.get_all_vectors()
-    
-    if all_vectors is None or len(all_ids) < 3: # UMAP needs at least a few points
-        msg = "Not enough indexed images to generate a map (need at least 3)."
-        logger.warning(msg)
-        return {"message": msg, "images_mapped": 0}
-
-    logger.info(f"Retrieved {len(all_ids)} vectors. Running UMAP dimensionality reduction...")
-
-    try:
-        # 2. Run the UMAP algorithm
-        reducer = umap.UMAP(
-            n_neighbors=15,    
-            min_dist=0.1,      
-            n_components=2,    
-            metric='cosine',   
-            random_state=42    
-        )
-        
-        embedding_2d = reducer.fit_transform(all_vectors)
-
-        logger.info("UMAP calculation complete. Preparing data for database update.")
-
-        # 3. Prepare the data for batch updating
-        coordinates_to_update = [
-            {"id": img_id, "map_x": float(coords[0]), "map_y": float(coords[1])}
-            for img_id, coords in zip(all_ids, embedding_2d)
-        ]
-
-        # 4. Save the new coordinates to the database using image_service
-        updated_count = await image_service.batch_update_image_coordinates(db, coordinates=coordinates_to_update)
-
-        if updated_count > 0:
-            msg = f"Successfully calculated and saved map coordinates for {updated_count} images."
-            logger.info(msg)
-            return {"message": msg, "images_mapped": updated_count}
-        else:
-            msg = "UMAP calculation ran, but failed to save coordinates to the database."
-            logger.error(msg)
-            raise HTTPException(status_code=500, detail=msg)
-            
-    except Exception as e:
-        logger.error(f"An error occurred during map calculation: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"An error occurred during map calculation: {str(e)}")
-    
+@router.get("/calculate-map")
+async def get_constellation_map_progress(request: Request):
+    constellation_map = getattr(request.app.state, "constellation_map", None)
+    if constellation_map is None:
+        return {"state": "idle"}
+    return constellation_map.to_dict()
 
 @router.get("/map-data", response_model=List[image_schemas.Image])
 async def get_constellation_map_data(db: AsyncSession = Depends(get_db)):
@@ -84,4 +57,297 @@ async def get_constellation_map_data(db: AsyncSession = Depends(get_db)):
     logger.info("Fetching all plotted images for the Constellation Map.")
     # Fetch plotted images using image_service
     plotted_images = await image_service.get_all_plotted_images(db)
-    return plotted_images
\ No newline at end of file
+    return plotted_images
+
+def _map_grid_key(request: Request):
+    """Changes whenever map coordinates or the set of indexed images change."""
+    constellation_map = getattr(request.app.state, "constellation_map", None)
+    vector_service = request.app.state.vector_service
+    return (
+        constellation_map.revision if constellation_map else None,
+        vector_service.version if vector_service else None,
+    )
+
+@router.get("/map-points")
+async def get_map_points(
+    request: Request,
+    bbox: str | None = None,
+    max_points: int = 50000,
+    format: str = "binary",
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Plotted points as parallel arrays, for drawing the Constellation Map.
+
+    `bbox=x0,y0,x1,y1` restricts to a viewport and `max_points` thins dense
+    cells evenly (level of detail). `format=binary` returns little-endian
+    int32 ids, float32 x, float32 y and, if clusters exist, int32 cluster ids,
+    back to back, with the counts and bounds in X-Map-* headers;
+    `format=json` returns the same columns as JSON lists. Hover details are
+    fetched per point from /map-points/{image_id}.
+    """
+    if format not in ("binary", "json"):
+        raise HTTPException(status_code=400, detail="format must be 'binary' or 'json'.")
+    box = None
+    if bbox:
+        try:
+            box = tuple(float(v) for v in bbox.split(","))
+        except ValueError:
+            box = ()
+        if len(box) != 4 or box[0] > box[2] or box[1] > box[3]:
+            raise HTTPException(status_code=400, detail="bbox must be 'x0,y0,x1,y1' with x0 <= x1 and y0 <= y1.")
+
+    map_grid = request.app.state.map_grid
+    await map_grid.refresh(db, key=_map_grid_key(request))
+    points = map_grid.query(box, max_points=max(1, max_points))
+
+    if format == "json":
+        return {
+            "count": len(points["ids"]), "total": points["total"], "bounds": points["bounds"],
+            "ids": points["ids"].tolist(), "x": points["x"].tolist(), "y": points["y"].tolist(),
+            "clusters": points["clusters"].tolist() if points["clusters"] is not None else None,
+        }
+
+    columns = [points["ids"].astype("<i4"), points["x"].astype("<f4"), points["y"].astype("<f4")]
+    if points["clusters"] is not None:
+        columns.append(points["clusters"].astype("<i4"))
+    return Response(
+        content=b"".join(column.tobytes() for column in columns),
+        media_type="application/octet-stream",
+        headers={
+            "X-Map-Count": str(len(points["ids"])),
+            "X-Map-Total": str(points["total"]),
+            "X-Map-Bounds": ",".join(f"{v:.6g}" for v in points["bounds"]),
+            "X-Map-Columns": "id,x,y" + (",cluster" if points["clusters"] is not None else ""),
+        },
+    )
+
+@router.get("/map-atlas")
+async def get_map_atlas(request: Request):
+    """
+    Index of the map's thumbnail sprite sheets: the tiling, and each tile's
+    revision. Tile details live at {url}/tile_{tx}_{ty}.json.
+    """
+    map_atlas = getattr(request.app.state, "map_atlas", None)
+    if map_atlas is None or not map_atlas.index["tiles"]:
+        raise HTTPException(status_code=404, detail="The map atlas has not been built yet.")
+    return map_atlas.to_dict()
+
+@router.get("/map-points/{image_id}")
+async def get_map_point_details(image_id: int, db: AsyncSession = Depends(get_db)):
+    """Hover details for one map point, fetched lazily by the map."""
+    image = await image_service.get_image(db, image_id=image_id)
+    if image is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return {
+        "id": image.id,
+        "original_filename": image.original_filename or image.filename,
+        "thumbnail_url": f"/{settings.UPLOAD_FOLDER}/{image.thumbnail_path}" if image.thumbnail_path else None,
+        "url": f"/image/{image.id}",
+    }
+
+@router.get("/vector-stats")
+async def get_vector_stats(request: Request):
+    """
+    Reports the size of the FAISS index and the embedding engine's queue depth
+    and batch-size distribution.
+    """
+    vector_service = request.app.state.vector_service
+    if not vector_service:
+        raise HTTPException(status_code=503, detail="Vector Service is not available.")
+    return vector_service.get_stats()
+
+async def _sampled_vector_report(request: Request, sample_size: int, name: str, report, **kwargs) -> dict:
+    """
+    Runs `report` over up to `sample_size` randomly chosen indexed vectors. The
+    sampling, the copy of just those rows and the report run in a worker thread.
+    """
+    vector_service = request.app.state.vector_service
+    if not vector_service:
+        raise HTTPException(status_code=503, detail="Vector Service is not available.")
+
+    def run_report():
+        ids = vector_service.live_ids()
+        if len(ids) > sample_size:
+            ids = np.sort(np.random.default_rng(42).choice(ids, size=sample_size, replace=False))
+        _, vectors = vector_service.get_vectors(ids.tolist())
+        if len(vectors) < 2:
+            return None
+        logger.info(f"Running {name} over {len(vectors)} vectors...")
+        return report(vectors, **kwargs)
+
+    result = await run_in_threadpool(run_report)
+    if result is None:
+        raise HTTPException(status_code=400, detail="Not enough indexed images to benchmark.")
+    return result
+
+@router.post("/index-report")
+async def build_index_report(
+    request: Request,
+    sample_size: int = 50000,
+    k: int = 10,
+    n_queries: int = 200,
+):
+    """
+    Benchmarks IVF-Flat, IVF-PQ and HNSW against the exact flat index on (a sample
+    of) the gallery's vectors, reporting recall@k and per-query latency for each
+    nprobe / efSearch setting so an operating point can be chosen.
+    """
+    return await _sampled_vector_report(
+        request, sample_size, "ANN recall/latency report", index_factory.recall_latency_report,
+        k=k, n_queries=n_queries,
+    )
+
+@router.post("/storage-report")
+async def build_storage_report(
+    request: Request,
+    sample_size: int = 50000,
+    k: int = 10,
+    n_queries: int = 200,
+):
+    """
+    Compares float32, float16, SQ8 and PQ vector storage on (a sample of) the
+    gallery's vectors: bytes per vector, memory saved and recall@k lost, with PQ
+    also measured after the exact rerank used at search time.
+    """
+    return await _sampled_vector_report(
+        request, sample_size, "vector storage report", index_factory.storage_report,
+        k=k, n_queries=n_queries, pq_m=settings.VECTOR_PQ_M, rerank_factor=settings.VECTOR_RERANK_FACTOR,
+    )
+
+@router.post("/reindex", status_code=202)
+async def start_reindex(
+    request: Request,
+    fresh: bool = False,
+    batch_size: int = 64,
+    workers: int | None = None,
+):
+    """
+    Starts rebuilding the vector index from the images table in the background.
+    By default only images missing from the index are embedded, resuming an
+    interrupted run; `fresh=true` empties the index first. Poll GET /reindex.
+    """
+    vector_service = request.app.state.vector_service
+    if not vector_service:
+        raise HTTPException(status_code=503, detail="Vector Service is not available.")
+
+    running = getattr(request.app.state, "reindex_job", None)
+    if running and running.state == "running":
+        raise HTTPException(status_code=409, detail="A reindex is already running.")
+
+    job = ReindexJob(vector_service, batch_size=batch_size, workers=workers, fresh=fresh)
+    request.app.state.reindex_job = job
+    # Keep a reference so the task is not garbage-collected mid-run.
+    request.app.state.reindex_task = asyncio.create_task(job.run())
+    return {"message": "Reindex started.", **job.to_dict()}
+
+@router.get("/reindex")
+async def get_reindex_progress(request: Request):
+    job = getattr(request.app.state, "reindex_job", None)
+    if job is None:
+        return {"state": "idle"}
+    return job.to_dict()
+
+@router.post("/knn-graph", status_code=202)
+async def refresh_knn_graph(request: Request, full: bool = False):
+    """
+    Refreshes the precomputed kNN graph now instead of waiting for the
+    background pass: incrementally by default, or rebuilt from scratch with
+    `full=true`. Poll GET /knn-graph for its size and build time.
+    """
+    vector_service = request.app.state.vector_service
+    knn_graph = getattr(request.app.state, "knn_graph", None)
+    if not vector_service or knn_graph is None:
+        raise HTTPException(status_code=503, detail="Vector Service is not available.")
+
+    running = getattr(request.app.state, "knn_graph_build", None)
+    if running and not running.done():
+        raise HTTPException(status_code=409, detail="A kNN graph build is already running.")
+
+    build = knn_graph.build if full else knn_graph.update
+    request.app.state.knn_graph_build = asyncio.create_task(run_in_threadpool(build, vector_service))
+    return {"message": f"kNN graph {'rebuild' if full else 'update'} started.", **knn_graph.get_stats()}
+
+@router.get("/knn-graph")
+async def get_knn_graph_stats(request: Request):
+    knn_graph = getattr(request.app.state, "knn_graph", None)
+    if knn_graph is None:
+        raise HTTPException(status_code=503, detail="Vector Service is not available.")
+    running = getattr(request.app.state, "knn_graph_build", None)
+    return {"building": bool(running and not running.done()), **knn_graph.get_stats()}
+
+@router.post("/clusters", status_code=202)
+async def start_clustering(request: Request, n_clusters: int | None = None, warm_start: bool = True):
+    """
+    Re-clusters the index now instead of waiting for the background pass.
+    `n_clusters` overrides CLUSTER_COUNT; with the same count as the saved
+    clusters, training starts from their centroids unless `warm_start=false`.
+    Poll GET /clusters; suggested albums are at /api/albums/suggestions.
+    """
+    vector_service = request.app.state.vector_service
+    image_clusters = getattr(request.app.state, "image_clusters", None)
+    if not vector_service or image_clusters is None:
+        raise HTTPException(status_code=503, detail="Vector Service is not available.")
+    if image_clusters.is_running:
+        raise HTTPException(status_code=409, detail="Clustering is already running.")
+    if n_clusters is not None and n_clusters < 2:
+        raise HTTPException(status_code=400, detail="n_clusters must be at least 2.")
+    image_clusters.start(vector_service, n_clusters, warm_start)
+    return {"message": "Clustering started.", **image_clusters.to_dict()}
+
+@router.get("/clusters")
+async def get_clustering_status(request: Request):
+    image_clusters = getattr(request.app.state, "image_clusters", None)
+    if image_clusters is None:
+        return {"state": "idle"}
+    return image_clusters.to_dict()
+
+@router.post("/cohesion-sweep", status_code=202)
+async def start_cohesion_sweep(request: Request):
+    """
+    Scores every album image against its album now instead of waiting for
+    the nightly run. Poll GET /cohesion-sweep; results are at /cohesion-outliers.
+    """
+    vector_service = request.app.state.vector_service
+    cohesion_sweep = getattr(request.app.state, "cohesion_sweep", None)
+    if not vector_service or cohesion_sweep is None:
+        raise HTTPException(status_code=503, detail="Vector Service is not available.")
+    if cohesion_sweep.is_running:
+        raise HTTPException(status_code=409, detail="A cohesion sweep is already running.")
+    cohesion_sweep.start(vector_service)
+    return {"message": "Cohesion sweep started.", **cohesion_sweep.to_dict()}
+
+@router.get("/cohesion-sweep")
+async def get_cohesion_sweep_status(request: Request, albums: bool = False):
+    """Status of the last sweep; `albums=true` adds the per-album summary."""
+    cohesion_sweep = getattr(request.app.state, "cohesion_sweep", None)
+    if cohesion_sweep is None:
+        return {"state": "idle"}
+    status = cohesion_sweep.to_dict()
+    if albums:
+        status["by_album"] = (cohesion_sweep.summary or {}).get("by_album", [])
+    return status
+
+@router.get("/cohesion-outliers")
+async def get_cohesion_outliers(request: Request, limit: int = 100, min_score: float = 2.0, album_id: int | None = None):
+    """
+    Album images that fit their album worst, from the last cohesion sweep:
+    `outlier_score` is standard deviations below the album's mean similarity.
+    """
+    cohesion_sweep = getattr(request.app.state, "cohesion_sweep", None)
+    if cohesion_sweep is None:
+        raise HTTPException(status_code=503, detail="Vector Service is not available.")
+    outliers = await run_in_threadpool(cohesion_sweep.outliers, max(1, limit), min_score, album_id)
+    return {"generated_at": (cohesion_sweep.summary or {}).get("generated_at"), "outliers": outliers}
+
+@router.get("/near-duplicates")
+async def get_near_duplicates(request: Request, threshold: float = 0.95, min_size: int = 2):
+    """
+    Groups images whose similarity is at least `threshold` (connected components
+    of the kNN graph), largest group first.
+    """
+    knn_graph = getattr(request.app.state, "knn_graph", None)
+    if knn_graph is None:
+        raise HTTPException(status_code=503, detail="Vector Service is not available.")
+    clusters = await run_in_threadpool(knn_graph.near_duplicate_clusters, threshold, max(2, min_size))
+    return {"threshold": threshold, "cluster_count": len(clusters), "clusters": clusters}
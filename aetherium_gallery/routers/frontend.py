@@ -4,6 +4,7 @@ from typing import Optional, List
 from fastapi import APIRouter, Request, Depends, HTTPException, Query
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.ext.asyncio import AsyncSession
 import datetime
 
@@ -22,17 +23,49 @@ router = APIRouter()
 # Configure Jinja2 templates
 templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
 
+def _search_filter(request: Request):
+    """The vector search filter for the visitor's safe mode and media filter cookies (None: unfiltered)."""
+    attribute_index = getattr(request.app.state, "attribute_index", None)
+    if attribute_index is None:
+        return None
+    safe_mode_enabled = request.cookies.get("safe_mode", "off") == "on"
+    media_filter = request.cookies.get("media_filter", "all")
+    return attribute_index.filter(safe_mode=safe_mode_enabled, media_type=media_filter if media_filter in ("image", "video") else "all")
+
+def _similar_ids(request: Request, image_id: int, n_results: int, image_path=None, live_search: bool = True) -> list[int]:
+    """
+    Visually similar ids from the precomputed kNN graph. A live (filtered) index
+    search is used when the image is not in the graph yet, or when the visitor's
+    filters leave fewer than n_results of its graph neighbours.
+    """
+    vector_service = getattr(request.app.state, "vector_service", None)
+    knn_graph = getattr(request.app.state, "knn_graph", None)
+    id_filter = _search_filter(request)
+    similar_ids = knn_graph.neighbours(image_id, n_results=n_results, similarity_threshold=0.5, id_filter=id_filter) if knn_graph else None
+    if similar_ids is not None and (id_filter is None or len(similar_ids) >= n_results):
+        return similar_ids
+    if vector_service is None or (similar_ids is None and not live_search):
+        return similar_ids or []
+    return vector_service.find_similar_images(image_id, image_path=image_path, n_results=n_results, id_filter=id_filter)
+
+async def _page(coroutine):
+    """Awaits a cursor-paginated service call, turning a malformed cursor into a 400."""
+    try:
+        return await coroutine
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/", response_class=HTMLResponse, name="gallery_index")
 async def read_gallery_index(
-    request: Request, db: AsyncSession = Depends(get_db), skip: int = 0, limit: int = 50
+    request: Request, db: AsyncSession = Depends(get_db), limit: int = Query(50, ge=1, le=500)
 ):
     """Serves the main gallery page."""
     safe_mode_enabled = request.cookies.get("safe_mode", "off") == "on"
     media_filter = request.cookies.get("media_filter", "all")
 
     # UDPATE: Use image_service
-    images = await image_service.get_images(
-        db, skip=skip, limit=limit, safe_mode=safe_mode_enabled, media_type=media_filter
+    images, next_cursor = await image_service.get_images(
+        db, limit=limit, safe_mode=safe_mode_enabled, media_type=media_filter
     )
     
     # UPDATE: Use album_service
@@ -42,6 +75,7 @@ async def read_gallery_index(
     return templates.TemplateResponse("index.html", {
         "request": request,
         "images": images,
+        "next_cursor": next_cursor,
         "albums": albums,
         "upload_folder": f"/{settings.UPLOAD_FOLDER}",
         "page_title": "Aetherium Gallery",
@@ -76,14 +110,30 @@ async def read_image_detail(request: Request, image_id: int, db: AsyncSession =
     all_albums_with_counts = await album_service.get_all_albums(db)
     all_albums = [album for album, count in all_albums_with_counts]
 
-    # UPDATE: Use image_service for related images
-    related_images = await image_service.get_related_images(db, source_image=db_image, limit=10)
+    # Related images rank shared (IDF-weighted) tags and visual similarity together.
+    related_images = []
+    related_engine = getattr(request.app.state, "related_images", None)
+    related_ids = await related_engine.related(db, db_image.id, limit=10, id_filter=_search_filter(request)) if related_engine else []
+    if related_ids:
+        db_images = await image_service.get_images_by_ids(db, image_ids=related_ids)
+        id_map = {img.id: img for img in db_images}
+        related_images = [id_map[id] for id in related_ids if id in id_map]
+
+    # Visually similar images come from the precomputed kNN graph; only the
+    # visitor's filters can make this fall back to an index search, so run it in a thread.
+    similar_images = []
+    similar_ids = await run_in_threadpool(_similar_ids, request, db_image.id, 10, live_search=False)
+    if similar_ids:
+        db_images = await image_service.get_images_by_ids(db, image_ids=similar_ids)
+        id_map = {img.id: img for img in db_images}
+        similar_images = [id_map[id] for id in similar_ids if id in id_map]
 
     return templates.TemplateResponse("image_detail.html", {
         "request": request,
         "image": db_image,
         "all_albums": all_albums,
         "related_images": related_images,
+        "similar_images": similar_images,
         "upload_folder": f"/{settings.UPLOAD_FOLDER}",
         "page_title": f"Image - {db_image.original_filename or db_image.filename}",
         "now": datetime.datetime.now,
@@ -93,28 +143,33 @@ async def read_image_detail(request: Request, image_id: int, db: AsyncSession =
 async def search_results(
     request: Request,
     db: AsyncSession = Depends(get_db),
-    q: Optional[str] = Query(None, min_length=2, max_length=100)
+    q: Optional[str] = Query(None, min_length=2, max_length=100),
+    cursor: Optional[str] = None,
 ):
-    """Displays search results based on a query."""
+    """Displays ranked, paginated full-text search results with highlighted snippets."""
     safe_mode_enabled = request.cookies.get("safe_mode", "off") == "on"
     media_filter = request.cookies.get("media_filter", "all")
+    per_page = 60
     
     # UPDATE: Use album_service
     albums_with_counts = await album_service.get_all_albums(db)
     albums = [album for album, count in albums_with_counts]
     
-    images = []
+    results = image_service.SearchResults([], 0, None, {})
     if q:
-        # UPDATE: Use image_service.search_images
-        images = await image_service.search_images(
-            db, query=q, safe_mode=safe_mode_enabled, media_type=media_filter, limit=100
-        )
+        results = await _page(image_service.search_images(
+            db, query=q, safe_mode=safe_mode_enabled, media_type=media_filter,
+            cursor=cursor, limit=per_page,
+        ))
 
     return templates.TemplateResponse("search_results.html", {
         "request": request,
-        "images": images,
+        "images": results.images,
+        "snippets": results.snippets,
         "albums": albums,
-        "image_count": len(images),
+        "image_count": results.total,
+        "next_cursor": results.next_cursor,
+        "is_first_page": not cursor,
         "search_query": q,
         "page_title": f"Search results for '{q}'",
         "now": datetime.datetime.now,
@@ -126,14 +181,19 @@ async def search_results(
 async def read_images_by_tag(
     request: Request,
     tag_name: str,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    cursor: Optional[str] = None,
 ):
-    """Displays a gallery of all images for a specific tag."""
+    """Displays a gallery of all images for a specific tag, one cursor page at a time."""
     safe_mode_enabled = request.cookies.get("safe_mode", "off") == "on"
+    media_filter = request.cookies.get("media_filter", "all")
 
     # UPDATE: Use image_service.get_images_by_tag
-    images = await image_service.get_images_by_tag(
-        db, tag_name=tag_name, safe_mode=safe_mode_enabled, limit=100
+    images, next_cursor = await _page(image_service.get_images_by_tag(
+        db, tag_name=tag_name, cursor=cursor, safe_mode=safe_mode_enabled, media_type=media_filter, limit=100
+    ))
+    image_count = await image_service.count_images_by_tag(
+        db, tag_name=tag_name, safe_mode=safe_mode_enabled, media_type=media_filter
     )
     
     # UPDATE: Use album_service
@@ -144,7 +204,9 @@ async def read_images_by_tag(
         "request": request,
         "images": images,
         "albums": albums,
-        "image_count": len(images),
+        "image_count": image_count,
+        "next_cursor": next_cursor,
+        "is_first_page": not cursor,
         "tag_name": tag_name,
         "page_title": f"Tag: {tag_name}",
         "now": datetime.datetime.now,
@@ -169,25 +231,19 @@ async def show_similar_images(
             detail="Similarity search is not applicable for videos or images with missing thumbnails."
         )
 
-    vector_service = request.app.state.vector_service
-    
     similar_images = []
-    if vector_service and not source_image.video_source:
-        # Note: We access settings from the new location
-        source_image_path = settings.UPLOAD_PATH / source_image.filename
-        
-        if source_image_path.exists():
-            similar_ids = vector_service.find_similar_images_by_path(
-                image_path=source_image_path,
-                source_id=source_image.id,
-                n_results=12
-            )
-            
-            if similar_ids:
-                # UPDATE: Use image_service
-                db_images = await image_service.get_images_by_ids(db, image_ids=similar_ids)
-                id_map = {img.id: img for img in db_images}
-                similar_images = [id_map[id] for id in similar_ids if id in id_map]
+    # The precomputed graph answers instantly; images added since its last refresh fall back to a live search.
+    source_image_path = settings.UPLOAD_PATH / source_image.filename
+    similar_ids = await run_in_threadpool(
+        _similar_ids, request, source_image.id, 12,
+        image_path=source_image_path if source_image_path.exists() else None,
+    )
+
+    if similar_ids:
+        # UPDATE: Use image_service
+        db_images = await image_service.get_images_by_ids(db, image_ids=similar_ids)
+        id_map = {img.id: img for img in db_images}
+        similar_images = [id_map[id] for id in similar_ids if id in id_map]
 
     # UPDATE: Use album_service
     albums_with_counts = await album_service.get_all_albums(db)
@@ -216,23 +272,28 @@ async def show_constellation_map(request: Request):
 
 @router.get("/gallery-chunk", response_class=HTMLResponse, name="gallery_chunk")
 async def get_gallery_chunk(
-    request: Request, db: AsyncSession = Depends(get_db), skip: int = 0, limit: int = 50
+    request: Request, db: AsyncSession = Depends(get_db),
+    cursor: Optional[str] = None, limit: int = Query(50, ge=1, le=500)
 ):
     """
     Returns just the HTML grid partial for infinite scrolling.
-    Called by JavaScript via AJAX.
+    Called by JavaScript via AJAX; the cursor for the following chunk is
+    sent in the X-Next-Cursor header (absent after the last chunk).
     """
     safe_mode_enabled = request.cookies.get("safe_mode", "off") == "on"
     media_filter = request.cookies.get("media_filter", "all")
 
-    images = await image_service.get_images(
-        db, skip=skip, limit=limit, safe_mode=safe_mode_enabled, media_type=media_filter
-    )
+    images, next_cursor = await _page(image_service.get_images(
+        db, cursor=cursor, limit=limit, safe_mode=safe_mode_enabled, media_type=media_filter
+    ))
     
     # We render ONLY the partial template, not the full base.html
-    return templates.TemplateResponse("partials/gallery_grid.html", {
+    response = templates.TemplateResponse("partials/gallery_grid.html", {
         "request": request,
         "images": images,
         "upload_folder": f"/{settings.UPLOAD_FOLDER}",
         # We don't need albums or page_title here because it's just a fragment
-    })
\ No newline at end of file
+    })
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
\ No newline at end of file
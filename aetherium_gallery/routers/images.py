@@ -9,8 +9,9 @@ import logging
 from pathlib import Path
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, File, UploadFile, HTTPException, Form, Request
+from fastapi import APIRouter, Depends, File, UploadFile, HTTPException, Form, Request, Response
 from fastapi.responses import RedirectResponse, JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.ext.asyncio import AsyncSession
 from PIL import Image as PILImage 
 
@@ -117,10 +118,11 @@ async def handle_single_upload_api(
         new_image_record = await image_service.create_image(db, image_data=final_image_data)
         
         # Indexing
-        vector_service = request.app.state.vector_service
-        if vector_service and not content_type.startswith("video/") and saved_path.exists():
-             logger.info(f"Indexing new image (ID: {new_image_record.id}) for visual search...")
-             vector_service.add_image(image_id=new_image_record.id, image_path=saved_path)
+        indexing_queue = getattr(request.app.state, "indexing_queue", None)
+        if indexing_queue and not content_type.startswith("video/") and saved_path.exists():
+             logger.info(f"Queueing new image (ID: {new_image_record.id}) for visual search indexing...")
+             if not indexing_queue.submit(new_image_record.id, saved_path):
+                 logger.warning(f"Indexing queue is full; image {new_image_record.id} was not queued and is marked failed until a reindex.")
         
         logger.info(f"Successfully processed and created entry for: {original_filename}")
         return new_image_record
@@ -154,9 +156,17 @@ async def extract_metadata_from_image(file: UploadFile = File(...)):
 
 # CORRECTED: Used image_schemas.Image
 @router.get("/", response_model=List[image_schemas.Image])
-async def read_images_api(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
-    """API endpoint to retrieve a list of images."""
-    return await image_service.get_images(db, skip=skip, limit=limit)
+async def read_images_api(
+    response: Response, cursor: Optional[str] = None, limit: int = 100, db: AsyncSession = Depends(get_db)
+):
+    """API endpoint to retrieve a list of images, one cursor page at a time (see X-Next-Cursor)."""
+    try:
+        images, next_cursor = await image_service.get_images(db, cursor=cursor, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return images
 
 # CORRECTED: Used image_schemas.Image
 @router.get("/{image_id}", response_model=image_schemas.Image)
@@ -169,11 +179,15 @@ async def read_image_api(image_id: int, db: AsyncSession = Depends(get_db)):
 
 @router.post("/bulk-update", status_code=200)
 async def bulk_update_images_api(
+    request: Request,
     action_request: image_schemas.BulkActionRequest,
     db: AsyncSession = Depends(get_db)
 ):
     try:
         affected_count = await image_service.bulk_update_images(db, action_request, utils_module=utils)
+        vector_service = request.app.state.vector_service
+        if vector_service and action_request.action == "delete":
+            await run_in_threadpool(vector_service.remove_images, action_request.image_ids)
         return {
             "message": f"Action '{action_request.action}' performed successfully.",
             "images_affected": affected_count
@@ -210,6 +224,10 @@ async def delete_image_api(image_id: int, request: Request, db: AsyncSession = D
     if deleted_record is None:
         raise HTTPException(status_code=404, detail="Image found initially but failed to delete from DB")
 
+    vector_service = request.app.state.vector_service
+    if vector_service:
+        await run_in_threadpool(vector_service.remove_images, [image_id])
+
     gallery_url = request.url_for('gallery_index')
     return RedirectResponse(url=gallery_url, status_code=303)
 
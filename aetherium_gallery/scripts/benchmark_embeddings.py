@@ -0,0 +1,87 @@
+# aetherium_gallery/scripts/benchmark_embeddings.py
+"""
+Compares the optimized DINOv2 inference modes against the default path.
+
+    python -m aetherium_gallery.scripts.benchmark_embeddings --images 256 --batch-size 16
+
+For each variant it reports images/sec (preprocessing included) and the cosine
+agreement of its embeddings with the eager fp32 + AutoImageProcessor baseline.
+Images are read from the uploads folder unless --folder is given.
+"""
+
+import argparse
+import logging
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp"}
+
+def load_images(folder: Path, limit: int) -> list:
+    paths = sorted(p for p in folder.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)[:limit]
+    return [Image.open(p).convert("RGB") for p in paths]
+
+def run_variant(processor, model, images: list, batch_size: int) -> tuple[np.ndarray, float]:
+    from ..services.embedding_engine import embed_batch
+
+    embed_batch(processor, model, images[:batch_size])  # warm-up (and compilation)
+    started = time.perf_counter()
+    vectors = [embed_batch(processor, model, images[i:i + batch_size]) for i in range(0, len(images), batch_size)]
+    elapsed = time.perf_counter() - started
+    return np.vstack(vectors), len(images) / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--folder", type=Path, default=None, help="Folder of images (default: the uploads folder).")
+    parser.add_argument("--images", type=int, default=128, help="Number of images to embed per variant.")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--threads", type=int, default=0, help="torch intra-op threads (0 = torch default).")
+    parser.add_argument("--model", default="facebook/dinov2-base")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from transformers import AutoImageProcessor, AutoModel
+    from ..core.config import settings
+    from ..services import inference_optim
+
+    images = load_images(args.folder or settings.UPLOAD_PATH, args.images)
+    if not images:
+        raise SystemExit("No images found to benchmark.")
+    inference_optim.set_num_threads(args.threads)
+
+    processor = AutoImageProcessor.from_pretrained(args.model)
+    fast_processor = inference_optim.FastImagePreprocessor(processor)
+    example_inputs = fast_processor(images=images[:1])
+
+    def fresh_model():
+        return AutoModel.from_pretrained(args.model).eval()
+
+    variants = [
+        ("baseline (fp32, AutoImageProcessor)", processor, lambda: fresh_model()),
+        ("fast preprocessing", fast_processor, lambda: fresh_model()),
+        ("int8 dynamic quantization", fast_processor, lambda: inference_optim.optimize_model(fresh_model(), quantize=True)),
+        ("torchscript", fast_processor, lambda: inference_optim.optimize_model(fresh_model(), compile_mode="torchscript", example_inputs=example_inputs)),
+        ("torch.compile", fast_processor, lambda: inference_optim.optimize_model(fresh_model(), compile_mode="torch_compile")),
+        ("int8 + torchscript", fast_processor, lambda: inference_optim.optimize_model(fresh_model(), quantize=True, compile_mode="torchscript", example_inputs=example_inputs)),
+    ]
+
+    baseline = None
+    print(f"\n{len(images)} images, batch size {args.batch_size}\n")
+    print(f"{'variant':<38} {'images/s':>9} {'speedup':>8} {'mean cos':>9} {'min cos':>8}")
+    for name, variant_processor, build in variants:
+        try:
+            vectors, throughput = run_variant(variant_processor, build(), images, args.batch_size)
+        except Exception as e:
+            print(f"{name:<38} failed: {e}")
+            continue
+        if baseline is None:
+            baseline = (vectors, throughput)
+        cosines = np.sum(vectors * baseline[0], axis=1)
+        print(f"{name:<38} {throughput:>9.1f} {throughput / baseline[1]:>7.2f}x {cosines.mean():>9.4f} {cosines.min():>8.4f}")
+
+if __name__ == "__main__":
+    main()
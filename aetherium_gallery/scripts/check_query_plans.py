@@ -0,0 +1,203 @@
+# aetherium_gallery/scripts/check_query_plans.py
+"""
+Runs the service layer's queries against a scratch SQLite database built from
+the models, EXPLAINs every statement they send (relationship loads included)
+and exits non-zero when one scans a whole table instead of using an index.
+
+    python -m aetherium_gallery.scripts.check_query_plans              # check, print only problems
+    python -m aetherium_gallery.scripts.check_query_plans --verbose    # print every plan
+
+Whole-gallery reads (statistics, the map, the search-filter and tag index
+loads) are expected to scan; their plans are printed with --verbose but never
+fail the check. A public coroutine in features/*/service.py without a case
+fails it too, so new queries cannot slip past unchecked.
+"""
+
+import argparse
+import asyncio
+import inspect
+import logging
+import re
+import tempfile
+from pathlib import Path
+
+# "SCAN images" or "SCAN TABLE images AS i" (older SQLite); "SCAN ... USING INDEX" is an index walk.
+FULL_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$")
+
+async def _seed(db):
+    from ..features.albums.models import Album
+    from ..features.images.models import Image, VideoSource
+    from ..features.tags.models import Tag
+
+    album, tag = Album(name="Album"), Tag(name="tag")
+    video = VideoSource(filename="clip.mp4", filepath="clip.mp4")
+    db.add_all([album, tag, video])
+    for i in range(20):
+        db.add(Image(
+            filename=f"image_{i}.png", filepath=f"image_{i}.png", original_filename=f"image_{i}.png",
+            prompt=f"a red fox number {i}", is_nsfw=i % 5 == 0, order_index=i,
+            map_x=float(i) if i % 2 else None, map_y=float(i) if i % 2 else None, sampler="Euler",
+            album=album if i < 10 else None, tags=[tag] if i % 3 == 0 else [],
+            video_source=video if i == 19 else None,
+        ))
+    await db.commit()
+    return album.id
+
+def _services() -> list:
+    from ..features.albums import service as album_service
+    from ..features.images import service as image_service
+    return [album_service, image_service]
+
+def _cases(album_id: int) -> list:
+    """
+    (name, coroutine function taking a session, whole-gallery read?). A name's
+    first word is the service function it covers. Writes run after the reads,
+    deletes last, since each changes the seeded rows.
+    """
+    from ..features.albums import schemas as album_schemas, service as album_service
+    from ..features.images import schemas as image_schemas, service as image_service
+
+    async def deep_page(db, **filters):
+        # A later page: the cursor turns the keyset condition on.
+        first = await image_service.get_images(db, limit=3, **filters)
+        return await image_service.get_images(db, cursor=first.next_cursor, limit=3, **filters)
+
+    async def deep_tag_page(db):
+        first = await image_service.get_images_by_tag(db, "tag", limit=2)
+        return await image_service.get_images_by_tag(db, "tag", cursor=first.next_cursor, limit=2)
+
+    async def deep_search_page(db):
+        first = await image_service.search_images(db, "red fox", limit=2)
+        return await image_service.search_images(db, "red fox", cursor=first.next_cursor, limit=2)
+
+    async def update_image(db):
+        image = await image_service.get_image(db, 2)
+        return await image_service.update_image(db, image, image_schemas.ImageUpdate(tags="tag, edited", notes="edited"))
+
+    def bulk(action, image_ids, value=None):
+        request = image_schemas.BulkActionRequest(image_ids=image_ids, action=action, value=value)
+        return lambda db: image_service.bulk_update_images(db, request)
+
+    return [
+        ("get_image", lambda db: image_service.get_image(db, 1), False),
+        ("get_images_by_ids", lambda db: image_service.get_images_by_ids(db, [1, 2, 3]), False),
+        ("get_images", lambda db: image_service.get_images(db, limit=3), False),
+        ("get_images (cursor)", deep_page, False),
+        ("get_images (safe mode, cursor)", lambda db: deep_page(db, safe_mode=True), False),
+        ("get_images (images only, cursor)", lambda db: deep_page(db, media_type="image"), False),
+        ("get_images (videos only, cursor)", lambda db: deep_page(db, media_type="video"), False),
+        ("get_images (safe mode, images only, cursor)", lambda db: deep_page(db, safe_mode=True, media_type="image"), False),
+        ("get_images_by_tag (cursor)", deep_tag_page, False),
+        ("count_images_by_tag", lambda db: image_service.count_images_by_tag(db, "tag"), False),
+        ("search_images (cursor)", deep_search_page, False),
+        ("get_image_tag_pairs (ids)", lambda db: image_service.get_image_tag_pairs(db, image_ids=[1, 2]), False),
+        ("get_image_tag_names", lambda db: image_service.get_image_tag_names(db, [1, 2]), False),
+        ("get_indexable_images_after", lambda db: image_service.get_indexable_images_after(db, after_id=5), False),
+        ("count_indexable_images", lambda db: image_service.count_indexable_images(db, after_id=5), False),
+        ("get_unplotted_image_ids_after", lambda db: image_service.get_unplotted_image_ids_after(db, after_id=5), False),
+        ("get_unsorted_image_ids", image_service.get_unsorted_image_ids, False),
+        ("get_album_memberships", image_service.get_album_memberships, False),
+        ("get_album", lambda db: album_service.get_album(db, album_id), False),
+        ("get_image_ids_for_album", lambda db: album_service.get_image_ids_for_album(db, album_id), False),
+        # Whole-gallery reads
+        ("get_image_tag_pairs (all)", image_service.get_image_tag_pairs, True),
+        ("get_filter_attributes", image_service.get_filter_attributes, True),
+        ("get_map_points", image_service.get_map_points, True),
+        ("get_map_sprite_rows", image_service.get_map_sprite_rows, True),
+        ("get_all_plotted_images", image_service.get_all_plotted_images, True),
+        ("get_gallery_statistics", image_service.get_gallery_statistics, True),
+        ("get_all_albums", album_service.get_all_albums, True),
+        # Writes
+        ("create_image", lambda db: image_service.create_image(db, {"filename": "new.png", "filepath": "new.png", "tags": "tag, fresh"}), False),
+        ("create_video_source", lambda db: image_service.create_video_source(db, {"filename": "new.mp4", "filepath": "new.mp4"}), False),
+        ("update_image", update_image, False),
+        ("get_or_create_tags_by_name", lambda db: image_service.get_or_create_tags_by_name(db, ["tag", "unseen"]), False),
+        ("bulk_update_images (add tags)", bulk("add_tags", [3, 4], "tag, bulk"), False),
+        ("bulk_update_images (nsfw)", bulk("set_nsfw", [3, 4], True), False),
+        ("bulk_update_images (album)", bulk("add_to_album", [11, 12], album_id), False),
+        ("batch_update_image_coordinates", lambda db: image_service.batch_update_image_coordinates(db, [{"id": 1, "map_x": 1.0, "map_y": 2.0}]), False),
+        ("update_image_order_in_album", lambda db: image_service.update_image_order_in_album(db, album_id, [2, 1]), False),
+        ("create_album", lambda db: album_service.create_album(db, album_schemas.AlbumCreate(name="Another")), False),
+        ("create_albums_from_groups", lambda db: album_service.create_albums_from_groups(db, [("Album", [13, 14])]), False),
+        # Deletes
+        ("delete_image", lambda db: image_service.delete_image(db, 17), False),
+        ("bulk_update_images (delete)", bulk("delete", [15, 16]), False),
+        ("delete_album", lambda db: album_service.delete_album(db, album_id), False),
+    ]
+
+def _uncovered(cases: list) -> list[str]:
+    """Public service coroutines that no case exercises."""
+    covered = {name.split()[0] for name, _, _ in cases}
+    return [
+        f"{module.__name__.rsplit('.', 2)[-2]}.{name}"
+        for module in _services()
+        for name, function in inspect.getmembers(module, inspect.iscoroutinefunction)
+        if not name.startswith("_") and function.__module__ == module.__name__ and name not in covered
+    ]
+
+async def check(verbose: bool = False) -> list:
+    """Returns (case, statement, plan detail) for every full table scan found."""
+    from sqlalchemy import event
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+    from ..core.config import settings
+    from ..core.database import Base
+    from ..features.albums import models as _album_models  # registers every table on Base.metadata
+    from ..features.images import full_text, models as _image_models
+
+    problems = [(name, None, "no EXPLAIN case; add one to _cases()") for name in _uncovered(_cases(0))]
+    upload_folder = settings.UPLOAD_FOLDER
+    with tempfile.TemporaryDirectory() as tmp:
+        # The delete cases remove the seeded rows' files; keep them away from the real uploads.
+        settings.UPLOAD_FOLDER = tmp
+        engine = create_async_engine(f"sqlite+aiosqlite:///{Path(tmp) / 'plans.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            if not await conn.run_sync(full_text.create_index):
+                print("warning: this SQLite build has no FTS5; search is checked on its LIKE fallback")
+        tables = set(Base.metadata.tables)
+        sessions = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+        async with sessions() as db:
+            album_id = await _seed(db)
+
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "WITH")):
+                statements.append((statement, parameters))
+        event.listen(engine.sync_engine, "before_cursor_execute", record)
+
+        for name, run, whole_gallery in _cases(album_id):
+            statements.clear()
+            async with sessions() as db:
+                await run(db)
+            explained = list(statements)
+            async with engine.connect() as conn:
+                for statement, parameters in explained:
+                    plan = (await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)).all()
+                    details = [row[-1] for row in plan]
+                    scans = [d for d in details if (m := FULL_SCAN.match(d)) and m.group(1) in tables]
+                    if scans and not whole_gallery:
+                        problems += [(name, statement, d) for d in scans]
+                    if verbose or (scans and not whole_gallery):
+                        print(f"--- {name}{' (whole gallery)' if whole_gallery else ''}\n{' '.join(statement.split())}")
+                        for detail in details:
+                            print(f"    {detail}{'   <-- full scan' if detail in scans else ''}")
+        await engine.dispose()
+        settings.UPLOAD_FOLDER = upload_folder
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--verbose", action="store_true", help="Print the plan of every statement.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    problems = asyncio.run(check(verbose=args.verbose))
+    if problems:
+        print(f"\n{len(problems)} problem(s):")
+        for name, _, detail in problems:
+            print(f"  {name}: {detail}")
+        raise SystemExit(1)
+    print("No full table scans outside whole-gallery reads; every service query has a case.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# aetherium_gallery/scripts/cohesion_sweep.py
+"""
+Scores every album image against its album ("Aesthetic Cohesion") and saves
+per-image outlier scores to cohesion_report.npz / cohesion_report.json.
+
+    python -m aetherium_gallery.scripts.cohesion_sweep              # run the sweep, print the worst outliers
+    python -m aetherium_gallery.scripts.cohesion_sweep --top 50     # print more of them
+
+A running server also does this nightly (COHESION_SWEEP_INTERVAL_HOURS) and on
+POST /api/tasks/cohesion-sweep; both write the same report.
+"""
+
+import argparse
+import asyncio
+import logging
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=20, help="How many outliers to print.")
+    parser.add_argument("--min-score", type=float, default=2.0, help="Smallest outlier score to print.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from ..services.cohesion_sweep import CohesionSweep
+    from ..services.vector_service import get_vector_service
+
+    vector_service = get_vector_service()
+    sweep = CohesionSweep()
+    try:
+        result = asyncio.run(sweep.run(vector_service))
+    finally:
+        vector_service.close()
+    print(result)
+    for outlier in sweep.outliers(limit=args.top, min_score=args.min_score):
+        print(f"album {outlier['album_id']:>6}  image {outlier['image_id']:>8}  "
+              f"similarity {outlier['similarity']:.3f}  outlier score {outlier['outlier_score']:.2f}")
+    if result["state"] != "completed":
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
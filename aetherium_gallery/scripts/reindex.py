@@ -0,0 +1,41 @@
+# aetherium_gallery/scripts/reindex.py
+"""
+Rebuilds the visual-search index from the images table.
+
+    python -m aetherium_gallery.scripts.reindex              # index what is missing, resuming if interrupted
+    python -m aetherium_gallery.scripts.reindex --fresh      # wipe the index and rebuild everything
+
+Run it while the server is stopped, or use POST /api/tasks/reindex on a running
+server instead: both write the same index files.
+"""
+
+import argparse
+import asyncio
+import logging
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=64, help="Images per page read, decoded and embedded together.")
+    parser.add_argument("--workers", type=int, default=None, help="Decode processes (default: CPU count - 1).")
+    parser.add_argument("--fresh", action="store_true", help="Empty the index first and reindex every image.")
+    parser.add_argument("--no-resume", action="store_true", help="Ignore saved progress and start from the first image.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from ..services.reindex import ReindexJob
+    from ..services.vector_service import get_vector_service
+
+    vector_service = get_vector_service()
+    vector_service.start_warmup()
+    job = ReindexJob(vector_service, batch_size=args.batch_size, workers=args.workers,
+                     fresh=args.fresh, resume=not args.no_resume)
+    try:
+        result = asyncio.run(job.run())
+    finally:
+        vector_service.close()
+    print(result)
+    if result["state"] != "completed":
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
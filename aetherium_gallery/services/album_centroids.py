@@ -0,0 +1,194 @@
+# aetherium_gallery/services/album_centroids.py
+
+import logging
+import threading
+
+import numpy as np
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from ..features.albums.models import Album
+from ..features.images import models
+
+logger = logging.getLogger(__name__)
+
+class AlbumCentroids:
+    """
+    Running vector sums and member counts per album, one row each in a single
+    float64 matrix, so an album's centroid is sum / count with no vectors
+    reconstructed.
+
+    track_changes() applies album membership changes (an image's album_id
+    changing, images and albums being deleted) as they are committed, adding
+    or subtracting that image's vector. An album is summed from scratch, in one
+    batched lookup, the first time it is used and whenever its members in the
+    database no longer match what was summed (e.g. an image that joined before
+    it was indexed).
+    """
+
+    def __init__(self, vector_service):
+        self.vector_service = vector_service
+        self._lock = threading.RLock()
+        self._rows: dict[int, int] = {}  # album id -> row
+        self._free: list[int] = []
+        self._sums = np.zeros((0, vector_service.embedding_dim), dtype="float64")
+        self._counts = np.zeros(0, dtype="int64")
+        self._members: dict[int, set[int]] = {}  # album id -> ids included in its sum
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    # 1. Running sums
+    def _row(self, album_id: int) -> int:
+        row = self._rows.get(album_id)
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+            else:
+                row = len(self._counts)
+                grow = max(16, row // 2)
+                self._sums = np.vstack([self._sums, np.zeros((grow, self._sums.shape[1]), dtype="float64")])
+                self._counts = np.concatenate([self._counts, np.zeros(grow, dtype="int64")])
+                self._free.extend(range(row + grow - 1, row, -1))
+            self._sums[row] = 0.0
+            self._counts[row] = 0
+            self._rows[album_id] = row
+            self._members[album_id] = set()
+        return row
+
+    def drop(self, album_id: int):
+        with self._lock:
+            row = self._rows.pop(album_id, None)
+            if row is not None:
+                self._free.append(row)
+                del self._members[album_id]
+
+    def _rebuild(self, album_id: int, member_ids) -> int:
+        found_ids, vectors = self.vector_service.get_vectors(list(member_ids))
+        row = self._row(album_id)
+        self._sums[row] = vectors.sum(axis=0, dtype="float64") if found_ids else 0.0
+        self._counts[row] = len(found_ids)
+        self._members[album_id] = set(found_ids)
+        return row
+
+    def move(self, image_id: int, old_album_id: int | None, new_album_id: int | None):
+        """Moves one image's vector between album sums (either side may be None)."""
+        with self._lock:
+            if old_album_id not in self._rows and new_album_id not in self._rows:
+                return
+            vector = self.vector_service.get_vector(image_id)
+            for album_id, sign in ((old_album_id, -1), (new_album_id, 1)):
+                if album_id not in self._rows: continue
+                members = self._members[album_id]
+                if (image_id in members) == (sign > 0): continue
+                if vector is None:
+                    # The vector is already gone; re-sum this album on next use.
+                    self.drop(album_id)
+                    continue
+                row = self._rows[album_id]
+                self._sums[row] += sign * vector
+                self._counts[row] += sign
+                (members.add if sign > 0 else members.discard)(image_id)
+
+    def _synced_row(self, album_id: int, member_ids) -> int:
+        """The album's row, re-summed first if its database members differ from what was summed."""
+        member_ids = set(member_ids)
+        row = self._rows.get(album_id)
+        if row is not None:
+            summed = self._members[album_id]
+            # Members that were never summed are fine only while they are still unindexed.
+            missing = member_ids - summed
+            if summed <= member_ids and not (missing and self.vector_service.get_vectors(list(missing))[0]):
+                return row
+        return self._rebuild(album_id, member_ids)
+
+    # 2. Queries
+    def centroid(self, album_id: int, member_ids) -> np.ndarray | None:
+        """Normalized mean vector of the album's indexed members, or None if it has none."""
+        with self._lock:
+            row = self._synced_row(album_id, member_ids)
+            if self._counts[row] == 0:
+                return None
+            mean = self._sums[row] / self._counts[row]
+        return (mean / max(np.linalg.norm(mean), 1e-12)).astype("float32")
+
+    def suggest(self, album_id: int, member_ids, n_results: int = 24, similarity_threshold: float = 0.5,
+                id_filter=None) -> list[int]:
+        """Images most similar to the album's centroid: one index search, album members excluded."""
+        centroid = self.centroid(album_id, member_ids)
+        if centroid is None:
+            return []
+        return self.vector_service.find_similar_images_by_vector(
+            centroid, exclude_ids=set(member_ids), n_results=n_results,
+            similarity_threshold=similarity_threshold, id_filter=id_filter,
+        )
+
+    def cohesion(self, album_id: int, member_ids) -> dict:
+        """
+        How well each indexed member fits its album: cosine similarity to the
+        mean of the other members (leave-one-out), least typical first, plus
+        the album's mean. One batched lookup and one matrix-vector product.
+        """
+        with self._lock:
+            row = self._synced_row(album_id, member_ids)
+            total, count = self._sums[row].copy(), int(self._counts[row])
+            ids = sorted(self._members[album_id])
+        if count < 2:
+            return {"album_id": album_id, "indexed": count, "mean_similarity": None, "images": []}
+        found_ids, vectors = self.vector_service.get_vectors(ids)
+        vectors = vectors.astype("float64")
+        # The others' sum is total - v: cos = v.(total - v) / (|v| |total - v|).
+        dots = vectors @ total
+        squared = np.einsum("ij,ij->i", vectors, vectors)
+        others_norm = np.sqrt(np.maximum(total @ total - 2 * dots + squared, 1e-24))
+        similarity = (dots - squared) / (np.sqrt(squared) * others_norm)
+        order = np.argsort(similarity, kind="stable")
+        return {
+            "album_id": album_id, "indexed": count,
+            "mean_similarity": float(similarity.mean()),
+            "images": [{"image_id": int(found_ids[i]), "similarity": float(similarity[i])} for i in order],
+        }
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {"albums": len(self._rows), "summed_images": int(self._counts[list(self._rows.values())].sum())}
+
+    # 3. Keeping in sync with the database
+    def track_changes(self):
+        """Registers session listeners that apply committed album membership changes."""
+        event.listen(Session, "after_flush", self._collect_changes)
+        event.listen(Session, "after_commit", self._apply_changes)
+        event.listen(Session, "after_rollback", self._discard_changes)
+
+    def _collect_changes(self, session, flush_context):
+        moves = session.info.setdefault("album_centroid_moves", {})
+        dropped = session.info.setdefault("album_centroid_drops", set())
+        try:
+            for obj in session.deleted:
+                if isinstance(obj, models.Image) and obj.id is not None:
+                    old = moves.get(obj.id, (obj.__dict__.get("album_id"), None))[0]
+                    moves[obj.id] = (old, None)
+                elif isinstance(obj, Album) and obj.id is not None:
+                    dropped.add(obj.id)
+            for obj in session.new | session.dirty:
+                if not isinstance(obj, models.Image) or obj.id is None: continue
+                history = inspect(obj).attrs.album_id.history
+                if not history.has_changes(): continue
+                old = history.deleted[0] if history.deleted else None
+                new = history.added[0] if history.added else None
+                # Several flushes in one transaction: keep the album it started in.
+                moves[obj.id] = (moves[obj.id][0] if obj.id in moves else old, new)
+        except Exception as e:
+            logger.warning(f"Could not record album membership changes for album centroids: {e}")
+
+    def _apply_changes(self, session):
+        moves = session.info.pop("album_centroid_moves", {})
+        for album_id in session.info.pop("album_centroid_drops", ()):
+            self.drop(album_id)
+        for image_id, (old, new) in moves.items():
+            if old != new:
+                self.move(image_id, old, new)
+
+    def _discard_changes(self, session):
+        session.info.pop("album_centroid_moves", None)
+        session.info.pop("album_centroid_drops", None)
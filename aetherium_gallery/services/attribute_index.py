@@ -0,0 +1,155 @@
+# aetherium_gallery/services/attribute_index.py
+
+import logging
+import threading
+from typing import NamedTuple
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from ..features.albums.models import Album
+from ..features.images import models
+
+logger = logging.getLogger(__name__)
+
+MEDIA_TYPES = ("all", "image", "video")
+
+class IdFilter(NamedTuple):
+    """Which image ids a search may return: mask[image_id] is True for allowed ids."""
+    key: tuple
+    mask: np.ndarray
+
+class AttributeIndex:
+    """
+    The filterable image attributes (is_nsfw, video or still, album_id) as
+    arrays indexed by image id, so a search filter is a vectorized mask rather
+    than a database round-trip.
+
+    track_changes() keeps it in sync: ORM inserts, updates and deletes of
+    images are collected at flush and applied when the transaction commits.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._known = np.zeros(0, dtype=bool)
+        self._nsfw = np.zeros(0, dtype=bool)
+        self._video = np.zeros(0, dtype=bool)
+        self._album = np.zeros(0, dtype="int32")
+        self.version = 0
+        self._filters: dict[tuple, IdFilter] = {}
+
+    def load(self, rows):
+        """Replaces the contents with (id, is_nsfw, video_source_id, album_id) rows."""
+        rows = list(rows)
+        size = max((r[0] for r in rows), default=0) + 1
+        known, nsfw, video = np.zeros(size, dtype=bool), np.zeros(size, dtype=bool), np.zeros(size, dtype=bool)
+        album = np.full(size, -1, dtype="int32")
+        for image_id, is_nsfw, video_source_id, album_id in rows:
+            known[image_id] = True
+            nsfw[image_id] = bool(is_nsfw)
+            video[image_id] = video_source_id is not None
+            album[image_id] = -1 if album_id is None else album_id
+        with self._lock:
+            self._known, self._nsfw, self._video, self._album = known, nsfw, video, album
+            self._changed()
+        logger.info(f"Loaded search filter attributes for {len(rows)} images.")
+
+    def __len__(self) -> int:
+        return int(self._known.sum())
+
+    # 1. Updates
+    def set(self, image_id: int, is_nsfw: bool, is_video: bool, album_id: int | None):
+        with self._lock:
+            self._grow(image_id + 1)
+            self._known[image_id] = True
+            self._nsfw[image_id] = bool(is_nsfw)
+            self._video[image_id] = is_video
+            self._album[image_id] = -1 if album_id is None else album_id
+            self._changed()
+
+    def remove(self, image_id: int):
+        with self._lock:
+            if image_id < len(self._known):
+                self._known[image_id] = False
+                self._changed()
+
+    def clear_album(self, album_id: int):
+        """Detaches every image from a deleted album."""
+        with self._lock:
+            self._album[self._album == album_id] = -1
+            self._changed()
+
+    def _grow(self, size: int):
+        if size <= len(self._known): return
+        size = max(size, int(len(self._known) * 1.5) + 1024)
+        pad = size - len(self._known)
+        self._known = np.concatenate([self._known, np.zeros(pad, dtype=bool)])
+        self._nsfw = np.concatenate([self._nsfw, np.zeros(pad, dtype=bool)])
+        self._video = np.concatenate([self._video, np.zeros(pad, dtype=bool)])
+        self._album = np.concatenate([self._album, np.full(pad, -1, dtype="int32")])
+
+    def _changed(self):
+        self.version += 1
+        self._filters.clear()
+
+    # 2. Filters
+    def filter(self, safe_mode: bool = False, media_type: str = "all", album_id: int | None = None) -> IdFilter | None:
+        """The id filter for these settings, or None when nothing is filtered out. Cached until the next change."""
+        if media_type not in MEDIA_TYPES:
+            raise ValueError(f"Unknown media type '{media_type}'. Expected one of {MEDIA_TYPES}.")
+        if not safe_mode and media_type == "all" and album_id is None:
+            return None
+        key = (safe_mode, media_type, album_id)
+        with self._lock:
+            cached = self._filters.get(key)
+            if cached is not None:
+                return cached
+            mask = self._known.copy()
+            if safe_mode:
+                mask &= ~self._nsfw
+            if media_type == "image":
+                mask &= ~self._video
+            elif media_type == "video":
+                mask &= self._video
+            if album_id is not None:
+                mask &= self._album == album_id
+            id_filter = IdFilter((*key, self.version), mask)
+            self._filters[key] = id_filter
+            return id_filter
+
+    # 3. Keeping in sync with the database
+    def track_changes(self):
+        """Registers session listeners that mirror committed image changes into this index."""
+        event.listen(Session, "after_flush", self._collect_changes)
+        event.listen(Session, "after_commit", self._apply_changes)
+        event.listen(Session, "after_rollback", self._discard_changes)
+
+    def _collect_changes(self, session, flush_context):
+        # Reads only already-loaded state, so it never triggers a lazy load inside the flush.
+        pending = session.info.setdefault("attribute_index_changes", {})
+        try:
+            for obj in session.new | session.dirty:
+                if isinstance(obj, models.Image) and obj.id is not None:
+                    state = obj.__dict__
+                    pending[obj.id] = (state.get("is_nsfw", False), state.get("video_source_id") is not None, state.get("album_id"))
+            for obj in session.deleted:
+                if isinstance(obj, models.Image) and obj.id is not None:
+                    pending[obj.id] = None
+                elif isinstance(obj, Album) and obj.id is not None:
+                    session.info.setdefault("attribute_index_deleted_albums", set()).add(obj.id)
+        except Exception as e:
+            logger.warning(f"Could not record image attribute changes for search filters: {e}")
+
+    def _apply_changes(self, session):
+        for album_id in session.info.pop("attribute_index_deleted_albums", ()):
+            self.clear_album(album_id)
+        for image_id, attributes in session.info.pop("attribute_index_changes", {}).items():
+            if attributes is None:
+                self.remove(image_id)
+            else:
+                self.set(image_id, *attributes)
+
+    def _discard_changes(self, session):
+        session.info.pop("attribute_index_changes", None)
+        session.info.pop("attribute_index_deleted_albums", None)
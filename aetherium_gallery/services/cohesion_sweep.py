@@ -0,0 +1,184 @@
+# aetherium_gallery/services/cohesion_sweep.py
+
+import asyncio
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from ..core.database import AsyncSessionFactory
+from ..features.images import service as image_service
+
+logger = logging.getLogger(__name__)
+
+def score_albums(image_ids: np.ndarray, album_ids: np.ndarray, vectors: np.ndarray) -> dict:
+    """
+    Scores every image against its album in one grouped pass. `similarity` is
+    the cosine similarity to the mean of the album's other images (leave one
+    out); `outlier_score` is how many standard deviations that falls below
+    the album's mean similarity. Images alone in their album score NaN.
+    Returns per-image arrays sorted by (album_id, image_id).
+    """
+    order = np.lexsort((image_ids, album_ids))
+    image_ids, album_ids = image_ids[order], album_ids[order]
+    vectors = np.asarray(vectors, dtype="float64")[order]
+
+    albums, starts, counts = np.unique(album_ids, return_index=True, return_counts=True)
+    group = np.repeat(np.arange(len(albums)), counts)
+    sums = np.add.reduceat(vectors, starts, axis=0) if len(vectors) else np.zeros((0, vectors.shape[1]))
+
+    # The others' sum is S - v: cos = v.(S - v) / (|v| |S - v|).
+    dots = np.einsum("ij,ij->i", vectors, sums[group])
+    squared = np.einsum("ij,ij->i", vectors, vectors)
+    others_norm = np.sqrt(np.maximum(np.einsum("ij,ij->i", sums, sums)[group] - 2 * dots + squared, 1e-24))
+    similarity = (dots - squared) / (np.sqrt(squared) * others_norm)
+    similarity[counts[group] < 2] = np.nan
+
+    valid = ~np.isnan(similarity)
+    n = np.bincount(group, weights=valid, minlength=len(albums))
+    mean = np.bincount(group, weights=np.where(valid, similarity, 0.0), minlength=len(albums)) / np.maximum(n, 1)
+    variance = np.bincount(group, weights=np.where(valid, (similarity - mean[group]) ** 2, 0.0), minlength=len(albums)) / np.maximum(n, 1)
+    outlier_score = (mean[group] - similarity) / np.maximum(np.sqrt(variance[group]), 1e-6)
+    return {
+        "image_ids": image_ids, "album_ids": album_ids,
+        "similarity": similarity.astype("float32"), "outlier_score": outlier_score.astype("float32"),
+        "albums": albums, "album_sizes": counts, "album_mean_similarity": np.where(n > 0, mean, np.nan),
+    }
+
+class CohesionSweep:
+    """
+    Gallery-wide "Aesthetic Cohesion" report: every album image's fit to its
+    album, from one membership query, one bulk vector lookup and one grouped
+    numpy pass. Per-image scores are saved to `path` (.npz) with a per-album
+    summary next to it (.json).
+    """
+
+    def __init__(self, path: Path = Path("./cohesion_report.npz"), interval_hours: float = 24):
+        self.path = Path(path)
+        self.summary_path = self.path.with_suffix(".json")
+        self.interval_hours = interval_hours
+
+        self.state = "idle"
+        self.error: str | None = None
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.summary: dict | None = None
+        self._task: asyncio.Task | None = None
+        if self.summary_path.exists():
+            try:
+                self.summary = json.loads(self.summary_path.read_text())
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable cohesion summary {self.summary_path}: {e}")
+
+    @property
+    def is_running(self) -> bool:
+        return self.state == "running"
+
+    def to_dict(self) -> dict:
+        summary = self.summary or {}
+        return {
+            "state": self.state, "error": self.error,
+            "started_at": self.started_at, "finished_at": self.finished_at,
+            **{k: summary.get(k) for k in ("generated_at", "albums", "images", "indexed_images", "seconds")},
+        }
+
+    # 1. The sweep
+    async def run(self, vector_service) -> dict:
+        self.state, self.error, self.started_at, self.finished_at = "running", None, time.time(), None
+        try:
+            async with AsyncSessionFactory() as db:
+                rows = await image_service.get_album_memberships(db)
+            await asyncio.to_thread(self.sweep, vector_service, rows)
+            self.state = "completed"
+        except Exception as e:
+            self.state, self.error = "failed", str(e)
+            logger.error(f"Cohesion sweep failed: {e}", exc_info=True)
+        finally:
+            self.finished_at = time.time()
+        return self.to_dict()
+
+    def start(self, vector_service) -> asyncio.Task:
+        """Starts run() in the background, keeping a reference so the task is not garbage-collected."""
+        self.state = "running"
+        self._task = asyncio.create_task(self.run(vector_service))
+        return self._task
+
+    def cancel(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+    def sweep(self, vector_service, rows) -> dict:
+        """Scores (image_id, album_id) memberships and saves the report (blocking)."""
+        started = time.perf_counter()
+        members = dict(rows)
+        found_ids, vectors = vector_service.get_vectors(list(members))
+        image_ids = np.asarray(found_ids, dtype="int64")
+        album_ids = np.fromiter((members[i] for i in found_ids), dtype="int64", count=len(found_ids))
+        scores = score_albums(image_ids, album_ids, vectors)
+
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **scores)
+        os.replace(tmp_path, self.path)
+
+        # Per album: size, mean fit, and its least typical image.
+        filled = np.nan_to_num(scores["outlier_score"], nan=-np.inf)
+        _, starts = np.unique(scores["album_ids"], return_index=True)
+        worst = np.lexsort((-filled, scores["album_ids"]))[starts] if len(starts) else starts
+        summary = {
+            "generated_at": time.time(),
+            "albums": len(scores["albums"]), "images": len(members), "indexed_images": len(found_ids),
+            "seconds": time.perf_counter() - started,
+            "by_album": [
+                {
+                    "album_id": int(album_id), "indexed": int(size),
+                    "mean_similarity": None if np.isnan(mean) else float(mean),
+                    "worst_image_id": int(scores["image_ids"][w]) if np.isfinite(filled[w]) else None,
+                    "worst_outlier_score": float(filled[w]) if np.isfinite(filled[w]) else None,
+                }
+                for album_id, size, mean, w in zip(scores["albums"], scores["album_sizes"], scores["album_mean_similarity"], worst)
+            ],
+        }
+        tmp_path = self.summary_path.with_name(self.summary_path.name + ".tmp")
+        tmp_path.write_text(json.dumps(summary))
+        os.replace(tmp_path, self.summary_path)
+        self.summary = summary
+        logger.info(f"Cohesion sweep scored {len(found_ids)} images in {summary['albums']} albums "
+                    f"in {summary['seconds']:.2f}s.")
+        return summary
+
+    # 2. Reading the report
+    def outliers(self, limit: int = 100, min_score: float = 2.0, album_id: int | None = None) -> list[dict]:
+        """The saved report's images with outlier_score >= min_score, worst first."""
+        if not self.path.exists():
+            return []
+        with np.load(self.path) as report:
+            image_ids, album_ids = report["image_ids"], report["album_ids"]
+            similarity, scores = report["similarity"], report["outlier_score"]
+        keep = np.flatnonzero(np.nan_to_num(scores, nan=-np.inf) >= min_score)
+        if album_id is not None:
+            keep = keep[album_ids[keep] == album_id]
+        keep = keep[np.argsort(-scores[keep], kind="stable")[:limit]]
+        return [
+            {"image_id": int(image_ids[i]), "album_id": int(album_ids[i]),
+             "similarity": float(similarity[i]), "outlier_score": float(scores[i])}
+            for i in keep
+        ]
+
+    async def maintain_forever(self, vector_service, check_seconds: float = 600):
+        """
+        Background loop: re-runs the sweep once the last run (successful or
+        not) is `interval_hours` old (0 disables).
+        """
+        while True:
+            try:
+                last_run = max((self.summary or {}).get("generated_at") or 0, self.finished_at or 0)
+                due = self.interval_hours and time.time() - last_run >= self.interval_hours * 3600
+                if due and not self.is_running:
+                    await self.run(vector_service)
+            except Exception as e:
+                logger.error(f"Cohesion sweep scheduling failed: {e}", exc_info=True)
+            await asyncio.sleep(check_seconds)
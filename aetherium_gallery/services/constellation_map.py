@@ -0,0 +1,271 @@
+# aetherium_gallery/services/constellation_map.py
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+import time
+from pathlib import Path
+
+import numpy as np
+
+from ..core.database import AsyncSessionFactory
+from ..features.images import service as image_service
+
+logger = logging.getLogger(__name__)
+
+UMAP_PARAMS = {"n_neighbors": 15, "min_dist": 0.1, "n_components": 2, "metric": "cosine", "random_state": 42}
+
+def fit_map_model(vectors_path: str, model_path: str, coords_path: str, report_path: str,
+                  umap_params: dict, options: dict):
+    """
+    Runs in a child process: fits the map on the exported vectors, pickles the
+    fitted model to `model_path`, writes the 2D coordinates to `coords_path` and
+    a JSON fit report to `report_path`.
+
+    "full" fits UMAP on every vector; "landmark" fits it on a stratified sample
+    of PCA-reduced vectors and places the rest from their nearest landmarks
+    ("auto" picks landmark above `landmark_threshold` vectors).
+    """
+    logging.basicConfig(level=logging.INFO)
+    import umap
+    from . import map_projection
+
+    vectors = np.load(vectors_path, mmap_mode="r")
+    mode = options["projection"]
+    if mode == "auto":
+        mode = "landmark" if len(vectors) > options["landmark_threshold"] else "full"
+
+    started = time.perf_counter()
+    report = {"projection": mode, "images": len(vectors)}
+    if mode == "landmark":
+        reducer, coords = map_projection.fit_landmark_projection(
+            vectors, umap_params, n_landmarks=options["landmarks"], pca_dim=options["pca_dim"],
+        )
+        report["landmarks"] = len(reducer.landmark_vectors)
+        report["fit_seconds"] = time.perf_counter() - started
+        if options["quality_sample"]:
+            logger.info("Measuring projection quality against a full fit on a subset...")
+            report["quality"] = map_projection.projection_quality(
+                vectors, coords, umap_params, sample_size=options["quality_sample"],
+            )
+    else:
+        reducer = umap.UMAP(**umap_params)
+        coords = reducer.fit_transform(np.asarray(vectors)).astype("float32")
+        report["fit_seconds"] = time.perf_counter() - started
+
+    tmp_path = model_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(reducer, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, model_path)
+    with open(coords_path, "wb") as f:
+        np.save(f, coords)
+    with open(report_path, "w") as f:
+        json.dump(report, f)
+
+class ConstellationMap:
+    """
+    Keeps the Constellation Map's coordinates current without refitting UMAP.
+
+    A full fit runs in a separate process (on demand, or once drift passes
+    `refit_drift`) and the fitted reducer is persisted. Between fits, images
+    that are indexed but not yet plotted are placed with the saved reducer's
+    transform(), in small batches from a background loop. Drift is the number
+    of images placed that way relative to the number the model was fitted on.
+    """
+
+    def __init__(self, model_path: Path = Path("./umap_model.pkl"), refit_drift: float = 0.25,
+                 place_batch: int = 1000, projection: str = "auto", landmark_threshold: int = 50000,
+                 landmarks: int = 20000, pca_dim: int = 64, quality_sample: int = 2000):
+        from .map_projection import PROJECTION_MODES
+        if projection not in PROJECTION_MODES:
+            raise ValueError(f"Unknown map projection '{projection}'. Expected one of {PROJECTION_MODES}.")
+        self.model_path = Path(model_path)
+        self.state_path = self.model_path.with_suffix(".json")
+        self.refit_drift = refit_drift
+        self.place_batch = place_batch
+        self.fit_options = {
+            "projection": projection, "landmark_threshold": landmark_threshold,
+            "landmarks": landmarks, "pca_dim": pca_dim, "quality_sample": quality_sample,
+        }
+        self._reducer = None
+        self.fit_report: dict | None = None
+
+        self.fitted_count = 0
+        self.fitted_at: float | None = None
+        self.placed_since_fit = 0
+        self._placed_version: int | None = None
+        # Bumped whenever coordinates change, so map readers know to reload them.
+        self.revision = 0
+
+        # Refit job status, reported by to_dict().
+        self.state = "idle"
+        self.error: str | None = None
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.images_mapped = 0
+        self._refit_task: asyncio.Task | None = None
+
+    # 1. Model state
+    def load(self):
+        """Loads the persisted reducer and its counters (slow: imports umap and unpickles the model)."""
+        if self.state_path.exists():
+            try:
+                saved = json.loads(self.state_path.read_text())
+                self.fitted_count = saved["fitted_count"]
+                self.fitted_at = saved.get("fitted_at")
+                self.placed_since_fit = saved.get("placed_since_fit", 0)
+                self.fit_report = saved.get("fit_report")
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable map state file {self.state_path}: {e}")
+        if self.model_path.exists():
+            try:
+                with open(self.model_path, "rb") as f:
+                    self._reducer = pickle.load(f)
+                logger.info(f"Loaded UMAP model fitted on {self.fitted_count} images from {self.model_path}.")
+            except Exception as e:
+                logger.error(f"Could not load UMAP model from {self.model_path}; run a full map calculation: {e}")
+
+    @property
+    def drift(self) -> float:
+        return self.placed_since_fit / self.fitted_count if self.fitted_count else 0.0
+
+    @property
+    def is_refitting(self) -> bool:
+        return self.state == "running"
+
+    def to_dict(self) -> dict:
+        return {
+            "state": self.state, "error": self.error,
+            "started_at": self.started_at, "finished_at": self.finished_at,
+            "images_mapped": self.images_mapped,
+            "model_loaded": self._reducer is not None,
+            "fitted_count": self.fitted_count, "fitted_at": self.fitted_at,
+            "placed_since_fit": self.placed_since_fit,
+            "drift": self.drift, "refit_drift": self.refit_drift,
+            "fit_report": self.fit_report,
+        }
+
+    def _save_state(self):
+        saved = {"fitted_count": self.fitted_count, "fitted_at": self.fitted_at,
+                 "placed_since_fit": self.placed_since_fit, "fit_report": self.fit_report}
+        tmp_path = self.state_path.with_name(self.state_path.name + ".tmp")
+        tmp_path.write_text(json.dumps(saved))
+        os.replace(tmp_path, self.state_path)
+
+    # 2. Full refit (separate process)
+    def start_refit(self, vector_service, projection: str | None = None) -> asyncio.Task:
+        """Starts refit() in the background, keeping a reference so the task is not garbage-collected."""
+        self.state = "running"
+        self._refit_task = asyncio.create_task(self.refit(vector_service, projection))
+        return self._refit_task
+
+    def cancel_refit(self):
+        if self._refit_task and not self._refit_task.done():
+            self._refit_task.cancel()
+
+    async def refit(self, vector_service, projection: str | None = None) -> dict:
+        self.state, self.error, self.started_at, self.finished_at = "running", None, time.time(), None
+        vectors_path = self.model_path.with_name("umap_fit_vectors.npy")
+        coords_path = self.model_path.with_name("umap_fit_coords.npy")
+        report_path = self.model_path.with_name("umap_fit_report.json")
+        options = {**self.fit_options, **({"projection": projection} if projection else {})}
+        process = None
+        try:
+            all_vectors, all_ids = await asyncio.to_thread(vector_service.get_all_vectors)
+            if all_vectors is None or len(all_ids) < 3:  # UMAP needs at least a few points
+                raise ValueError("Not enough indexed images to generate a map (need at least 3).")
+            await asyncio.to_thread(np.save, vectors_path, all_vectors)
+            del all_vectors
+
+            logger.info(f"Fitting the map ({options['projection']}) on {len(all_ids)} vectors in a separate process...")
+            process = multiprocessing.get_context("spawn").Process(
+                target=fit_map_model,
+                args=(str(vectors_path), str(self.model_path), str(coords_path), str(report_path), UMAP_PARAMS, options),
+                daemon=True,
+            )
+            process.start()
+            await asyncio.to_thread(process.join)
+            if process.exitcode != 0:
+                raise RuntimeError(f"UMAP fit process exited with code {process.exitcode}.")
+
+            coords = await asyncio.to_thread(np.load, coords_path)
+            coordinates_to_update = [
+                {"id": img_id, "map_x": float(x), "map_y": float(y)}
+                for img_id, (x, y) in zip(all_ids, coords)
+            ]
+            async with AsyncSessionFactory() as db:
+                self.images_mapped = await image_service.batch_update_image_coordinates(db, coordinates=coordinates_to_update)
+            if self.images_mapped == 0:
+                raise RuntimeError("UMAP calculation ran, but failed to save coordinates to the database.")
+
+            self.fitted_count, self.fitted_at, self.placed_since_fit = len(all_ids), time.time(), 0
+            self.fit_report = json.loads(report_path.read_text())
+            self.revision += 1
+            self._save_state()
+            await asyncio.to_thread(self.load)
+            self.state = "completed"
+            logger.info(f"Constellation Map refit complete: {self.images_mapped} images mapped.")
+        except asyncio.CancelledError:
+            self.state = "cancelled"
+            if process is not None and process.is_alive():
+                process.terminate()
+            raise
+        except Exception as e:
+            self.state, self.error = "failed", str(e)
+            logger.error(f"Constellation Map refit failed: {e}", exc_info=True)
+        finally:
+            self.finished_at = time.time()
+            vectors_path.unlink(missing_ok=True)
+            coords_path.unlink(missing_ok=True)
+            report_path.unlink(missing_ok=True)
+        return self.to_dict()
+
+    # 3. Incremental placement
+    async def place_new(self, vector_service) -> int:
+        """Places indexed-but-unplotted images with the saved reducer's transform()."""
+        if self._reducer is None or self.is_refitting:
+            return 0
+        version = vector_service.version
+        placed, after_id = 0, 0
+        async with AsyncSessionFactory() as db:
+            while True:
+                page = await image_service.get_unplotted_image_ids_after(db, after_id=after_id, limit=self.place_batch)
+                if not page: break
+                after_id = page[-1]
+                found_ids, vectors = await asyncio.to_thread(vector_service.get_vectors, page)
+                if not found_ids: continue
+                coords = await asyncio.to_thread(self._reducer.transform, vectors)
+                coordinates_to_update = [
+                    {"id": img_id, "map_x": float(x), "map_y": float(y)}
+                    for img_id, (x, y) in zip(found_ids, coords)
+                ]
+                placed += await image_service.batch_update_image_coordinates(db, coordinates=coordinates_to_update)
+        self._placed_version = version
+        if placed:
+            self.placed_since_fit += placed
+            self.revision += 1
+            self._save_state()
+            logger.info(f"Placed {placed} new images on the Constellation Map (drift {self.drift:.2f}).")
+        return placed
+
+    async def maintain_forever(self, vector_service, interval_seconds: float):
+        """
+        Background loop: loads the saved model, places newly indexed images
+        whenever the index changes, and starts a full refit once drift passes
+        `refit_drift` (0 disables automatic refits). A failed refit is not
+        retried automatically.
+        """
+        await asyncio.to_thread(self.load)
+        while True:
+            try:
+                if self._placed_version != vector_service.version:
+                    await self.place_new(vector_service)
+                if self.refit_drift and self.drift > self.refit_drift and self.state not in ("running", "failed"):
+                    logger.info(f"Map drift {self.drift:.2f} exceeds {self.refit_drift}; starting a full refit.")
+                    self.start_refit(vector_service)
+            except Exception as e:
+                logger.error(f"Constellation Map maintenance failed: {e}", exc_info=True)
+            await asyncio.sleep(interval_seconds)
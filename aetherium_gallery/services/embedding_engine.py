@@ -0,0 +1,163 @@
+# aetherium_gallery/services/embedding_engine.py
+
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+class EmbeddingEngine:
+    """
+    Dynamic micro-batching front-end for the DINOv2 model.
+
+    Callers from any thread submit single images and get a Future back. A worker
+    thread drains the queue into batches of up to `max_batch_size`, waiting at
+    most `max_wait_ms` after the first request for more to arrive, runs one
+    batched forward pass and hands each caller its own normalized vector.
+    """
+
+    def __init__(self, processor, model, max_batch_size: int = 16, max_wait_ms: float = 10.0):
+        self.processor = processor
+        self.model = model
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+
+        self._queue: queue.Queue = queue.Queue()
+        # Guards `_closed` so nothing is queued behind the stop marker.
+        self._submit_lock = threading.Lock()
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self._batch_sizes: Counter = Counter()
+        self._images_embedded = 0
+        self._forward_seconds = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="embedding-engine", daemon=True)
+        self._thread.start()
+        logger.info(f"Embedding engine started (max_batch_size={self.max_batch_size}, max_wait_ms={max_wait_ms}).")
+
+    # 1. Public API
+    def submit(self, image) -> Future:
+        """Queues one RGB PIL image and returns a Future resolving to its float32 vector."""
+        future: Future = Future()
+        with self._submit_lock:
+            if self._closed:
+                raise RuntimeError("Embedding engine is shut down.")
+            self._queue.put((image, future))
+        return future
+
+    def embed(self, image) -> np.ndarray:
+        """Blocking convenience wrapper around submit()."""
+        return self.submit(image).result()
+
+    def embed_many(self, images: list) -> list[np.ndarray]:
+        """Submits a group of images at once so they share forward passes."""
+        futures = [self.submit(image) for image in images]
+        return [future.result() for future in futures]
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            batches = sum(self._batch_sizes.values())
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "batches_run": batches,
+                "images_embedded": self._images_embedded,
+                "mean_batch_size": self._images_embedded / batches if batches else 0.0,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+                "images_per_second": self._images_embedded / self._forward_seconds if self._forward_seconds else 0.0,
+            }
+
+    def shutdown(self):
+        """
+        Stops accepting images and gives the worker a few seconds to finish the
+        ones already queued; any it has not reached by then fail instead of
+        leaving their callers waiting forever.
+        """
+        with self._submit_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join(timeout=5)
+
+        error = RuntimeError("Embedding engine shut down before this image was embedded.")
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP and item[1].set_running_or_notify_cancel():
+                item[1].set_exception(error)
+        if self._thread.is_alive():
+            # Still inside a forward pass; let it exit once that returns.
+            self._queue.put(_STOP)
+
+    # 2. Worker loop
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+
+            batch = [item]
+            stopping = False
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._process(batch)
+            if stopping:
+                return
+
+    def _process(self, batch: list):
+        futures = [future for _, future in batch if future.set_running_or_notify_cancel()]
+        images = [image for image, future in batch if future.running()]
+        if not images:
+            return
+
+        started = time.perf_counter()
+        try:
+            vectors = self._forward(images)
+        except Exception as e:
+            logger.error(f"Batched embedding of {len(images)} images failed: {e}", exc_info=True)
+            for future in futures:
+                future.set_exception(e)
+            return
+        elapsed = time.perf_counter() - started
+
+        with self._stats_lock:
+            self._batch_sizes[len(images)] += 1
+            self._images_embedded += len(images)
+            self._forward_seconds += elapsed
+
+        for future, vector in zip(futures, vectors):
+            future.set_result(vector)
+
+    def _forward(self, images: list) -> np.ndarray:
+        return embed_batch(self.processor, self.model, images)
+
+def embed_batch(processor, model, images: list) -> np.ndarray:
+    """One forward pass over `images`, returning L2-normalized CLS embeddings."""
+    inputs = processor(images=images, return_tensors="pt")
+    with torch.no_grad():
+        outputs = model(**inputs)
+    embeddings = outputs.last_hidden_state[:, 0].cpu().numpy().astype("float32")
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.where(norms > 0, norms, 1.0)
@@ -0,0 +1,148 @@
+# aetherium_gallery/services/id_map.py
+
+import logging
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# File layout: one flat int64 .npy array, so the whole map is a single memmap.
+#   [version, n_positions, n_live, n_tombstones,
+#    index_to_id (n_positions), sorted live ids (n_live),
+#    their positions (n_live), tombstoned positions (n_tombstones)]
+_FORMAT_VERSION = 1
+_HEADER = 4
+
+class IdMap:
+    """
+    Two-way mapping between FAISS positions and database image ids.
+
+    The checkpointed part is memory-mapped straight from disk: position -> id is
+    a plain array lookup and id -> position a binary search over the sorted
+    live ids, so loading costs O(1) regardless of gallery size and forked
+    workers share the pages. Changes made since the last save live in small
+    in-memory deltas until the next save() folds them in.
+    """
+
+    def __init__(self, index_to_id=None, sorted_ids=None, sorted_positions=None, tombstones=None):
+        empty = np.empty(0, dtype="int64")
+        self._base_ids = empty if index_to_id is None else index_to_id
+        self._sorted_ids = empty if sorted_ids is None else sorted_ids
+        self._sorted_positions = empty if sorted_positions is None else sorted_positions
+        self.tombstones: set[int] = set() if tombstones is None else tombstones
+
+        self._appended: list[int] = []   # ids at positions len(_base_ids)...
+        self._added: dict[int, int] = {} # live ids added since the last save
+        self._removed: set[int] = set()  # ids no longer live in the base lookup
+
+    @classmethod
+    def from_ids(cls, index_to_id, tombstones=()) -> "IdMap":
+        """Builds a map from a position-ordered id sequence and its tombstoned positions."""
+        index_to_id = np.asarray(index_to_id, dtype="int64")
+        tombstones = set(int(p) for p in tombstones)
+        live = np.ones(len(index_to_id), dtype=bool)
+        live[list(tombstones)] = False
+        positions = np.flatnonzero(live)
+        order = np.argsort(index_to_id[positions], kind="stable")
+        return cls(index_to_id, index_to_id[positions][order], positions[order], tombstones)
+
+    @classmethod
+    def load(cls, path: Path) -> "IdMap":
+        data = np.load(path, mmap_mode="r")
+        version, n_positions, n_live, n_tombstones = (int(v) for v in data[:_HEADER])
+        if version != _FORMAT_VERSION:
+            raise ValueError(f"unsupported id map version {version}")
+        if len(data) != _HEADER + n_positions + 2 * n_live + n_tombstones:
+            raise ValueError(f"id map {path} is truncated")
+
+        offset = _HEADER
+        index_to_id = data[offset:offset + n_positions]; offset += n_positions
+        sorted_ids = data[offset:offset + n_live]; offset += n_live
+        sorted_positions = data[offset:offset + n_live]; offset += n_live
+        tombstones = set(data[offset:offset + n_tombstones].tolist())
+        return cls(index_to_id, sorted_ids, sorted_positions, tombstones)
+
+    def save(self, path: Path):
+        """Writes the merged map to `path`; the in-memory deltas are left as they are."""
+        index_to_id = self.all_ids()
+        merged = IdMap.from_ids(index_to_id, self.tombstones)
+        tombstones = np.array(sorted(self.tombstones), dtype="int64")
+        header = np.array([_FORMAT_VERSION, len(index_to_id), len(merged._sorted_ids), len(tombstones)], dtype="int64")
+        with open(path, "wb") as f:
+            np.save(f, np.concatenate([header, index_to_id, merged._sorted_ids, merged._sorted_positions, tombstones]))
+
+    # 1. Lookups
+    def __len__(self) -> int:
+        """Number of FAISS positions, including tombstoned ones."""
+        return len(self._base_ids) + len(self._appended)
+
+    @property
+    def live_count(self) -> int:
+        return len(self) - len(self.tombstones)
+
+    def __contains__(self, image_id: int) -> bool:
+        return self.position_of(image_id) is not None
+
+    def position_of(self, image_id: int) -> int | None:
+        if image_id in self._added:
+            return self._added[image_id]
+        if image_id in self._removed or len(self._sorted_ids) == 0:
+            return None
+        i = int(np.searchsorted(self._sorted_ids, image_id))
+        if i < len(self._sorted_ids) and self._sorted_ids[i] == image_id:
+            return int(self._sorted_positions[i])
+        return None
+
+    def positions_of(self, image_ids) -> np.ndarray:
+        """Positions of the given ids that are live, in input order; unknown ids are skipped."""
+        positions = (self.position_of(image_id) for image_id in image_ids)
+        return np.array([p for p in positions if p is not None], dtype="int64")
+
+    def id_at(self, position: int) -> int:
+        base = len(self._base_ids)
+        return int(self._base_ids[position]) if position < base else self._appended[position - base]
+
+    def ids_at(self, positions: np.ndarray) -> np.ndarray:
+        """Vectorized id_at(); -1 positions (FAISS's "no result") map to -1."""
+        positions = np.asarray(positions, dtype="int64")
+        ids = np.full(positions.shape, -1, dtype="int64")
+        base = len(self._base_ids)
+        in_base = (positions >= 0) & (positions < base)
+        ids[in_base] = self._base_ids[positions[in_base]]
+        in_tail = positions >= base
+        if in_tail.any():
+            ids[in_tail] = np.array(self._appended, dtype="int64")[positions[in_tail] - base]
+        return ids
+
+    def live_ids(self) -> np.ndarray:
+        """Sorted ids of every live (indexed, not deleted) image."""
+        ids = np.asarray(self._sorted_ids)
+        if self._removed:
+            ids = ids[~np.isin(ids, np.fromiter(self._removed, dtype="int64", count=len(self._removed)))]
+        if self._added:
+            ids = np.union1d(ids, np.fromiter(self._added, dtype="int64", count=len(self._added)))
+        return ids
+
+    def all_ids(self) -> np.ndarray:
+        """Position-ordered ids, tombstoned positions included."""
+        if not self._appended:
+            return np.asarray(self._base_ids)
+        return np.concatenate([self._base_ids, np.array(self._appended, dtype="int64")])
+
+    # 2. Mutations
+    def append(self, image_id: int) -> int:
+        position = len(self)
+        self._appended.append(image_id)
+        self._added[image_id] = position
+        return position
+
+    def remove(self, image_id: int) -> int:
+        """Tombstones the live position of `image_id` and returns it."""
+        position = self.position_of(image_id)
+        if position is None:
+            raise KeyError(image_id)
+        self._added.pop(image_id, None)
+        self._removed.add(image_id)
+        self.tombstones.add(position)
+        return position
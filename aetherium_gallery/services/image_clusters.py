@@ -0,0 +1,220 @@
+# aetherium_gallery/services/image_clusters.py
+
+import asyncio
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class ImageClusters:
+    """
+    Groups indexed images into visual clusters with spherical k-means.
+
+    Training runs on a random sample of at most `sample_per_cluster` vectors per
+    centroid, then every vector is assigned to its nearest centroid in batches.
+    Assignments (with each image's similarity to its centroid) and centroids are
+    saved to `path`; a re-run with the same cluster count starts from the saved
+    centroids and needs only `warm_niter` iterations instead of `niter`.
+    """
+
+    def __init__(self, path: Path = Path("./image_clusters.npz"), n_clusters: int = 0, sample_per_cluster: int = 256,
+                 niter: int = 20, warm_niter: int = 5, refresh_drift: float = 0.1, map_grid=None):
+        self.path = Path(path)
+        self.state_path = self.path.with_suffix(".json")
+        self.n_clusters = n_clusters
+        self.sample_per_cluster = sample_per_cluster
+        self.niter = niter
+        self.warm_niter = warm_niter
+        self.refresh_drift = refresh_drift
+        self.map_grid = map_grid
+
+        self.centroids: np.ndarray | None = None
+        self.ids = np.empty(0, dtype="int64")
+        self.labels = np.empty(0, dtype="int32")
+        self.similarities = np.empty(0, dtype="float32")
+        self.report: dict | None = None
+        self._drift, self._drift_version = 0.0, None
+
+        # Job status, reported by to_dict().
+        self.state = "idle"
+        self.error: str | None = None
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self._task: asyncio.Task | None = None
+
+    # 1. Saved state
+    def load(self):
+        if not self.path.exists():
+            return
+        try:
+            with np.load(self.path) as data:
+                self.centroids, self.ids = data["centroids"], data["ids"]
+                self.labels, self.similarities = data["labels"], data["similarities"]
+            if self.state_path.exists():
+                self.report = json.loads(self.state_path.read_text())
+            self._publish()
+            logger.info(f"Loaded {len(self.centroids)} image clusters covering {len(self.ids)} images.")
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable image clusters file {self.path}: {e}")
+
+    def _save(self):
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, centroids=self.centroids, ids=self.ids, labels=self.labels, similarities=self.similarities)
+        os.replace(tmp_path, self.path)
+        tmp_path = self.state_path.with_name(self.state_path.name + ".tmp")
+        tmp_path.write_text(json.dumps(self.report))
+        os.replace(tmp_path, self.state_path)
+
+    def _publish(self):
+        if self.map_grid is not None and len(self.ids):
+            self.map_grid.set_clusters(self.ids, self.labels)
+
+    @property
+    def is_running(self) -> bool:
+        return self.state == "running"
+
+    def to_dict(self) -> dict:
+        return {
+            "state": self.state, "error": self.error,
+            "started_at": self.started_at, "finished_at": self.finished_at,
+            "clusters": 0 if self.centroids is None else len(self.centroids),
+            "images": len(self.ids),
+            "report": self.report,
+        }
+
+    # 2. Clustering
+    def cluster(self, vector_service, n_clusters: int | None = None, warm_start: bool = True) -> dict:
+        """Clusters every indexed vector (blocking; run it in a thread)."""
+        ids = vector_service.live_ids()
+        if len(ids) < 2:
+            raise ValueError("Not enough indexed images to cluster (need at least 2).")
+        k = n_clusters or self.n_clusters or int(np.clip(np.sqrt(len(ids) / 2), 2, 1000))
+        k = min(k, len(ids))
+
+        # 1. Train on a sample, starting from the previous centroids when they fit.
+        #    Only the sampled vectors are copied out of the index.
+        started = time.perf_counter()
+        rng = np.random.default_rng(42)
+        sample_size = min(len(ids), k * self.sample_per_cluster)
+        sample_ids = np.sort(rng.choice(ids, size=sample_size, replace=False)) if sample_size < len(ids) else ids
+        _, sample = vector_service.get_vectors(sample_ids.tolist())
+        if len(sample) < k:
+            raise ValueError("Images were removed from the index while clustering; try again.")
+        d = sample.shape[1]
+        warm = warm_start and self.centroids is not None and self.centroids.shape == (k, d)
+        kmeans = faiss.Kmeans(d, k, niter=self.warm_niter if warm else self.niter, spherical=True, seed=42,
+                              max_points_per_centroid=self.sample_per_cluster)
+        kmeans.train(np.ascontiguousarray(sample, dtype="float32"), init_centroids=self.centroids if warm else None)
+        train_seconds = time.perf_counter() - started
+        del sample
+
+        # 2. Assign every vector to its nearest centroid, fetching them a chunk at a time
+        started = time.perf_counter()
+        index = faiss.IndexFlatIP(d)
+        index.add(kmeans.centroids)
+        found_ids, labels, similarities = [], [], []
+        for start in range(0, len(ids), 65536):
+            chunk_ids, vectors = vector_service.get_vectors(ids[start:start + 65536].tolist())
+            if not chunk_ids: continue
+            found_similarities, found_labels = index.search(np.ascontiguousarray(vectors, dtype="float32"), 1)
+            found_ids.append(np.asarray(chunk_ids, dtype="int64"))
+            labels.append(found_labels[:, 0].astype("int32"))
+            similarities.append(found_similarities[:, 0])
+        if not found_ids:
+            raise ValueError("Images were removed from the index while clustering; try again.")
+        ids, labels, similarities = np.concatenate(found_ids), np.concatenate(labels), np.concatenate(similarities)
+
+        self.centroids, self.ids, self.labels, self.similarities = kmeans.centroids.copy(), ids, labels, similarities
+        self.report = {
+            "clusters": k, "images": len(ids), "sample_size": sample_size,
+            "warm_start": warm, "iterations": self.warm_niter if warm else self.niter,
+            "train_seconds": train_seconds, "assign_seconds": time.perf_counter() - started,
+            "mean_similarity": float(similarities.mean()),
+            "fitted_at": time.time(),
+        }
+        self._drift_version = None
+        self._save()
+        self._publish()
+        logger.info(f"Clustered {len(ids)} images into {k} clusters "
+                    f"({'warm start' if warm else 'cold start'}, {train_seconds:.1f}s training).")
+        return self.report
+
+    def start(self, vector_service, n_clusters: int | None = None, warm_start: bool = True) -> asyncio.Task:
+        """Starts run() in the background, keeping a reference so the task is not garbage-collected."""
+        self.state = "running"
+        self._task = asyncio.create_task(self.run(vector_service, n_clusters, warm_start))
+        return self._task
+
+    def cancel(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+    async def run(self, vector_service, n_clusters: int | None = None, warm_start: bool = True) -> dict:
+        self.state, self.error, self.started_at, self.finished_at = "running", None, time.time(), None
+        try:
+            await asyncio.to_thread(self.cluster, vector_service, n_clusters, warm_start)
+            self.state = "completed"
+        except Exception as e:
+            self.state, self.error = "failed", str(e)
+            logger.error(f"Image clustering failed: {e}", exc_info=True)
+        finally:
+            self.finished_at = time.time()
+        return self.to_dict()
+
+    def drift(self, vector_service) -> float:
+        """Images added to or removed from the index since the last clustering, relative to its size."""
+        if not len(self.ids):
+            return float("inf")
+        if self._drift_version != vector_service.version:
+            live = vector_service.live_ids()
+            self._drift = len(np.setxor1d(live, self.ids, assume_unique=True)) / len(self.ids)
+            self._drift_version = vector_service.version
+        return self._drift
+
+    async def maintain_forever(self, vector_service, interval_seconds: float, min_images: int = 100):
+        """
+        Background loop: clusters the index once it holds `min_images` vectors,
+        then re-clusters (warm-started) whenever drift passes `refresh_drift`.
+        A failed run is not retried automatically.
+        """
+        await asyncio.to_thread(self.load)
+        while True:
+            try:
+                live = vector_service.index.ntotal - len(vector_service.tombstones)
+                if (self.state not in ("running", "failed") and live >= min_images
+                        and self.drift(vector_service) > self.refresh_drift):
+                    await self.run(vector_service)
+            except Exception as e:
+                logger.error(f"Image cluster maintenance failed: {e}", exc_info=True)
+            await asyncio.sleep(interval_seconds)
+
+    # 3. Suggested albums
+    def suggestions(self, unsorted_ids, min_size: int = 5, limit: int = 20) -> list[dict]:
+        """
+        Clusters with at least `min_size` of the given (unsorted) images, largest
+        first: {cluster_id, size, cohesion, image_ids (most central first)}.
+        """
+        if self.centroids is None or not len(self.ids):
+            return []
+        unsorted = np.isin(self.ids, np.asarray(list(unsorted_ids), dtype="int64"))
+        labels, ids, similarities = self.labels[unsorted], self.ids[unsorted], self.similarities[unsorted]
+        sizes = np.bincount(labels, minlength=len(self.centroids))
+        cohesion = np.bincount(labels, weights=similarities, minlength=len(self.centroids)) / np.maximum(sizes, 1)
+
+        suggestions = []
+        for cluster_id in np.argsort(-sizes, kind="stable"):
+            if sizes[cluster_id] < min_size or len(suggestions) >= limit: break
+            rows = np.flatnonzero(labels == cluster_id)
+            rows = rows[np.argsort(-similarities[rows], kind="stable")]
+            suggestions.append({
+                "cluster_id": int(cluster_id), "size": int(sizes[cluster_id]),
+                "cohesion": float(cohesion[cluster_id]), "image_ids": ids[rows].tolist(),
+            })
+        return suggestions
@@ -0,0 +1,284 @@
+# aetherium_gallery/services/index_factory.py
+
+import logging
+import math
+import time
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+STORAGE_MODES = ("float32", "fp16", "sq8", "pq")
+
+_SQ_TYPES = {"fp16": faiss.ScalarQuantizer.QT_fp16, "sq8": faiss.ScalarQuantizer.QT_8bit}
+
+# Vectors are added in chunks so building a large index does not need a second full copy.
+_ADD_CHUNK = 65536
+
+def default_nlist(n_vectors: int) -> int:
+    """FAISS rule of thumb: ~4*sqrt(N) inverted lists, with at least ~39 training points per list."""
+    return max(1, min(int(4 * math.sqrt(max(n_vectors, 1))), n_vectors // 39 or 1))
+
+def index_spec(index_type: str, storage: str) -> tuple[str, str]:
+    """Normalizes an (index type, storage) pair: IVF with PQ codes is always "ivf_pq"."""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown vector index type '{index_type}'. Expected one of {INDEX_TYPES}.")
+    if storage not in STORAGE_MODES:
+        raise ValueError(f"Unknown vector storage mode '{storage}'. Expected one of {STORAGE_MODES}.")
+    if index_type == "ivf_pq" or (index_type == "ivf_flat" and storage == "pq"):
+        return "ivf_pq", "pq"
+    return index_type, storage
+
+def build_index(
+    index_type: str,
+    dim: int,
+    n_vectors: int = 0,
+    storage: str = "float32",
+    nlist: int = 0,
+    pq_m: int = 64,
+    hnsw_m: int = 32,
+) -> faiss.Index:
+    """
+    Creates an empty inner-product index of the requested type, storing vectors
+    as float32, float16, 8-bit scalar-quantized or product-quantized codes.
+    IVF variants size their coarse quantizer from `n_vectors` unless `nlist` is
+    given explicitly. "ivf_pq" always stores PQ codes.
+    """
+    index_type, storage = index_spec(index_type, storage)
+    if storage == "pq" and dim % pq_m:
+        raise ValueError(f"VECTOR_PQ_M={pq_m} must divide the embedding dimension {dim}.")
+
+    ip = faiss.METRIC_INNER_PRODUCT
+    if index_type == "flat":
+        if storage == "pq":
+            return faiss.IndexPQ(dim, pq_m, 8, ip)
+        if storage in _SQ_TYPES:
+            return faiss.IndexScalarQuantizer(dim, _SQ_TYPES[storage], ip)
+        return faiss.IndexFlatIP(dim)
+    if index_type == "hnsw":
+        if storage == "pq":
+            return faiss.IndexHNSWPQ(dim, pq_m, hnsw_m, 8, ip)
+        if storage in _SQ_TYPES:
+            return faiss.IndexHNSWSQ(dim, _SQ_TYPES[storage], hnsw_m, ip)
+        return faiss.IndexHNSWFlat(dim, hnsw_m, ip)
+
+    nlist = nlist or default_nlist(n_vectors)
+    quantizer = faiss.IndexFlatIP(dim)
+    if storage == "pq":
+        return faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, 8, ip)
+    if storage in _SQ_TYPES:
+        return faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, _SQ_TYPES[storage], ip)
+    return faiss.IndexIVFFlat(quantizer, dim, nlist, ip)
+
+def describe_index(index: faiss.Index) -> tuple[str, str]:
+    """Maps a FAISS index object back to its (INDEX_TYPES, STORAGE_MODES) names."""
+    if isinstance(index, faiss.IndexHNSW):
+        index_type, codes = "hnsw", faiss.downcast_index(index.storage)
+    elif isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq", "pq"
+    elif isinstance(index, faiss.IndexIVF):
+        index_type, codes = "ivf_flat", index
+    else:
+        index_type, codes = "flat", index
+
+    if isinstance(codes, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return index_type, "pq"
+    if isinstance(codes, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return index_type, "fp16" if codes.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    return index_type, "float32"
+
+def read_index(path, mmap: bool = True) -> faiss.Index:
+    """
+    Loads an index file. With `mmap`, the vector codes (flat, SQ, PQ, HNSW
+    storage and IVF lists) are mapped from the file instead of copied into RAM,
+    so loading is O(1) and forked workers share the pages. A mapped index is
+    read-only: call materialize() before adding to it.
+    """
+    return faiss.read_index(str(path), faiss.IO_FLAG_MMAP_IFC if mmap else 0)
+
+def materialize(index: faiss.Index) -> faiss.Index:
+    """Returns an in-memory, writable copy of a memory-mapped index."""
+    return faiss.deserialize_index(faiss.serialize_index(index))
+
+def configure_search(index: faiss.Index, nprobe: int, ef_search: int) -> faiss.Index:
+    """Applies the query-time knobs and enables reconstruct() on IVF indexes."""
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = min(nprobe, index.nlist)
+        if index.direct_map.type == faiss.DirectMap.NoMap:
+            index.make_direct_map()
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search
+    return index
+
+def search_parameters(index: faiss.Index, selector, nprobe: int, ef_search: int):
+    """
+    Builds per-query SearchParameters carrying an IDSelector. The typed variants
+    are needed because a bare parameters object would reset nprobe / efSearch
+    to FAISS's defaults for that query.
+    """
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=min(nprobe, index.nlist))
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=ef_search)
+    return faiss.SearchParameters(sel=selector)
+
+def accepts_search_parameters(index: faiss.Index) -> bool:
+    """IndexPQ's exhaustive search rejects any SearchParameters, so it cannot take an IDSelector."""
+    return not isinstance(index, faiss.IndexPQ)
+
+def search_post_filtered(index: faiss.Index, queries: np.ndarray, k: int, admitted: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Filtered search for an index that takes no IDSelector: over-fetches, drops
+    positions whose `admitted` flag is False and keeps each row's best k
+    survivors, fetching more until every row has k or the index is exhausted.
+    """
+    n_admitted = max(int(admitted.sum()), 1)
+    # Expect admitted positions among the candidates at their rate in the index, with 2x headroom.
+    fetch = min(index.ntotal, max(k, 2 * k * index.ntotal // n_admitted))
+    while True:
+        distances, indices = index.search(queries, fetch)
+        keep = indices >= 0
+        keep[keep] = admitted[indices[keep]]
+        if fetch >= index.ntotal or (keep.sum(axis=1) >= k).all():
+            break
+        fetch = min(index.ntotal, fetch * 4)
+
+    out_distances = np.full((len(queries), k), -np.inf, dtype="float32")
+    out_indices = np.full((len(queries), k), -1, dtype="int64")
+    for row in range(len(queries)):
+        found = np.flatnonzero(keep[row])[:k]
+        out_distances[row, :len(found)] = distances[row, found]
+        out_indices[row, :len(found)] = indices[row, found]
+    return out_distances, out_indices
+
+def populate_index(index: faiss.Index, vectors: np.ndarray) -> faiss.Index:
+    """Trains the index if it needs it and adds `vectors` in chunks."""
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    if not index.is_trained:
+        logger.info(f"Training {type(index).__name__} on {len(vectors)} vectors...")
+        index.train(vectors)
+    for start in range(0, len(vectors), _ADD_CHUNK):
+        index.add(vectors[start:start + _ADD_CHUNK])
+    return index
+
+def recall_latency_report(
+    vectors: np.ndarray,
+    k: int = 10,
+    n_queries: int = 200,
+    nprobes: tuple = (1, 4, 16, 64),
+    ef_searches: tuple = (16, 32, 64, 128),
+    pq_m: int = 64,
+    hnsw_m: int = 32,
+    seed: int = 42,
+) -> dict:
+    """
+    Measures recall@k and per-query latency of each ANN index type against the
+    exact IndexFlatIP result, for a sweep of nprobe / efSearch values. Queries
+    are sampled from the indexed vectors themselves.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n, dim = vectors.shape
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.choice(n, size=min(n_queries, n), replace=False)]
+    k = min(k, n)
+
+    def timed_search(index):
+        started = time.perf_counter()
+        _, found = index.search(queries, k)
+        return found, (time.perf_counter() - started) * 1000.0 / len(queries)
+
+    exact = populate_index(build_index("flat", dim), vectors)
+    truth, exact_ms = timed_search(exact)
+    truth_sets = [set(row) for row in truth]
+
+    def recall(found) -> float:
+        return float(np.mean([len(truth_sets[i] & set(row)) / k for i, row in enumerate(found)]))
+
+    rows = [{"index_type": "flat", "param": None, "recall": 1.0, "latency_ms": exact_ms, "build_seconds": 0.0}]
+    for index_type in ("ivf_flat", "ivf_pq", "hnsw"):
+        if index_type == "ivf_pq" and dim % pq_m:
+            continue
+        started = time.perf_counter()
+        index = populate_index(build_index(index_type, dim, n, pq_m=pq_m, hnsw_m=hnsw_m), vectors)
+        build_seconds = time.perf_counter() - started
+
+        sweep = ef_searches if index_type == "hnsw" else nprobes
+        for value in sweep:
+            configure_search(index, nprobe=value, ef_search=value)
+            found, latency_ms = timed_search(index)
+            rows.append({
+                "index_type": index_type,
+                "param": {"ef_search": value} if index_type == "hnsw" else {"nprobe": value},
+                "recall": recall(found),
+                "latency_ms": latency_ms,
+                "build_seconds": build_seconds,
+            })
+
+    return {"vectors": n, "queries": len(queries), "k": k, "results": rows}
+
+def rerank_exact(queries: np.ndarray, candidates: np.ndarray, exact_vectors, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Re-scores each query's candidate positions with exact inner products and
+    keeps the best k. `exact_vectors(positions)` returns the float32 rows for
+    the given positions. Missing slots are padded with -1 like FAISS does.
+    """
+    distances = np.full((len(queries), k), -np.inf, dtype="float32")
+    labels = np.full((len(queries), k), -1, dtype="int64")
+    for row, (query, found) in enumerate(zip(queries, candidates)):
+        found = found[found >= 0]
+        if len(found) == 0: continue
+        scores = exact_vectors(found) @ query
+        best = np.argsort(-scores)[:k]
+        distances[row, :len(best)] = scores[best]
+        labels[row, :len(best)] = found[best]
+    return distances, labels
+
+def storage_report(
+    vectors: np.ndarray,
+    k: int = 10,
+    n_queries: int = 200,
+    pq_m: int = 64,
+    rerank_factor: int = 4,
+    seed: int = 42,
+) -> dict:
+    """
+    Compares each storage mode on an exhaustive index: bytes per vector, memory
+    saved versus float32, and recall@k lost versus the exact float32 result.
+    PQ is also measured with an exact rerank of its top k * rerank_factor.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n, dim = vectors.shape
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.choice(n, size=min(n_queries, n), replace=False)]
+    k = min(k, n)
+
+    _, truth = populate_index(build_index("flat", dim), vectors).search(queries, k)
+    truth_sets = [set(row) for row in truth]
+
+    def recall(found) -> float:
+        return float(np.mean([len(truth_sets[i] & set(row)) / k for i, row in enumerate(found)]))
+
+    float32_bytes = dim * 4
+    rows = []
+    for storage in STORAGE_MODES:
+        if storage == "pq" and dim % pq_m:
+            continue
+        index = populate_index(build_index("flat", dim, storage=storage, pq_m=pq_m), vectors)
+        bytes_per_vector = index.sa_code_size()
+        _, found = index.search(queries, k)
+        row = {
+            "storage": storage,
+            "bytes_per_vector": bytes_per_vector,
+            "memory_saved_pct": 100.0 * (1 - bytes_per_vector / float32_bytes),
+            "recall": recall(found),
+        }
+        if storage == "pq":
+            _, candidates = index.search(queries, min(k * rerank_factor, n))
+            _, reranked = rerank_exact(queries, candidates, lambda positions: vectors[positions], k)
+            row["recall_with_rerank"] = recall(reranked)
+        row["recall_lost"] = 1.0 - row.get("recall_with_rerank", row["recall"])
+        rows.append(row)
+
+    return {"vectors": n, "queries": len(queries), "k": k, "results": rows}
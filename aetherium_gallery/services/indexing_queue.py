@@ -0,0 +1,134 @@
+# aetherium_gallery/services/indexing_queue.py
+
+import logging
+import math
+import queue
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+# Per-image statuses reported by status().
+QUEUED, INDEXING, INDEXED, FAILED = "queued", "indexing", "indexed", "failed"
+NOT_QUEUED_ERROR = "The indexing queue was full; POST /api/tasks/reindex indexes it."
+
+class IndexingQueue:
+    """
+    Bounded background queue that embeds and indexes uploaded images.
+
+    Uploads return as soon as the DB row and thumbnail exist; a small pool of
+    worker threads feeds the images to `vector_service.add_image`, where
+    concurrent workers share the embedding engine's batches. When the queue is
+    full, submit() refuses new work so the upload endpoint can answer 429.
+    """
+
+    def __init__(self, vector_service, max_size: int = 256, workers: int = 4, status_history: int = 10000):
+        self.vector_service = vector_service
+        self.max_size = max(1, max_size)
+        self._queue: queue.Queue = queue.Queue(maxsize=self.max_size)
+        self._status_lock = threading.Lock()
+        # Most recent statuses only, so the map cannot grow without bound.
+        self._statuses: OrderedDict[int, dict] = OrderedDict()
+        self._status_history = status_history
+        self._indexed = 0
+        self._failed = 0
+        self._busy_seconds = 0.0
+
+        self._workers = [
+            threading.Thread(target=self._run, name=f"indexing-worker-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for worker in self._workers:
+            worker.start()
+        logger.info(f"Indexing queue started (max_size={self.max_size}, workers={len(self._workers)}).")
+
+    # 1. Public API
+    def is_full(self) -> bool:
+        return self._queue.full()
+
+    def submit(self, image_id: int, image_path: Path) -> bool:
+        """
+        Queues an image for indexing without blocking. Returns False if the
+        queue is full; the image is then reported as failed, with the reason,
+        until a reindex adds it.
+        """
+        # Set before the put: a worker may take the image and move it past QUEUED straight away.
+        self._set_status(image_id, QUEUED)
+        try:
+            self._queue.put_nowait((image_id, image_path))
+        except queue.Full:
+            self._set_status(image_id, FAILED, NOT_QUEUED_ERROR)
+            return False
+        return True
+
+    def status(self, image_id: int) -> dict | None:
+        with self._status_lock:
+            status = self._statuses.get(image_id)
+            return dict(status) if status else None
+
+    def retry_after_seconds(self) -> int:
+        """Rough time for the current backlog to drain, for the Retry-After header."""
+        with self._status_lock:
+            done = self._indexed + self._failed
+            seconds_per_image = self._busy_seconds / done if done else 1.0
+        return max(1, math.ceil(self._queue.qsize() * seconds_per_image / len(self._workers)))
+
+    def get_stats(self) -> dict:
+        with self._status_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_size": self.max_size,
+                "workers": len(self._workers),
+                "indexed": self._indexed,
+                "failed": self._failed,
+            }
+
+    def shutdown(self):
+        """Stops the workers after their current image. Images still queued are left unindexed."""
+        pending = self._queue.qsize()
+        if pending:
+            logger.warning(f"Indexing queue shutting down with {pending} images not yet indexed.")
+        # Drain so the stop sentinels fit in a full queue.
+        try:
+            while True: self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        for _ in self._workers:
+            self._queue.put(_STOP)
+        for worker in self._workers:
+            worker.join(timeout=5)
+
+    # 2. Worker loop
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+
+            image_id, image_path = item
+            self._set_status(image_id, INDEXING)
+            started = time.perf_counter()
+            try:
+                indexed = self.vector_service.add_image(image_id=image_id, image_path=image_path)
+                error = None if indexed else "Embedding failed; see the server log."
+            except Exception as e:
+                logger.error(f"Background indexing of image {image_id} failed: {e}", exc_info=True)
+                indexed, error = False, str(e)
+            elapsed = time.perf_counter() - started
+
+            with self._status_lock:
+                self._busy_seconds += elapsed
+                if indexed: self._indexed += 1
+                else: self._failed += 1
+            self._set_status(image_id, INDEXED if indexed else FAILED, error)
+
+    def _set_status(self, image_id: int, status: str, error: str | None = None):
+        with self._status_lock:
+            self._statuses.pop(image_id, None)
+            self._statuses[image_id] = {"status": status, "error": error, "updated_at": time.time()}
+            while len(self._statuses) > self._status_history:
+                self._statuses.popitem(last=False)
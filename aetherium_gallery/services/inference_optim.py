@@ -0,0 +1,115 @@
+# aetherium_gallery/services/inference_optim.py
+
+import logging
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+logger = logging.getLogger(__name__)
+
+COMPILE_MODES = ("none", "torch_compile", "torchscript")
+
+class FastImagePreprocessor:
+    """
+    Drop-in replacement for the DINOv2 AutoImageProcessor that does the
+    resize / center-crop / normalize in torch instead of per-image PIL + numpy.
+    Reads its sizes and statistics from the original processor, and accepts the
+    same `processor(images=..., return_tensors="pt")` call.
+    """
+
+    def __init__(self, processor):
+        size = getattr(processor, "size", None) or {}
+        crop_size = getattr(processor, "crop_size", None) or {}
+        self.shortest_edge = size.get("shortest_edge", 256)
+        self.crop_height = crop_size.get("height", 224)
+        self.crop_width = crop_size.get("width", 224)
+        self.rescale_factor = getattr(processor, "rescale_factor", 1 / 255)
+        self.mean = torch.tensor(processor.image_mean, dtype=torch.float32).view(1, 3, 1, 1)
+        self.std = torch.tensor(processor.image_std, dtype=torch.float32).view(1, 3, 1, 1)
+
+    def __call__(self, images, return_tensors: str = "pt") -> dict:
+        batch = torch.stack([self._resize_and_crop(image) for image in images])
+        pixel_values = (batch * self.rescale_factor - self.mean) / self.std
+        return {"pixel_values": pixel_values}
+
+    def _resize_and_crop(self, image) -> torch.Tensor:
+        # A cheap box reduce first, so very large uploads are not interpolated at full size.
+        factor = min(image.size) // (2 * self.shortest_edge)
+        if factor > 1:
+            image = image.reduce(factor)
+
+        pixels = torch.from_numpy(np.array(image, dtype=np.uint8)).permute(2, 0, 1).float()
+        height, width = pixels.shape[1:]
+        scale = self.shortest_edge / min(height, width)
+        if height <= width:
+            new_size = (self.shortest_edge, int(width * scale))
+        else:
+            new_size = (int(height * scale), self.shortest_edge)
+        resized = F.interpolate(pixels[None], size=new_size, mode="bicubic", antialias=True, align_corners=False)[0]
+
+        top = (new_size[0] - self.crop_height) // 2
+        left = (new_size[1] - self.crop_width) // 2
+        return resized[:, top:top + self.crop_height, left:left + self.crop_width].clamp_(0, 255)
+
+class _LastHiddenState(torch.nn.Module):
+    """Tensor-in, tensor-out wrapper so the HF model can be traced."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model(pixel_values=pixel_values).last_hidden_state
+
+class _TracedModel:
+    """Calls a traced model with the HF keyword interface and output shape the engine expects."""
+
+    def __init__(self, traced):
+        self.traced = traced
+
+    def __call__(self, pixel_values):
+        return SimpleNamespace(last_hidden_state=self.traced(pixel_values))
+
+def optimize_model(model, quantize: bool = False, compile_mode: str = "none", example_inputs: dict | None = None):
+    """
+    Returns an inference-optimized version of `model`: linear layers dynamically
+    quantized to int8 and/or the graph compiled with torch.compile or TorchScript.
+    Each step that fails is logged and skipped, so the worst case is the eager
+    fp32 model.
+    """
+    if compile_mode not in COMPILE_MODES:
+        raise ValueError(f"Unknown compile mode '{compile_mode}'. Expected one of {COMPILE_MODES}.")
+    model.eval()
+
+    if quantize:
+        try:
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            logger.info("Embedding model linear layers quantized to int8.")
+        except Exception as e:
+            logger.warning(f"Dynamic quantization failed, keeping fp32 weights: {e}")
+
+    if compile_mode == "torch_compile":
+        try:
+            model = torch.compile(model)
+            logger.info("Embedding model wrapped with torch.compile (compiled on first batch).")
+        except Exception as e:
+            logger.warning(f"torch.compile failed, running eagerly: {e}")
+    elif compile_mode == "torchscript":
+        if example_inputs is None:
+            raise ValueError("TorchScript export needs example_inputs to trace with.")
+        try:
+            with torch.no_grad():
+                traced = torch.jit.trace(_LastHiddenState(model), example_inputs["pixel_values"], check_trace=False)
+            model = _TracedModel(traced.eval())
+            logger.info("Embedding model exported to TorchScript.")
+        except Exception as e:
+            logger.warning(f"TorchScript export failed, running eagerly: {e}")
+    return model
+
+def set_num_threads(num_threads: int):
+    """Pins torch's intra-op thread pool; 0 keeps torch's default (one per core)."""
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+        logger.info(f"torch intra-op threads set to {num_threads}.")
@@ -0,0 +1,242 @@
+# aetherium_gallery/services/knn_graph.py
+
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class KnnGraph:
+    """
+    Precomputed k-nearest-neighbour graph over every indexed image.
+
+    Stored as three aligned arrays: the sorted image ids, their k neighbour ids
+    (int32, -1 padded) and the cosine similarities (float16), about 6 bytes per
+    edge. Reads are a binary search plus a row slice, so "related" views never
+    touch the index. update() keeps it current incrementally: rows for new
+    images are searched, and only rows that lost a neighbour to a deletion or
+    may gain one of the new images are recomputed.
+    """
+
+    def __init__(self, path: Path = Path("./knn_graph.npz"), k: int = 32, search_batch: int = 1024,
+                 reverse_factor: int = 16):
+        self.path = Path(path)
+        self.k = k
+        self.search_batch = search_batch
+        # How far down a new image's own results update() looks for rows it may enter.
+        self.reverse_factor = reverse_factor
+        # (ids, neighbours, scores) is swapped as one tuple, so readers never see a half-updated graph.
+        self._data = (np.empty(0, dtype="int64"), np.empty((0, k), dtype="int32"), np.empty((0, k), dtype="float16"))
+        self.built_version: int | None = None
+        self.built_at: float | None = None
+
+    @classmethod
+    def load_or_empty(cls, path: Path = Path("./knn_graph.npz"), k: int = 32) -> "KnnGraph":
+        graph = cls(path, k)
+        if graph.path.exists():
+            try:
+                with np.load(graph.path) as saved:
+                    data = (saved["ids"], saved["neighbours"], saved["scores"])
+                if data[1].shape[1] != k:
+                    raise ValueError(f"graph was built with k={data[1].shape[1]}, KNN_GRAPH_K is {k}")
+                graph._data = data
+                graph.built_at = graph.path.stat().st_mtime
+                logger.info(f"Loaded kNN graph with {len(data[0])} images from {graph.path}.")
+            except Exception as e:
+                logger.error(f"Could not load kNN graph from {graph.path}, it will be rebuilt: {e}")
+        return graph
+
+    # 1. Reads
+    def __len__(self) -> int:
+        return len(self._data[0])
+
+    def neighbours(self, image_id: int, n_results: int = 12, similarity_threshold: float = 0.0,
+                   id_filter=None) -> list[int] | None:
+        """
+        Nearest image ids for `image_id`, best first, or None if it is not in the
+        graph yet. With `id_filter`, only neighbours it allows are returned.
+        """
+        ids, neighbours, scores = self._data
+        row = np.searchsorted(ids, image_id)
+        if row >= len(ids) or ids[row] != image_id:
+            return None
+        keep = (neighbours[row] >= 0) & (scores[row] >= similarity_threshold)
+        if id_filter is not None:
+            candidates = neighbours[row]
+            in_range = (candidates >= 0) & (candidates < len(id_filter.mask))
+            keep &= in_range
+            keep[in_range] &= id_filter.mask[candidates[in_range]]
+        return neighbours[row][keep][:n_results].tolist()
+
+    def near_duplicate_clusters(self, similarity_threshold: float = 0.95, min_size: int = 2) -> list[dict]:
+        """Connected components of the graph restricted to edges at or above the threshold, largest first."""
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import connected_components
+
+        ids, neighbours, scores = self._data
+        if len(ids) == 0: return []
+        rows, cols = np.nonzero((neighbours >= 0) & (scores >= similarity_threshold))
+        targets = np.searchsorted(ids, neighbours[rows, cols])
+        found = (targets < len(ids)) & (ids[np.minimum(targets, len(ids) - 1)] == neighbours[rows, cols])
+        rows, targets, edge_scores = rows[found], targets[found], scores[rows[found], cols[found]]
+
+        adjacency = coo_matrix((np.ones(len(rows), dtype=bool), (rows, targets)), shape=(len(ids), len(ids)))
+        n_components, labels = connected_components(adjacency, directed=False)
+        sizes = np.bincount(labels, minlength=n_components)
+
+        clusters = []
+        for label in np.flatnonzero(sizes >= min_size):
+            members = np.flatnonzero(labels == label)
+            in_cluster = labels[rows] == label
+            clusters.append({
+                "image_ids": ids[members].tolist(),
+                "size": len(members),
+                "min_similarity": float(edge_scores[in_cluster].min()),
+                "max_similarity": float(edge_scores[in_cluster].max()),
+            })
+        clusters.sort(key=lambda c: -c["size"])
+        return clusters
+
+    def umap_knn(self, image_ids: list[int], n_neighbors: int) -> tuple[np.ndarray, np.ndarray] | None:
+        """
+        The graph in UMAP's `precomputed_knn` layout for points ordered as
+        `image_ids`: row indices (self first) and cosine distances. Returns None
+        unless every point and all of its first n_neighbors - 1 neighbours are
+        present in the graph.
+        """
+        ids, neighbours, scores = self._data
+        if n_neighbors - 1 > self.k or len(ids) == 0: return None
+        order = np.asarray(image_ids, dtype="int64")
+        rows = np.searchsorted(ids, order)
+        if np.any(rows >= len(ids)) or np.any(ids[np.minimum(rows, len(ids) - 1)] != order):
+            return None
+
+        # Map neighbour ids to point indices with a sorted lookup.
+        nearest = neighbours[rows, :n_neighbors - 1].astype("int64")
+        by_id = np.argsort(order)
+        slots = np.minimum(np.searchsorted(order[by_id], nearest), len(order) - 1)
+        if np.any(order[by_id][slots] != nearest):
+            return None
+        indices = by_id[slots]
+        indices = np.hstack([np.arange(len(order), dtype="int64")[:, None], indices])
+        distances = np.hstack([np.zeros((len(order), 1), dtype="float32"), 1.0 - scores[rows, :n_neighbors - 1].astype("float32")])
+        return indices, np.maximum(distances, 0.0)
+
+    def get_stats(self) -> dict:
+        ids, neighbours, _ = self._data
+        return {
+            "images": len(ids),
+            "k": self.k,
+            "edges": int((neighbours >= 0).sum()),
+            "bytes": int(sum(a.nbytes for a in self._data)),
+            "built_version": self.built_version,
+            "built_at": self.built_at,
+        }
+
+    # 2. Building and maintenance
+    def build(self, vector_service):
+        """Recomputes every row with batched searches."""
+        started = time.perf_counter()
+        version = vector_service.version
+        ids = vector_service.live_ids()
+        neighbours, scores = self._search_rows(vector_service, ids)
+        self._commit((ids, neighbours, scores), version)
+        logger.info(f"Built kNN graph for {len(ids)} images (k={self.k}) in {time.perf_counter() - started:.1f}s.")
+
+    def update(self, vector_service):
+        """Brings the graph in line with the index, recomputing only the affected rows."""
+        version = vector_service.version
+        old_ids, old_neighbours, old_scores = self._data
+        live = vector_service.live_ids()
+        added = np.setdiff1d(live, old_ids)
+        removed = np.setdiff1d(old_ids, live)
+        if len(added) == 0 and len(removed) == 0:
+            self.built_version = version
+            return
+        # Past this much churn a full rebuild is about as cheap and simpler.
+        if len(old_ids) == 0 or len(added) + len(removed) > 0.25 * len(old_ids):
+            return self.build(vector_service)
+
+        started = time.perf_counter()
+        keep = ~np.isin(old_ids, removed)
+        ids, neighbours, scores = old_ids[keep], old_neighbours[keep], old_scores[keep]
+
+        added_neighbours, added_scores = self._search_rows(vector_service, added)
+        lost_a_neighbour = np.isin(neighbours, removed).any(axis=1)
+        refresh = np.flatnonzero(lost_a_neighbour | self._gains_a_neighbour(vector_service, ids, neighbours, scores, added))
+        if len(refresh):
+            neighbours[refresh], scores[refresh] = self._search_rows(vector_service, ids[refresh])
+
+        ids = np.concatenate([ids, added])
+        order = np.argsort(ids, kind="stable")
+        data = (ids[order], np.vstack([neighbours, added_neighbours])[order], np.vstack([scores, added_scores])[order])
+        self._commit(data, version)
+        logger.info(f"Updated kNN graph: +{len(added)} / -{len(removed)} images, {len(refresh)} rows refreshed "
+                    f"in {time.perf_counter() - started:.1f}s.")
+
+    def _gains_a_neighbour(self, vector_service, ids: np.ndarray, neighbours: np.ndarray, scores: np.ndarray,
+                           added: np.ndarray) -> np.ndarray:
+        """
+        Rows that one of the `added` images would enter: its similarity beats the
+        row's current k-th score. kNN is not symmetric, so the candidates are each
+        added image's top k * reverse_factor results rather than its k neighbours;
+        only those rows are checked, never the whole gallery.
+        """
+        # Rows with empty slots take any new image.
+        gains = neighbours[:, -1] < 0
+        kth_scores = scores[:, -1].astype("float32")
+        for start in range(0, len(added), self.search_batch):
+            found, vectors = vector_service.get_vectors(added[start:start + self.search_batch].tolist())
+            if not found: continue
+            found_scores, found_ids = vector_service.search(vectors, self.k * self.reverse_factor)
+            rows = np.minimum(np.searchsorted(ids, found_ids), len(ids) - 1)
+            # Other added images (and -1 padding) have no row yet.
+            hits = (found_ids >= 0) & (ids[rows] == found_ids)
+            hits[hits] = found_scores[hits] > kth_scores[rows[hits]]
+            gains[rows[hits]] = True
+        return gains
+
+    def _search_rows(self, vector_service, ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """k neighbours (excluding the image itself) for each of the sorted `ids`, searched in batches."""
+        neighbours = np.full((len(ids), self.k), -1, dtype="int32")
+        scores = np.zeros((len(ids), self.k), dtype="float16")
+        for start in range(0, len(ids), self.search_batch):
+            chunk = ids[start:start + self.search_batch]
+            found, vectors = vector_service.get_vectors(chunk.tolist())
+            if not found: continue
+            found = np.asarray(found, dtype="int64")
+            found_scores, found_ids = vector_service.search(vectors, self.k + 1)
+
+            # Push the query itself and empty slots to the end, keeping the order of the rest.
+            drop = (found_ids == found[:, None]) | (found_ids < 0)
+            order = np.argsort(drop, axis=1, kind="stable")[:, :self.k]
+            rows = start + np.searchsorted(chunk, found)
+            valid = ~np.take_along_axis(drop, order, axis=1)
+            neighbours[rows] = np.where(valid, np.take_along_axis(found_ids, order, axis=1), -1)
+            scores[rows] = np.where(valid, np.take_along_axis(found_scores, order, axis=1), 0.0)
+        return neighbours, scores
+
+    def _commit(self, data: tuple, version: int):
+        self._data = data
+        self.built_version = version
+        self.built_at = time.time()
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, ids=data[0], neighbours=data[1], scores=data[2])
+        os.replace(tmp_path, self.path)
+
+async def maintain_forever(graph: KnnGraph, vector_service, interval_seconds: float):
+    """Background loop: refreshes the graph whenever the index has changed since the last pass."""
+    from fastapi.concurrency import run_in_threadpool
+
+    while True:
+        try:
+            if graph.built_version != vector_service.version:
+                await run_in_threadpool(graph.update, vector_service)
+        except Exception as e:
+            logger.error(f"kNN graph maintenance failed: {e}", exc_info=True)
+        await asyncio.sleep(interval_seconds)
@@ -0,0 +1,210 @@
+# aetherium_gallery/services/map_atlas.py
+
+import asyncio
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from ..core.config import settings
+from ..core.database import AsyncSessionFactory
+from ..features.images import service as image_service
+
+logger = logging.getLogger(__name__)
+
+class MapAtlas:
+    """
+    Thumbnail sprite sheets for the Constellation Map.
+
+    The map is cut into `tiles_per_side`² spatial tiles. Each tile's points get
+    a square `sprite_size` thumbnail packed, in order, into WEBP sheets of
+    `sheet_side`² sprites, and a tile_{tx}_{ty}.json listing the image ids (and
+    names) in sprite order: sprite i sits on sheet i // sheet_side², at column
+    i % sheet_side and row (i // sheet_side) % sheet_side. atlas.json describes
+    the tiling and each tile's revision, for cache-busting.
+
+    refresh() is incremental: a tile that only gained points gets them appended
+    to its last sheet; a tile that lost points is repacked; untouched tiles are
+    left alone. A new map fit re-tiles everything.
+    """
+
+    def __init__(self, root: Path, tiles_per_side: int = 8, sprite_size: int = 64, sheet_side: int = 32):
+        self.root = Path(root)
+        self.tiles_per_side = tiles_per_side
+        self.sprite_size = sprite_size
+        self.sheet_side = sheet_side
+        self.index_path = self.root / "atlas.json"
+        self.index = self._load_index()
+        self.built_for = None
+
+    @property
+    def sprites_per_sheet(self) -> int:
+        return self.sheet_side ** 2
+
+    @property
+    def url(self) -> str:
+        return f"/{settings.UPLOAD_FOLDER}/{self.root.relative_to(settings.UPLOAD_PATH).as_posix()}"
+
+    def _load_index(self) -> dict:
+        if self.index_path.exists():
+            try:
+                index = json.loads(self.index_path.read_text())
+                if (index.get("tiles_per_side"), index.get("sprite_size"), index.get("sheet_side")) == \
+                        (self.tiles_per_side, self.sprite_size, self.sheet_side):
+                    return index
+                logger.info("Map atlas settings changed; it will be rebuilt.")
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable map atlas index {self.index_path}: {e}")
+        return {"tiles_per_side": self.tiles_per_side, "sprite_size": self.sprite_size,
+                "sheet_side": self.sheet_side, "bounds": None, "fitted_at": None, "tiles": {}}
+
+    def to_dict(self) -> dict:
+        return {**self.index, "url": self.url}
+
+    # 1. Building
+    async def refresh(self, key=None, fitted_at: float | None = None):
+        """Brings the atlas in line with the plotted points, unless already built for `key`."""
+        if key is not None and key == self.built_for:
+            return
+        async with AsyncSessionFactory() as db:
+            rows = await image_service.get_map_sprite_rows(db)
+        await asyncio.to_thread(self.build, rows, fitted_at)
+        self.built_for = key
+
+    def build(self, rows: list, fitted_at: float | None = None):
+        started = time.perf_counter()
+        self.root.mkdir(parents=True, exist_ok=True)
+        index = self.index
+
+        # With no plotted points the loop below still runs, so every old tile is removed.
+        retile = index["bounds"] is None or index["fitted_at"] != fitted_at
+        if retile:
+            bounds = None
+            if rows:
+                xs = np.array([r[1] for r in rows], dtype="float64")
+                ys = np.array([r[2] for r in rows], dtype="float64")
+                bounds = [xs.min(), ys.min(), max(xs.max(), xs.min() + 1e-6), max(ys.max(), ys.min() + 1e-6)]
+            index = {**index, "bounds": bounds, "fitted_at": fitted_at, "tiles": {}}
+            for path in [*self.root.glob("sheet_*.webp"), *self.root.glob("tile_*.json")]:
+                path.unlink()
+
+        # Current members of every tile, in id order.
+        members: dict[str, list] = {}
+        for row in rows:
+            members.setdefault(self._tile_of(row[1], row[2], index["bounds"]), []).append(row)
+
+        changed = 0
+        tiles = {}
+        for tile_key in sorted(set(members) | set(index["tiles"])):
+            tile_rows = members.get(tile_key, [])
+            previous = index["tiles"].get(tile_key)
+            tile = self._update_tile(tile_key, tile_rows, previous)
+            if tile is not previous:
+                changed += 1
+            if tile["count"]:
+                tiles[tile_key] = tile
+
+        index["tiles"] = tiles
+        self.index = index
+        tmp_path = self.index_path.with_name(self.index_path.name + ".tmp")
+        tmp_path.write_text(json.dumps(index))
+        os.replace(tmp_path, self.index_path)
+        if changed:
+            logger.info(f"Map atlas: {changed} of {len(tiles)} tiles rebuilt in {time.perf_counter() - started:.1f}s.")
+
+    def _tile_of(self, x: float, y: float, bounds) -> str:
+        t = self.tiles_per_side
+        x0, y0, x1, y1 = bounds
+        tx = min(max(int((x - x0) / (x1 - x0) * t), 0), t - 1)
+        ty = min(max(int((y - y0) / (y1 - y0) * t), 0), t - 1)
+        return f"{tx}_{ty}"
+
+    def _update_tile(self, tile_key: str, rows: list, previous: dict | None) -> dict:
+        """Returns `previous` unchanged, or the tile's new entry after appending or repacking."""
+        tile_path = self.root / f"tile_{tile_key}.json"
+        old = json.loads(tile_path.read_text()) if previous and tile_path.exists() else {"ids": [], "names": []}
+        old_ids = set(old["ids"])
+        new_ids = {row[0] for row in rows}
+        if previous and old_ids == new_ids:
+            return previous
+
+        revision = (previous["revision"] + 1) if previous else 1
+        if previous and old_ids <= new_ids:
+            # Only additions: append after the existing sprites.
+            ids, names = old["ids"], old["names"]
+            appended = [row for row in rows if row[0] not in old_ids]
+        else:
+            ids, names, appended = [], [], rows
+            for sheet in self.root.glob(f"sheet_{tile_key}_*.webp"):
+                sheet.unlink()
+
+        if not rows:
+            tile_path.unlink(missing_ok=True)
+            return {"revision": revision, "count": 0, "sheets": 0}
+        self._paste_sprites(tile_key, len(ids), appended)
+        ids = ids + [row[0] for row in appended]
+        names = names + [row[4] for row in appended]
+
+        n_sheets = -(-len(ids) // self.sprites_per_sheet)
+        tile = {"revision": revision, "count": len(ids), "sheets": n_sheets}
+        saved = {**tile, "ids": ids, "names": names,
+                 "sheet_urls": [f"{self.url}/sheet_{tile_key}_{n}.webp?v={revision}" for n in range(n_sheets)]}
+        tmp_path = tile_path.with_name(tile_path.name + ".tmp")
+        tmp_path.write_text(json.dumps(saved))
+        os.replace(tmp_path, tile_path)
+        return tile
+
+    def _paste_sprites(self, tile_key: str, start: int, rows: list):
+        """Pastes the thumbnails of `rows` into sprite slots start, start + 1, ... of the tile's sheets."""
+        s, side, per_sheet = self.sprite_size, self.sheet_side, self.sprites_per_sheet
+        sheet_number, sheet = None, None
+        for i, row in enumerate(rows, start=start):
+            if i // per_sheet != sheet_number:
+                if sheet is not None:
+                    self._save_sheet(tile_key, sheet_number, sheet)
+                sheet_number = i // per_sheet
+                sheet = self._open_sheet(tile_key, sheet_number)
+            slot = i % per_sheet
+            sprite = self._sprite(row[3])
+            if sprite is not None:
+                sheet.paste(sprite, ((slot % side) * s, (slot // side) * s))
+        if sheet is not None:
+            self._save_sheet(tile_key, sheet_number, sheet)
+
+    def _open_sheet(self, tile_key: str, number: int) -> Image.Image:
+        path = self.root / f"sheet_{tile_key}_{number}.webp"
+        size = (self.sheet_side * self.sprite_size, self.sheet_side * self.sprite_size)
+        if path.exists():
+            with Image.open(path) as sheet:
+                return sheet.convert("RGB")
+        return Image.new("RGB", size, (30, 30, 30))
+
+    def _save_sheet(self, tile_key: str, number: int, sheet: Image.Image):
+        path = self.root / f"sheet_{tile_key}_{number}.webp"
+        tmp_path = path.with_name(path.name + ".tmp")
+        sheet.save(tmp_path, "WEBP", quality=80)
+        os.replace(tmp_path, path)
+
+    def _sprite(self, thumbnail_path: str | None) -> Image.Image | None:
+        if not thumbnail_path:
+            return None
+        try:
+            with Image.open(settings.UPLOAD_PATH / thumbnail_path) as thumbnail:
+                return ImageOps.fit(thumbnail.convert("RGB"), (self.sprite_size, self.sprite_size))
+        except Exception as e:
+            logger.warning(f"Could not read thumbnail {thumbnail_path} for the map atlas: {e}")
+            return None
+
+    async def maintain_forever(self, constellation_map, interval_seconds: float):
+        """Background loop: refreshes the atlas whenever map coordinates change."""
+        while True:
+            try:
+                if self.built_for != constellation_map.revision and not constellation_map.is_refitting:
+                    await self.refresh(key=constellation_map.revision, fitted_at=constellation_map.fitted_at)
+            except Exception as e:
+                logger.error(f"Map atlas maintenance failed: {e}", exc_info=True)
+            await asyncio.sleep(interval_seconds)
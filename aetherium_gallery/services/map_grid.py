@@ -0,0 +1,154 @@
+# aetherium_gallery/services/map_grid.py
+
+import asyncio
+import logging
+import time
+
+import numpy as np
+
+from ..features.images import service as image_service
+
+logger = logging.getLogger(__name__)
+
+class MapGrid:
+    """
+    In-memory spatial grid over the Constellation Map's plotted points.
+
+    Points are bucketed into a uniform `cells_per_side`² grid and stored sorted
+    by cell (CSR layout), shuffled within each cell. A viewport query reads only
+    the cells overlapping the box; a level-of-detail query takes the first c
+    points of every cell, with c chosen so the result fits `max_points`, which
+    thins dense regions while keeping sparse ones intact.
+    """
+
+    def __init__(self, cells_per_side: int = 256):
+        self.cells_per_side = cells_per_side
+        empty = np.empty(0, dtype="float32")
+        # (ids, xs, ys, clusters, cell_starts, cell_counts, bounds), swapped as one tuple.
+        self._data = (np.empty(0, dtype="int32"), empty, empty, None,
+                      np.zeros(cells_per_side ** 2, dtype="int64"), np.zeros(cells_per_side ** 2, dtype="int64"),
+                      (0.0, 0.0, 1.0, 1.0))
+        self._clusters: dict[int, int] = {}
+        self.built_for = None
+        self.built_at: float | None = None
+        self._rebuild_lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data[0])
+
+    @property
+    def bounds(self) -> tuple[float, float, float, float]:
+        return self._data[6]
+
+    def set_clusters(self, image_ids, labels):
+        """Cluster id per image, returned as an extra column on the next build."""
+        self._clusters = dict(zip((int(i) for i in image_ids), (int(label) for label in labels)))
+        self.built_for = None
+
+    # 1. Building
+    async def refresh(self, db, key=None):
+        """Rebuilds from the database unless the grid was already built for `key`."""
+        if key is not None and key == self.built_for:
+            return
+        async with self._rebuild_lock:
+            if key is not None and key == self.built_for:
+                return
+            rows = await image_service.get_map_points(db)
+            ids = np.fromiter((r[0] for r in rows), dtype="int32", count=len(rows))
+            xs = np.fromiter((r[1] for r in rows), dtype="float32", count=len(rows))
+            ys = np.fromiter((r[2] for r in rows), dtype="float32", count=len(rows))
+            await asyncio.to_thread(self.build, ids, xs, ys)
+            self.built_for = key
+
+    def build(self, ids: np.ndarray, xs: np.ndarray, ys: np.ndarray):
+        started = time.perf_counter()
+        g = self.cells_per_side
+        if len(ids):
+            x0, y0, x1, y1 = float(xs.min()), float(ys.min()), float(xs.max()), float(ys.max())
+        else:
+            x0, y0, x1, y1 = 0.0, 0.0, 1.0, 1.0
+        bounds = (x0, y0, max(x1, x0 + 1e-6), max(y1, y0 + 1e-6))
+        cells = self._cells_of(xs, ys, bounds)
+
+        # Shuffle first so each cell's prefix is a uniform sample of it.
+        shuffle = np.random.default_rng(0).permutation(len(ids))
+        order = shuffle[np.argsort(cells[shuffle], kind="stable")]
+        counts = np.bincount(cells, minlength=g * g).astype("int64")
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype("int64")
+
+        clusters = None
+        if self._clusters:
+            clusters = np.fromiter((self._clusters.get(int(i), -1) for i in ids[order]), dtype="int32", count=len(ids))
+        self._data = (ids[order], xs[order], ys[order], clusters, starts, counts, bounds)
+        self.built_at = time.time()
+        logger.info(f"Built map grid over {len(ids)} points in {time.perf_counter() - started:.3f}s.")
+
+    def _cells_of(self, xs: np.ndarray, ys: np.ndarray, bounds) -> np.ndarray:
+        g = self.cells_per_side
+        x0, y0, x1, y1 = bounds
+        cx = np.clip(((xs - x0) / (x1 - x0) * g).astype("int64"), 0, g - 1)
+        cy = np.clip(((ys - y0) / (y1 - y0) * g).astype("int64"), 0, g - 1)
+        return cy * g + cx
+
+    # 2. Queries
+    def query(self, bbox: tuple[float, float, float, float] | None = None, max_points: int | None = None) -> dict:
+        """
+        Points inside `bbox` (x0, y0, x1, y1; whole map if None), thinned to at
+        most `max_points`. Returns parallel arrays plus `total`, the number of
+        points in the cells overlapping the box before thinning.
+        """
+        ids, xs, ys, clusters, starts, counts, bounds = self._data
+        g = self.cells_per_side
+        if bbox is None:
+            cells = np.flatnonzero(counts)
+        else:
+            lo = self._cells_of(np.array([bbox[0]]), np.array([bbox[1]]), bounds)[0]
+            hi = self._cells_of(np.array([bbox[2]]), np.array([bbox[3]]), bounds)[0]
+            cy, cx = np.mgrid[lo // g:hi // g + 1, lo % g:hi % g + 1]
+            cells = (cy * g + cx).ravel()
+            cells = cells[counts[cells] > 0]
+
+        cell_counts = counts[cells]
+        total = int(cell_counts.sum())
+        take = cell_counts
+        if max_points is not None and total > max_points:
+            take = np.minimum(cell_counts, self._per_cell_cap(cell_counts, max_points))
+
+        # Row indices of the first `take` points of every selected cell.
+        offsets = np.repeat(starts[cells] - np.concatenate([[0], np.cumsum(take)[:-1]]), take)
+        rows = offsets + np.arange(int(take.sum()))
+        if max_points is not None and len(rows) > max_points:
+            rows = rows[np.linspace(0, len(rows) - 1, max_points).astype("int64")]
+
+        if bbox is not None:
+            inside = (xs[rows] >= bbox[0]) & (xs[rows] <= bbox[2]) & (ys[rows] >= bbox[1]) & (ys[rows] <= bbox[3])
+            rows = rows[inside]
+        return {
+            "ids": ids[rows], "x": xs[rows], "y": ys[rows],
+            "clusters": clusters[rows] if clusters is not None else None,
+            "total": total, "bounds": bounds,
+        }
+
+    @staticmethod
+    def _per_cell_cap(cell_counts: np.ndarray, max_points: int) -> int:
+        """Largest c with sum(min(count, c)) <= max_points (at least 1)."""
+        lo, hi = 1, int(cell_counts.max())
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if np.minimum(cell_counts, mid).sum() <= max_points:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
+    def get_stats(self) -> dict:
+        ids, _, _, clusters, _, counts, bounds = self._data
+        return {
+            "points": len(ids),
+            "cells_per_side": self.cells_per_side,
+            "occupied_cells": int((counts > 0).sum()),
+            "max_cell_count": int(counts.max()) if len(counts) else 0,
+            "bounds": bounds,
+            "has_clusters": clusters is not None,
+            "built_at": self.built_at,
+        }
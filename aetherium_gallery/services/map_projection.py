@@ -0,0 +1,175 @@
+# aetherium_gallery/services/map_projection.py
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PROJECTION_MODES = ("auto", "full", "landmark")
+
+class LandmarkProjection:
+    """
+    Map model for large galleries: vectors are PCA-reduced, and a point is
+    placed at the similarity-weighted average of the UMAP coordinates of its
+    nearest landmarks, found with an exact FAISS search. Exposes the same
+    transform() as a fitted umap.UMAP, so new images are placed the same way.
+    """
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray, landmark_vectors: np.ndarray,
+                 landmark_coords: np.ndarray, n_neighbors: int = 15):
+        self.mean = mean
+        self.components = components
+        self.landmark_vectors = landmark_vectors
+        self.landmark_coords = landmark_coords
+        self.n_neighbors = n_neighbors
+        self._index = None
+
+    def __getstate__(self):
+        # The FAISS index is rebuilt on first use rather than pickled.
+        state = self.__dict__.copy()
+        state["_index"] = None
+        return state
+
+    def reduce(self, vectors: np.ndarray) -> np.ndarray:
+        """PCA projection, re-normalized so inner product is cosine similarity."""
+        reduced = (np.asarray(vectors, dtype="float32") - self.mean) @ self.components.T
+        reduced /= np.maximum(np.linalg.norm(reduced, axis=1, keepdims=True), 1e-12)
+        return np.ascontiguousarray(reduced, dtype="float32")
+
+    def transform(self, vectors: np.ndarray) -> np.ndarray:
+        return self.place_reduced(self.reduce(vectors))
+
+    def place_reduced(self, reduced: np.ndarray, batch_size: int = 8192) -> np.ndarray:
+        index = self._landmark_index()
+        k = min(self.n_neighbors, index.ntotal)
+        coords = np.empty((len(reduced), 2), dtype="float32")
+        for start in range(0, len(reduced), batch_size):
+            similarities, neighbours = index.search(reduced[start:start + batch_size], k)
+            # Inverse squared cosine distance: a point on top of a landmark lands on it.
+            weights = 1.0 / np.square(np.maximum(1.0 - similarities, 0.0) + 1e-3)
+            weights /= weights.sum(axis=1, keepdims=True)
+            coords[start:start + batch_size] = np.einsum("nk,nkd->nd", weights, self.landmark_coords[neighbours])
+        return coords
+
+    def _landmark_index(self):
+        if self._index is None:
+            import faiss
+            self._index = faiss.IndexFlatIP(self.landmark_vectors.shape[1])
+            self._index.add(self.landmark_vectors)
+        return self._index
+
+def fit_pca(sample: np.ndarray, n_components: int) -> tuple[np.ndarray, np.ndarray]:
+    """Mean and top principal axes (rows) of `sample`."""
+    sample = np.asarray(sample, dtype="float32")
+    mean = sample.mean(axis=0)
+    _, _, vt = np.linalg.svd(sample - mean, full_matrices=False)
+    return mean, np.ascontiguousarray(vt[:min(n_components, vt.shape[0])], dtype="float32")
+
+def stratified_landmarks(reduced: np.ndarray, n_landmarks: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Landmark positions sampled from every k-means cell in proportion to its
+    size (at least one each), so small visual clusters stay on the map.
+    """
+    import faiss
+
+    n = len(reduced)
+    if n <= n_landmarks:
+        return np.arange(n)
+    n_cells = int(min(max(8, np.sqrt(n)), n_landmarks))
+    kmeans = faiss.Kmeans(reduced.shape[1], n_cells, niter=10, seed=42, spherical=True, max_points_per_centroid=256)
+    kmeans.train(reduced)
+    _, cells = kmeans.index.search(reduced, 1)
+    cells = cells[:, 0]
+
+    sizes = np.bincount(cells, minlength=n_cells)
+    quotas = np.maximum(1, np.floor(sizes * n_landmarks / n)).astype(int)
+    quotas = np.minimum(quotas, sizes)
+    chosen = []
+    for cell in np.flatnonzero(sizes):
+        members = np.flatnonzero(cells == cell)
+        chosen.append(rng.choice(members, size=quotas[cell], replace=False))
+    return np.sort(np.concatenate(chosen))
+
+def faiss_knn(vectors: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Exact cosine kNN of normalized `vectors` among themselves, self first: (indices, distances)."""
+    import faiss
+
+    index = faiss.IndexFlatIP(vectors.shape[1])
+    index.add(vectors)
+    similarities, indices = index.search(vectors, k)
+    # Duplicates can tie with the point itself; put the point first as UMAP expects.
+    indices[:, 0] = np.arange(len(vectors))
+    similarities[:, 0] = 1.0
+    return indices.astype("int64"), np.maximum(1.0 - similarities, 0.0).astype("float32")
+
+def fit_landmark_projection(vectors: np.ndarray, umap_params: dict, n_landmarks: int = 20000,
+                            pca_dim: int = 64, pca_sample: int = 50000, seed: int = 42,
+                            batch_size: int = 65536) -> tuple[LandmarkProjection, np.ndarray]:
+    """
+    Fits a LandmarkProjection on `vectors` (may be a memmap) and returns it with
+    the 2D coordinates of every point. UMAP only ever sees the landmarks, using
+    FAISS neighbours as its precomputed kNN graph.
+    """
+    import umap
+
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    sample = np.sort(rng.choice(n, size=min(n, pca_sample), replace=False))
+    mean, components = fit_pca(vectors[sample], pca_dim)
+    projection = LandmarkProjection(mean, components, None, None, umap_params.get("n_neighbors", 15))
+    reduced = np.vstack([projection.reduce(vectors[i:i + batch_size]) for i in range(0, n, batch_size)])
+    logger.info(f"PCA-reduced {n} vectors to {components.shape[0]} dimensions.")
+
+    landmarks = stratified_landmarks(reduced, n_landmarks, rng)
+    landmark_vectors = np.ascontiguousarray(reduced[landmarks])
+    n_neighbors = min(projection.n_neighbors, len(landmarks) - 1)
+    knn = faiss_knn(landmark_vectors, n_neighbors)
+    logger.info(f"Fitting UMAP on {len(landmarks)} stratified landmarks...")
+    reducer = umap.UMAP(**{**umap_params, "n_neighbors": n_neighbors}, precomputed_knn=(*knn, None))
+    landmark_coords = reducer.fit_transform(landmark_vectors).astype("float32")
+
+    projection.landmark_vectors, projection.landmark_coords = landmark_vectors, landmark_coords
+    coords = projection.place_reduced(reduced)
+    coords[landmarks] = landmark_coords
+    return projection, coords
+
+def _knn_rows(points: np.ndarray, k: int, metric: str) -> np.ndarray:
+    """k nearest other rows of `points` (L2, or inner product for "cosine")."""
+    import faiss
+
+    points = np.ascontiguousarray(points, dtype="float32")
+    index = faiss.IndexFlatIP(points.shape[1]) if metric == "cosine" else faiss.IndexFlatL2(points.shape[1])
+    index.add(points)
+    _, neighbours = index.search(points, k + 1)
+    return neighbours[:, 1:]
+
+def _overlap(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.mean([len(np.intersect1d(x, y)) / a.shape[1] for x, y in zip(a, b)]))
+
+def projection_quality(vectors: np.ndarray, coords: np.ndarray, umap_params: dict,
+                       sample_size: int = 2000, k: int = 10, seed: int = 0) -> dict:
+    """
+    Compares a scalable projection with a full UMAP fit on a random subset.
+    Reports, as fractions of each point's k nearest neighbours (within the
+    subset): agreement between the two layouts, and how many of the original
+    embedding-space neighbours each layout preserves.
+    """
+    import umap
+
+    rng = np.random.default_rng(seed)
+    subset = np.sort(rng.choice(len(vectors), size=min(len(vectors), sample_size), replace=False))
+    k = min(k, len(subset) - 2)
+    subset_vectors = np.asarray(vectors[subset], dtype="float32")
+    full_coords = umap.UMAP(**umap_params).fit_transform(subset_vectors)
+
+    original = _knn_rows(subset_vectors, k, "cosine")
+    full = _knn_rows(full_coords, k, "l2")
+    projected = _knn_rows(coords[subset], k, "l2")
+    return {
+        "sample_size": len(subset),
+        "k": k,
+        "neighbour_agreement_with_full_fit": _overlap(projected, full),
+        "knn_preservation": _overlap(projected, original),
+        "knn_preservation_full_fit": _overlap(full, original),
+    }
@@ -0,0 +1,67 @@
+# aetherium_gallery/services/raw_vector_store.py
+
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class RawVectorStore:
+    """
+    Position-aligned float32 copy of every indexed vector, kept on disk and
+    memory-mapped. Used alongside product-quantized indexes: the PQ codes stay
+    in RAM for search, and only the few candidate rows touched by the exact
+    rerank (or by reconstruct) are paged in from this file.
+    """
+
+    def __init__(self, path: Path, dim: int):
+        self.path = Path(path)
+        self.dim = dim
+        self._row_bytes = dim * 4
+        self._file = None
+        self._map = None
+        self._rows = self.path.stat().st_size // self._row_bytes if self.path.exists() else 0
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def append(self, vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype="float32").reshape(-1, self.dim)
+        if self._file is None:
+            self._file = open(self.path, "ab")
+        self._file.write(vectors.tobytes())
+        self._file.flush()
+        self._rows += len(vectors)
+
+    def get(self, positions: np.ndarray) -> np.ndarray:
+        if self._map is None or len(self._map) < self._rows:
+            # The file only ever grows between rewrites, so re-mapping is rare and O(1).
+            self._map = np.memmap(self.path, dtype="float32", mode="r", shape=(self._rows, self.dim))
+        return np.asarray(self._map[positions])
+
+    def truncate(self, rows: int):
+        """Drops rows past `rows`, e.g. vectors appended after the last checkpoint that the log will replay."""
+        if rows >= self._rows: return
+        self._close()
+        with open(self.path, "r+b") as f: f.truncate(rows * self._row_bytes)
+        self._rows = rows
+
+    def replace_with(self, path: Path):
+        """Atomically replaces the whole store with a file written elsewhere, e.g. after a compaction renumbers positions."""
+        self._close()
+        os.replace(path, self.path)
+        self._rows = self.path.stat().st_size // self._row_bytes
+
+    def delete(self):
+        self._close()
+        if self.path.exists():
+            self.path.unlink()
+        self._rows = 0
+
+    def _close(self):
+        self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
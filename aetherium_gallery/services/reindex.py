@@ -0,0 +1,171 @@
+# aetherium_gallery/services/reindex.py
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from PIL import Image
+
+from ..core.config import settings
+from ..core.database import AsyncSessionFactory
+from ..features.images import service as image_service
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROGRESS_PATH = Path("./reindex_progress.json")
+
+# Decoded images are box-reduced until their short side is within 2x of this
+# (DINOv2's resize target), so large files are cheap to ship between processes.
+_TARGET_SHORT_SIDE = 256
+
+def decode_for_embedding(path: str) -> Image.Image | None:
+    """Runs in a worker process: opens, downsizes and converts one image to RGB."""
+    try:
+        image = Image.open(path)
+        image.draft("RGB", (2 * _TARGET_SHORT_SIDE, 2 * _TARGET_SHORT_SIDE))  # JPEG DCT scaling; no-op otherwise
+        factor = min(image.size) // (2 * _TARGET_SHORT_SIDE)
+        if factor > 1:
+            image = image.reduce(factor)
+        return image.convert("RGB")
+    except Exception as e:
+        logger.warning(f"Could not decode {path} for reindexing: {e}")
+        return None
+
+class ReindexJob:
+    """
+    Rebuilds the vector index from the images table.
+
+    Rows are streamed in id order in pages of `batch_size`. Each page is decoded
+    in a process pool while the previous one is being embedded, and added to the
+    index in one step. After every page the last finished id is saved to
+    `progress_path`, so an interrupted run resumes from there. Images that are
+    already indexed are skipped, which makes re-running it safe.
+    """
+
+    def __init__(self, vector_service, batch_size: int = 64, workers: int | None = None,
+                 fresh: bool = False, resume: bool = True, progress_path: Path = DEFAULT_PROGRESS_PATH):
+        self.vector_service = vector_service
+        self.batch_size = max(1, batch_size)
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.fresh = fresh
+        self.resume = resume
+        self.progress_path = Path(progress_path)
+
+        self.state = "pending"
+        self.error: str | None = None
+        self.last_id = 0
+        self.total = 0
+        self.processed = 0
+        self.indexed = 0
+        self.skipped = 0
+        self.failed = 0
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+
+    def to_dict(self) -> dict:
+        elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+        rate = self.processed / elapsed if elapsed else 0.0
+        remaining = max(self.total - self.processed, 0)
+        return {
+            "state": self.state, "error": self.error, "last_id": self.last_id,
+            "total": self.total, "processed": self.processed, "indexed": self.indexed,
+            "skipped": self.skipped, "failed": self.failed,
+            "images_per_second": rate,
+            "eta_seconds": remaining / rate if rate and self.state == "running" else None,
+        }
+
+    async def run(self) -> dict:
+        self.state, self.started_at = "running", time.time()
+        try:
+            await self._run()
+            self.state = "completed"
+            self.progress_path.unlink(missing_ok=True)
+        except asyncio.CancelledError:
+            self.state = "cancelled"
+            raise
+        except Exception as e:
+            self.state, self.error = "failed", str(e)
+            logger.error(f"Reindex failed at id {self.last_id}: {e}", exc_info=True)
+        finally:
+            self.finished_at = time.time()
+            logger.info(f"Reindex {self.state}: {self.to_dict()}")
+        return self.to_dict()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        if self.fresh:
+            await loop.run_in_executor(None, self.vector_service.reset)
+            self.progress_path.unlink(missing_ok=True)
+        elif self.resume:
+            self._load_progress()
+
+        async with AsyncSessionFactory() as db:
+            self.total = self.processed + await image_service.count_indexable_images(db, after_id=self.last_id)
+            logger.info(f"Reindexing {self.total - self.processed} images after id {self.last_id} "
+                        f"(batch_size={self.batch_size}, decode workers={self.workers})...")
+
+            # Spawned, not forked: this process already runs threads (torch / FAISS pools, the
+            # embedding engine, the indexing queue) whose held locks a fork would copy.
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                page = await self._next_page(db, self.last_id, loop, pool)
+                while page is not None:
+                    rows, decoding = page
+                    # Start decoding the next page before embedding this one.
+                    page = await self._next_page(db, rows[-1][0], loop, pool)
+                    await self._finish_page(rows, decoding, loop)
+
+    async def _next_page(self, db, after_id: int, loop, pool):
+        rows = await image_service.get_indexable_images_after(db, after_id=after_id, limit=self.batch_size)
+        if not rows:
+            return None
+        missing = set(self.vector_service.missing_ids([image_id for image_id, _ in rows]))
+        decoding = {
+            image_id: loop.run_in_executor(pool, decode_for_embedding, str(settings.UPLOAD_PATH / filepath))
+            for image_id, filepath in rows if image_id in missing
+        }
+        return rows, decoding
+
+    async def _finish_page(self, rows: list, decoding: dict, loop):
+        image_ids = list(decoding)
+        images = await asyncio.gather(*decoding.values())
+        decoded = [(image_id, image) for image_id, image in zip(image_ids, images) if image is not None]
+
+        added = 0
+        if decoded:
+            vectors = await loop.run_in_executor(None, self.vector_service.embed_images, [image for _, image in decoded])
+            added = await loop.run_in_executor(None, self.vector_service.add_embeddings, [image_id for image_id, _ in decoded], vectors)
+
+        self.processed += len(rows)
+        self.indexed += added
+        self.skipped += len(rows) - len(decoding)
+        self.failed += len(decoding) - len(decoded)
+        self.last_id = rows[-1][0]
+        self._save_progress()
+
+        progress = self.to_dict()
+        logger.info(f"Reindex: {self.processed}/{self.total} images, {self.indexed} indexed, {self.failed} failed, "
+                    f"{progress['images_per_second']:.1f} img/s")
+
+    def _load_progress(self):
+        if not self.progress_path.exists(): return
+        try:
+            saved = json.loads(self.progress_path.read_text())
+            self.last_id = saved["last_id"]
+            self.processed, self.indexed = saved.get("processed", 0), saved.get("indexed", 0)
+            self.skipped, self.failed = saved.get("skipped", 0), saved.get("failed", 0)
+            logger.info(f"Resuming reindex after image id {self.last_id}.")
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable reindex progress file {self.progress_path}: {e}")
+
+    def _save_progress(self):
+        # Vectors reach the append log before this is written, so a resume never skips an unindexed image.
+        saved = {"last_id": self.last_id, "processed": self.processed, "indexed": self.indexed,
+                 "skipped": self.skipped, "failed": self.failed, "updated_at": time.time()}
+        tmp_path = self.progress_path.with_name(self.progress_path.name + ".tmp")
+        tmp_path.write_text(json.dumps(saved))
+        os.replace(tmp_path, self.progress_path)
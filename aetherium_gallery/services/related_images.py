@@ -0,0 +1,202 @@
+# aetherium_gallery/services/related_images.py
+
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from ..features.images import models
+from ..features.images import service as image_service
+
+logger = logging.getLogger(__name__)
+
+class RelatedImages:
+    """
+    Hybrid "related images": candidates come from the tag inverted index (images
+    sharing the source's rarer tags) and from visual neighbours (the kNN graph,
+    or a live index search), and are scored in one vectorized pass as
+
+        tag_weight * IDF-weighted tag overlap + visual_weight * cosine similarity
+
+    where tag overlap is the summed IDF of shared tags over the source's total.
+    Results are cached per image and dropped when tags or the index change.
+    """
+
+    def __init__(self, vector_service=None, knn_graph=None, tag_weight: float = 0.5, visual_weight: float = 0.5,
+                 candidates: int = 200, cache_size: int = 10000):
+        self.vector_service = vector_service
+        self.knn_graph = knn_graph
+        self.tag_weight = tag_weight
+        self.visual_weight = visual_weight
+        self.candidates = candidates
+        self.cache_size = cache_size
+
+        self._lock = threading.Lock()
+        self._postings: dict[int, np.ndarray] = {}  # tag id -> sorted image ids
+        self._tags_of: dict[int, np.ndarray] = {}  # image id -> tag ids
+        self.tags_version = 0
+        # Images whose tags changed in a committed transaction; re-read before the next query.
+        self._stale: set[int] = set()
+        self._cache: OrderedDict = OrderedDict()
+
+    # 1. Tag inverted index
+    def load(self, pairs):
+        """Replaces the tag index with (image_id, tag_id) rows."""
+        pairs = np.array(list(pairs), dtype="int64").reshape(-1, 2)
+        postings, tags_of = {}, {}
+        if len(pairs):
+            by_tag = pairs[np.lexsort((pairs[:, 0], pairs[:, 1]))]
+            tag_ids, starts = np.unique(by_tag[:, 1], return_index=True)
+            for tag_id, ids in zip(tag_ids.tolist(), np.split(by_tag[:, 0], starts[1:])):
+                postings[tag_id] = ids
+            by_image = pairs[np.argsort(pairs[:, 0], kind="stable")]
+            image_ids, starts = np.unique(by_image[:, 0], return_index=True)
+            for image_id, tags in zip(image_ids.tolist(), np.split(by_image[:, 1], starts[1:])):
+                tags_of[image_id] = tags
+        with self._lock:
+            self._postings, self._tags_of = postings, tags_of
+            self._changed()
+        logger.info(f"Loaded the related-images tag index: {len(tags_of)} tagged images, {len(postings)} tags.")
+
+    def set_tags(self, image_id: int, tag_ids):
+        """Replaces one image's tags (an empty list removes it) in the inverted index."""
+        new = np.unique(np.asarray(list(tag_ids), dtype="int64"))
+        with self._lock:
+            old = self._tags_of.pop(image_id, np.empty(0, dtype="int64"))
+            for tag_id in np.setdiff1d(old, new).tolist():
+                ids = self._postings[tag_id]
+                ids = ids[ids != image_id]
+                if len(ids): self._postings[tag_id] = ids
+                else: del self._postings[tag_id]
+            for tag_id in np.setdiff1d(new, old).tolist():
+                ids = self._postings.get(tag_id, np.empty(0, dtype="int64"))
+                self._postings[tag_id] = np.insert(ids, np.searchsorted(ids, image_id), image_id)
+            if len(new):
+                self._tags_of[image_id] = new
+            self._changed()
+
+    def _changed(self):
+        self.tags_version += 1
+        self._cache.clear()
+
+    async def apply_pending(self, db):
+        """Re-reads the tags of images changed since the last query."""
+        if not self._stale: return
+        with self._lock:
+            stale, self._stale = self._stale, set()
+        tags = {image_id: [] for image_id in stale}
+        for image_id, tag_id in await image_service.get_image_tag_pairs(db, image_ids=list(stale)):
+            tags[image_id].append(tag_id)
+        for image_id, tag_ids in tags.items():
+            self.set_tags(image_id, tag_ids)
+
+    def track_changes(self):
+        """Registers session listeners that mark images whose tags change, or that are deleted, as stale."""
+        event.listen(Session, "after_flush", self._collect_changes)
+        event.listen(Session, "after_commit", self._apply_changes)
+        event.listen(Session, "after_rollback", self._discard_changes)
+
+    def _collect_changes(self, session, flush_context):
+        changed = session.info.setdefault("related_images_changes", set())
+        try:
+            for obj in session.new | session.dirty | session.deleted:
+                if not isinstance(obj, models.Image) or obj.id is None: continue
+                if obj in session.deleted or inspect(obj).attrs.tags.history.has_changes():
+                    changed.add(obj.id)
+        except Exception as e:
+            logger.warning(f"Could not record tag changes for related images: {e}")
+
+    def _apply_changes(self, session):
+        changed = session.info.pop("related_images_changes", None)
+        if changed:
+            with self._lock:
+                self._stale |= changed
+
+    def _discard_changes(self, session):
+        session.info.pop("related_images_changes", None)
+
+    # 2. Scoring
+    async def related(self, db, image_id: int, limit: int = 10, id_filter=None) -> list[int]:
+        """Ids of the `limit` most related images, best first."""
+        await self.apply_pending(db)
+        return await asyncio.to_thread(self.score, image_id, limit, id_filter)
+
+    def score(self, image_id: int, limit: int = 10, id_filter=None) -> list[int]:
+        vector_version = self.vector_service.version if self.vector_service else None
+        key = (image_id, limit, id_filter.key if id_filter is not None else None)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] == vector_version:
+                self._cache.move_to_end(key)
+                return cached[1]
+            source_tags = self._tags_of.get(image_id, np.empty(0, dtype="int64"))
+            postings = [self._postings[t] for t in source_tags.tolist()]
+            n_images = max(len(self._tags_of), 1)
+
+        # 1. Candidates: images sharing the source's rarest tags, plus visual neighbours
+        idf = np.array([np.log1p(n_images / len(ids)) for ids in postings], dtype="float32")
+        candidates = [self._tag_candidates(postings, idf)]
+        query_vector = None
+        if self.vector_service is not None:
+            query_vector = self.vector_service.get_vector(image_id)
+        if query_vector is not None:
+            visual = self.knn_graph.neighbours(image_id, n_results=self.candidates) if self.knn_graph else None
+            if visual is None:
+                _, found = self.vector_service.search(query_vector, self.candidates, id_filter=id_filter, exclude_ids=[image_id])
+                visual = found[0][found[0] >= 0]
+            candidates.append(np.asarray(visual, dtype="int64"))
+        candidates = np.unique(np.concatenate(candidates))
+        candidates = candidates[candidates != image_id]
+        if id_filter is not None:
+            in_range = candidates < len(id_filter.mask)
+            candidates = candidates[in_range][id_filter.mask[candidates[in_range]]]
+
+        # 2. One scoring pass over all candidates
+        scores = np.zeros(len(candidates), dtype="float32")
+        if len(candidates) and len(postings):
+            shared = np.stack([np.isin(candidates, ids, assume_unique=True) for ids in postings])
+            scores += self.tag_weight * (idf @ shared) / idf.sum()
+        if len(candidates) and query_vector is not None:
+            found_ids, vectors = self.vector_service.get_vectors(candidates.tolist())
+            if found_ids:
+                similarity = np.zeros(len(candidates), dtype="float32")
+                similarity[np.searchsorted(candidates, found_ids)] = np.maximum(vectors @ query_vector, 0.0)
+                scores += self.visual_weight * similarity
+
+        keep = np.flatnonzero(scores > 0)
+        order = keep[np.argsort(-scores[keep], kind="stable")[:limit]]
+        result = candidates[order].tolist()
+        with self._lock:
+            self._cache[key] = (vector_version, result)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def _tag_candidates(self, postings: list, idf: np.ndarray) -> np.ndarray:
+        """Images sharing the rarest source tags, up to about `candidates` of them by partial IDF overlap."""
+        if not postings:
+            return np.empty(0, dtype="int64")
+        taken, gathered = [], 0
+        for i in np.argsort(-idf):
+            taken.append((postings[i], idf[i]))
+            gathered += len(postings[i])
+            if gathered >= 10 * self.candidates: break
+        ids = np.concatenate([p for p, _ in taken])
+        weights = np.concatenate([np.full(len(p), w, dtype="float32") for p, w in taken])
+        unique, inverse = np.unique(ids, return_inverse=True)
+        partial = np.bincount(inverse, weights=weights)
+        return unique[np.argsort(-partial, kind="stable")[:self.candidates]]
+
+    def get_stats(self) -> dict:
+        return {
+            "tagged_images": len(self._tags_of),
+            "tags": len(self._postings),
+            "cached": len(self._cache),
+            "pending": len(self._stale),
+            "tag_weight": self.tag_weight,
+            "visual_weight": self.visual_weight,
+        }
@@ -1,59 +1,279 @@
 # aetherium_gallery/services/vector_service.py (UPDATED with DEBBUGING)
 
-import faiss, numpy as np, pickle, os, logging
-from transformers import AutoImageProcessor, AutoModel
-import torch
+import faiss, numpy as np, pickle, os, logging, struct, threading, json
 from PIL import Image
 from pathlib import Path
 
+from ..core.config import settings
+from . import index_factory
+from .id_map import IdMap
+from .raw_vector_store import RawVectorStore
+
 logger = logging.getLogger(__name__)
 
+# Append-log record: 1-byte op code + int64 image id. Add records are followed
+# by the float32 vector; delete records carry no payload.
+_LOG_HEADER = struct.Struct("<cq")
+_OP_ADD = b"A"
+_OP_DELETE = b"D"
+
+# Mapping file written by versions before the compact id map; converted on load.
+_LEGACY_MAPPING_NAME = "faiss_mapping.pkl"
+
+# Checkpoints are written to generation-numbered files ("faiss_index.000042.bin")
+# that are never overwritten; the manifest, swapped in last, names the current
+# and previous generation.
+_GENERATION_DIGITS = 6
+
+# Vectors copied out per lock acquisition while a rebuild snapshots the index.
+_RECONSTRUCT_CHUNK = 65536
+
 def _normalize_vector(vec: np.ndarray) -> np.ndarray:
     norm = np.linalg.norm(vec)
     return vec / norm if norm > 0 else vec
 
+def _atomic_write(path: Path, writer) -> None:
+    """Writes via a temp file + os.replace so a crash never leaves a half-written file."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    writer(tmp_path)
+    os.replace(tmp_path, path)
+
 class VectorService:
-    def __init__(self, index_path: str = "./faiss_index.bin", mapping_path: str = "./faiss_mapping.pkl"):
-        logger.info("Initializing Vector Service with FAISS and DINOv2...")
+    def __init__(
+        self,
+        index_path: str = "./faiss_index.bin",
+        mapping_path: str = "./faiss_ids.npy",
+        log_path: str = "./faiss_vectors.log",
+        raw_vectors_path: str = "./faiss_vectors.f32",
+        checkpoint_interval: int | None = None,
+    ):
+        logger.info("Initializing Vector Service with FAISS...")
         self.model_name = "facebook/dinov2-base"
         self.embedding_dim = 768
         self.index_path = Path(index_path)
         self.mapping_path = Path(mapping_path)
-        
+        self.log_path = Path(log_path)
+        self.raw_vectors_path = Path(raw_vectors_path)
+        self.manifest_path = self.index_path.with_name(self.index_path.stem + ".manifest.json")
+        self.checkpoint_interval = checkpoint_interval or settings.VECTOR_CHECKPOINT_INTERVAL
+        self._vector_bytes = self.embedding_dim * 4
+
+        # The DINOv2 model is loaded by warm_up(), not here: searching by stored
+        # vectors never needs it, so the index can serve as soon as it is open.
+        self.processor = None
+        self.model = None
+        self.engine = None
+        self.model_error: str | None = None
+        self._model_ready = threading.Event()
+        self._warmup_lock = threading.Lock()
+        self._warmup_thread = None
+
+        # The index and id maps stay resident for the life of the service.
+        # All access goes through this lock: FAISS indexes are not safe to
+        # search while another thread is adding to them.
+        self._lock = threading.RLock()
+        self._log_file = None
+        self._pending_records = 0
+        self._rebuild_thread = None
+        self._tombstone_selector = None
+        # Position masks of search filters, keyed by filter and valid for one index version.
+        self._filter_masks: dict[tuple, tuple[int, np.ndarray]] = {}
+        # A memory-mapped index is a read-only view of the index file; the
+        # warmup thread copies it into memory before the first upload.
+        self._index_is_mapped = False
+        # Bumped on every add / delete, so derived data (e.g. the kNN graph) can tell it is stale.
+        self.version = 0
+        # The checkpoint the index was loaded from or last written to: {"generation", "index", "ids", "vectors"},
+        # and the newest generation number on disk (higher than the loaded one after a fallback).
+        self._checkpoint_files: dict | None = None
+        self._generation = 0
+        self.index, self.id_map = self._load_or_create_index()
+        self._raw_store = self._open_raw_store()
+        self._replay_log()
+        self._maybe_start_rebuild()
+
+    @property
+    def tombstones(self) -> set[int]:
+        """Positions of deleted vectors. They stay in the index until the next compaction, but are filtered out of every search."""
+        return self.id_map.tombstones
+
+    @property
+    def model_ready(self) -> bool:
+        return self._model_ready.is_set()
+
+    def start_warmup(self):
+        """Loads the DINOv2 model on a background thread. A no-op while loading or once loaded; retries after a failure."""
+        with self._warmup_lock:
+            if self._model_ready.is_set() or (self._warmup_thread is not None and self._warmup_thread.is_alive()): return
+            self.model_error = None
+            self._warmup_thread = threading.Thread(target=self._load_model, name="dinov2-warmup", daemon=True)
+            self._warmup_thread.start()
+
+    def wait_until_ready(self, timeout: float | None = None) -> bool:
+        """Starts the warmup if nobody has yet and blocks until the model is loaded (or failed)."""
+        self.start_warmup()
+        self._warmup_thread.join(timeout)
+        return self.model_ready
+
+    def _load_model(self):
+        # Uploads wait for the model, so this runs before any request could add a vector.
+        self._materialize_index()
+        # torch and transformers are imported here so importing this module stays cheap.
         try:
+            from transformers import AutoImageProcessor, AutoModel
+            from .embedding_engine import EmbeddingEngine
+            from . import inference_optim
+
+            logger.info(f"Loading {self.model_name} in the background...")
+            inference_optim.set_num_threads(settings.EMBEDDING_NUM_THREADS)
             self.processor = AutoImageProcessor.from_pretrained(self.model_name)
+            if settings.EMBEDDING_FAST_PREPROCESS:
+                self.processor = inference_optim.FastImagePreprocessor(self.processor)
             self.model = AutoModel.from_pretrained(self.model_name)
+            if settings.EMBEDDING_QUANTIZE or settings.EMBEDDING_COMPILE != "none":
+                example_inputs = self.processor(images=[Image.new("RGB", (224, 224))], return_tensors="pt")
+                self.model = inference_optim.optimize_model(
+                    self.model,
+                    quantize=settings.EMBEDDING_QUANTIZE,
+                    compile_mode=settings.EMBEDDING_COMPILE,
+                    example_inputs=example_inputs,
+                )
+            self.engine = EmbeddingEngine(
+                self.processor,
+                self.model,
+                max_batch_size=settings.EMBEDDING_BATCH_SIZE,
+                max_wait_ms=settings.EMBEDDING_MAX_WAIT_MS,
+            )
+            self._model_ready.set()
             logger.info("DINOv2 model and processor loaded successfully.")
         except Exception as e:
-            logger.error(f"Failed to load DINOv2 model: {e}")
-            raise
-        
-        self._load_or_create_index() 
+            self.model_error = str(e)
+            logger.error(f"Failed to load DINOv2 model: {e}", exc_info=True)
+
+    def _materialize_index(self):
+        """
+        Copies a memory-mapped index into memory ahead of the first upload, so
+        adding a vector never pays for the copy while holding the lock. A mapped
+        index is never written to, so it is copied without the lock; the copy is
+        dropped if the index was replaced in the meantime.
+        """
+        with self._lock:
+            if not self._index_is_mapped: return
+            mapped = self.index
+        try:
+            copy = index_factory.materialize(mapped)
+        except Exception as e:
+            logger.error(f"Could not copy the memory-mapped FAISS index into memory: {e}", exc_info=True)
+            return
+        with self._lock:
+            if self.index is mapped:
+                self.index = self._configure_index(copy)
+                self._index_is_mapped = False
+                logger.info("Copied the memory-mapped FAISS index into memory.")
+
+    def get_health(self) -> dict:
+        with self._lock:
+            index_health = {"ready": True, "vectors": self.index.ntotal - len(self.tombstones)}
+        model_health = {
+            "ready": self.model_ready,
+            "loading": self._warmup_thread is not None and self._warmup_thread.is_alive(),
+            "error": self.model_error,
+        }
+        return {"model": model_health, "index": index_health}
 
     def generate_embedding(self, image_path: Path) -> np.ndarray | None:
+        # Requests from concurrent callers are coalesced into batches by the engine.
+        if not self.wait_until_ready():
+            logger.error(f"Cannot embed {image_path}: the DINOv2 model failed to load ({self.model_error}).")
+            return None
         try:
             image = Image.open(image_path).convert("RGB")
-            inputs = self.processor(images=image, return_tensors="pt")
-            with torch.no_grad():
-                outputs = self.model(**inputs)
-            embedding = outputs.last_hidden_state[:, 0].squeeze().cpu().numpy()
-            return _normalize_vector(embedding.astype("float32"))
+            return self.engine.embed(image)
         except Exception as e:
             logger.error(f"Failed to generate embedding for {image_path}: {e}")
             return None
 
-    def add_image(self, image_id: int, image_path: Path):
-        index, id_to_index, index_to_id = self._load_or_create_index()
-        if image_id in id_to_index: return
-        
+    def add_image(self, image_id: int, image_path: Path) -> bool:
+        """Embeds and indexes an image. Returns True once it is in the index."""
+        with self._lock:
+            if image_id in self.id_map: return True
+
+        # Run the model outside the lock so searches are not blocked by inference.
         embedding = self.generate_embedding(image_path)
-        if embedding is not None:
-            index.add(np.array([embedding]))
-            new_pos = index.ntotal - 1
-            id_to_index[image_id] = new_pos
-            index_to_id.append(image_id)
-            self._save_to_disk(index, id_to_index, index_to_id)
-            logger.info(f"Successfully added and saved ID {image_id} to FAISS.")
+        if embedding is None: return False
+
+        with self._lock:
+            if image_id in self.id_map: return True
+            self._append_to_log(_OP_ADD, image_id, embedding)
+            self._add_to_index(image_id, embedding)
+            logger.info(f"Successfully added ID {image_id} to FAISS.")
+            if self._pending_records >= self.checkpoint_interval:
+                self.checkpoint()
+            self._maybe_start_rebuild()
+        return True
+
+    def embed_images(self, images: list) -> list[np.ndarray]:
+        """Embeds already-decoded RGB images, sharing forward passes. Waits for the model."""
+        if not self.wait_until_ready():
+            raise RuntimeError(f"The DINOv2 model failed to load: {self.model_error}")
+        return self.engine.embed_many(images)
+
+    def missing_ids(self, image_ids: list[int]) -> list[int]:
+        """The subset of `image_ids` that has no vector in the index."""
+        with self._lock:
+            return [image_id for image_id in image_ids if image_id not in self.id_map]
+
+    def add_embeddings(self, image_ids: list[int], embeddings: list[np.ndarray]) -> int:
+        """Adds precomputed vectors under a single lock acquisition; ids already indexed are skipped."""
+        added = 0
+        with self._lock:
+            for image_id, embedding in zip(image_ids, embeddings):
+                if image_id in self.id_map: continue
+                embedding = np.asarray(embedding, dtype="float32")
+                self._append_to_log(_OP_ADD, image_id, embedding)
+                self._add_to_index(image_id, embedding)
+                added += 1
+            if self._pending_records >= self.checkpoint_interval:
+                self.checkpoint()
+            self._maybe_start_rebuild()
+        return added
+
+    def reset(self):
+        """Empties the index (and its files) so it can be rebuilt from scratch."""
+        with self._lock:
+            if self._rebuild_thread is not None:
+                raise RuntimeError("Cannot reset the index while a background rebuild is running.")
+            self.index = index_factory.build_index("flat", self.embedding_dim)
+            self._index_is_mapped = False
+            self.id_map = IdMap()
+            self.version += 1
+            self._tombstone_selector = None
+            self._filter_masks.clear()
+            if self._raw_store is not None:
+                self._raw_store.delete()
+                self._raw_store = None
+            self.checkpoint()
+            logger.warning("Vector index reset to empty.")
+
+    def remove_images(self, image_ids: list[int]) -> int:
+        """
+        Tombstones the vectors of deleted images so they no longer take top-k
+        slots. The space is reclaimed by a background compaction once dead
+        entries pass VECTOR_COMPACTION_THRESHOLD of the index.
+        """
+        removed = 0
+        with self._lock:
+            for image_id in image_ids:
+                if image_id not in self.id_map: continue
+                self._append_to_log(_OP_DELETE, image_id)
+                self._tombstone(image_id)
+                removed += 1
+            if removed:
+                logger.info(f"Removed {removed} vectors from FAISS ({len(self.tombstones)} tombstones).")
+                if self._pending_records >= self.checkpoint_interval:
+                    self.checkpoint()
+                self._maybe_start_rebuild()
+        return removed
 
     def find_similar_images_by_path(self, image_path: Path, source_id: int, n_results: int = 10) -> list[int]:
         SIMILARITY_THRESHOLD = 0.50
@@ -62,91 +282,552 @@ class VectorService:
 
         return self.find_similar_images_by_vector(query_embedding, exclude_ids=[source_id], n_results=n_results, similarity_threshold=SIMILARITY_THRESHOLD)
 
+    def find_similar_images(self, image_id: int, image_path: Path | None = None, n_results: int = 10,
+                            similarity_threshold: float = 0.50, id_filter=None) -> list[int]:
+        """
+        Finds images similar to an already-indexed image by searching with its
+        stored vector. Only falls back to running the model when the id has not
+        been indexed yet and an image_path is given.
+        """
+        query_embedding = self.get_vector(image_id)
+        if query_embedding is None:
+            if image_path is None: return []
+            logger.info(f"Image ID {image_id} is not indexed; embedding it from {image_path}.")
+            query_embedding = self.generate_embedding(image_path)
+            if query_embedding is None: return []
+
+        return self.find_similar_images_by_vector(query_embedding, exclude_ids=[image_id], n_results=n_results,
+                                                  similarity_threshold=similarity_threshold, id_filter=id_filter)
+
+    def get_vector(self, image_id: int) -> np.ndarray | None:
+        """Returns the stored vector for an indexed image, or None if it is not indexed."""
+        with self._lock:
+            faiss_index_pos = self.id_map.position_of(image_id)
+            if faiss_index_pos is None or faiss_index_pos >= self.index.ntotal: return None
+            return self._reconstruct_positions(np.array([faiss_index_pos], dtype="int64"))[0]
+
     def get_embeddings_for_ids(self, image_ids: list[int]) -> np.ndarray | None:
-        index, id_to_index, _ = self._load_or_create_index()
-        if not image_ids or not id_to_index: return None
-        
-        embeddings = []
-        for img_id in image_ids:
-            faiss_index_pos = id_to_index.get(img_id)
-            if faiss_index_pos is not None and faiss_index_pos < index.ntotal:
-                embeddings.append(index.reconstruct(faiss_index_pos))
-        
-        return np.array(embeddings) if embeddings else None
-
-    # ▼▼▼ UPDATED METHOD WITH DETAILED LOGGING ▼▼▼
-    def find_similar_images_by_vector(self, query_vector: np.ndarray, exclude_ids: list[int], n_results: int = 24, similarity_threshold: float = 0.50) -> list[int]:
-        index, _, index_to_id = self._load_or_create_index()
-        if index.ntotal == 0: return []
-        
-        query_vector = query_vector.reshape(1, -1).astype('float32')
-        
-        k = n_results + len(exclude_ids) + 20 # Search for many results to ensure good candidates
-        k = min(k, index.ntotal) # Don't search for more items than exist in the index
-        distances, indices = index.search(query_vector, k=k)
-        
-        similar_ids = []
-        
-        # --- DEBUGGING LOGS ---
-        logger.info(f"--- [Vector Search] Raw Similarity Scores (Threshold={similarity_threshold}) ---")
-        for i, dist in zip(indices[0], distances[0]):
-            if i != -1 and i < len(index_to_id):
-                retrieved_id = index_to_id[i]
-                
-                # Check exclusion and threshold criteria
-                is_excluded = retrieved_id in exclude_ids
-                passes_threshold = dist >= similarity_threshold
-                
-                # Log every potential candidate and why it's included or not
-                log_msg = f"Candidate ID: {retrieved_id}, Similarity: {dist:.4f} -> Excluded: {is_excluded}, Passes Threshold: {passes_threshold}"
-                
-                if not is_excluded and passes_threshold:
-                    similar_ids.append(retrieved_id)
-                    logger.info(log_msg + " [ADDED]")
-                else:
-                    logger.info(log_msg) # Still log it so we see the scores
+        with self._lock:
+            if not image_ids or not self.id_map.live_count: return None
+
+            positions = self.id_map.positions_of(image_ids)
+            if not len(positions): return None
+            return self._reconstruct_positions(positions)
+
+    def get_vectors(self, image_ids: list[int]) -> tuple[list[int], np.ndarray]:
+        """Stored vectors for the indexed subset of `image_ids`: (found ids, matching rows)."""
+        with self._lock:
+            found = [(image_id, self.id_map.position_of(image_id)) for image_id in image_ids]
+            found = [(image_id, p) for image_id, p in found if p is not None]
+            positions = np.array([p for _, p in found], dtype="int64")
+            return [image_id for image_id, _ in found], self._reconstruct_positions(positions)
+
+    def live_ids(self) -> np.ndarray:
+        with self._lock:
+            return self.id_map.live_ids()
+
+    def search(self, query_vectors: np.ndarray, k: int, id_filter=None, exclude_ids=()) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Raw top-k search: (similarities, image ids) matrices, padded with -1 ids
+        past the number of eligible vectors. `id_filter` (an attribute_index.IdFilter)
+        and `exclude_ids` are applied inside FAISS, so the k results are all eligible.
+        """
+        queries = np.ascontiguousarray(query_vectors, dtype="float32").reshape(-1, self.embedding_dim)
+        with self._lock:
+            selector, n_eligible = self._selector(id_filter, exclude_ids)
+            k_live = min(k, n_eligible)
+            if k_live <= 0 or len(queries) == 0:
+                return np.zeros((len(queries), k), dtype="float32"), np.full((len(queries), k), -1, dtype="int64")
+            distances, indices = self._search(queries, k_live, selector)
+            ids = self.id_map.ids_at(indices)
+        if k_live < k:
+            distances = np.pad(distances, ((0, 0), (0, k - k_live)))
+            ids = np.pad(ids, ((0, 0), (0, k - k_live)), constant_values=-1)
+        return distances, ids
+
+    def find_similar_batch(
+        self,
+        query_vectors: np.ndarray,
+        exclude_ids: list | None = None,
+        n_results=24,
+        similarity_threshold=0.50,
+        id_filter=None,
+    ) -> list[list[tuple[int, float]]]:
+        """
+        Answers many queries with one matrix search. `exclude_ids`, `n_results`
+        and `similarity_threshold` are per query (a scalar applies to all);
+        `id_filter` applies to every query.
+        Returns, per query, up to n_results (image_id, similarity) pairs, best first.
+        """
+        queries = np.ascontiguousarray(query_vectors, dtype="float32").reshape(-1, self.embedding_dim)
+        n_queries = len(queries)
+        exclude_ids = [set(ids) for ids in exclude_ids] if exclude_ids is not None else [set()] * n_queries
+        n_results = np.broadcast_to(np.asarray(n_results, dtype="int64"), (n_queries,))
+        thresholds = np.broadcast_to(np.asarray(similarity_threshold, dtype="float32"), (n_queries,))
+        if n_queries == 0: return []
+
+        # Ids excluded by every query are skipped inside FAISS; over-fetch only by
+        # each query's remaining exclusions so they cannot starve its top-k.
+        shared = set.intersection(*exclude_ids)
+        k = int(max(n + len(excluded - shared) for n, excluded in zip(n_results, exclude_ids)))
+        distances, ids = self.search(queries, k, id_filter=id_filter, exclude_ids=shared)
+
+        keep = (ids >= 0) & (distances >= thresholds[:, None])
+        results = []
+        for row in range(n_queries):
+            row_ids, row_scores = ids[row][keep[row]], distances[row][keep[row]]
+            matches = [(int(i), float(d)) for i, d in zip(row_ids, row_scores) if i not in exclude_ids[row]]
+            results.append(matches[:n_results[row]])
+        return results
+
+    def find_similar_images_by_vector(self, query_vector: np.ndarray, exclude_ids, n_results: int = 24,
+                                      similarity_threshold: float = 0.50, id_filter=None) -> list[int]:
+        """Ids of the n_results most similar images at or above the threshold, best first."""
+        distances, ids = self.search(query_vector, n_results, id_filter=id_filter, exclude_ids=exclude_ids)
+        keep = (ids[0] >= 0) & (distances[0] >= similarity_threshold)
+        similar_ids = [int(i) for i in ids[0][keep]]
+        logger.debug(
+            f"[Vector Search] threshold={similarity_threshold}: "
+            + ", ".join(f"{int(i)}:{d:.4f}" for i, d in zip(ids[0], distances[0]) if i >= 0)
+        )
+        return similar_ids
+
+    def checkpoint(self):
+        """
+        Writes the index and id map to a new generation of files, then swaps the
+        manifest to point at them and truncates the append log. Both files are
+        committed by that one manifest replace, so a crash at any point leaves
+        the previous checkpoint (plus the log) intact. This is the only place
+        the full index is written, so its O(N) cost is paid once per checkpoint
+        interval rather than per upload.
+        """
+        with self._lock:
+            generation = self._generation + 1
+            index_file, ids_file = self._generation_paths(generation)
+            _atomic_write(index_file, lambda p: faiss.write_index(self.index, str(p)))
+            _atomic_write(ids_file, self.id_map.save)
+            current = {"generation": generation, "index": index_file.name, "ids": ids_file.name, "vectors": self.index.ntotal}
+            manifest = {**current, "previous": self._checkpoint_files}
+            _atomic_write(self.manifest_path, lambda p: p.write_text(json.dumps(manifest)))
+            self._checkpoint_files, self._generation = current, generation
+
+            # Re-open the saved map so the in-memory deltas start empty again, and
+            # re-map a still-mapped index from the new file, so neither holds a map
+            # of the old generation (which Windows could then not delete).
+            self.id_map = IdMap.load(ids_file)
+            if self._index_is_mapped:
+                self.index = self._configure_index(index_factory.read_index(index_file, mmap=True))
+            if self._log_file is not None:
+                self._log_file.truncate(0)
+            elif self.log_path.exists():
+                self.log_path.unlink()
+            self._pending_records = 0
+            self._remove_stale_checkpoints(manifest)
+            logger.info(f"Checkpointed FAISS index with {self.index.ntotal} vectors (generation {generation}).")
+
+    def _generation_paths(self, generation: int) -> tuple[Path, Path]:
+        tag = f"{generation:0{_GENERATION_DIGITS}d}"
+        return (self.index_path.with_name(f"{self.index_path.stem}.{tag}{self.index_path.suffix}"),
+                self.mapping_path.with_name(f"{self.mapping_path.stem}.{tag}{self.mapping_path.suffix}"))
 
-        final_ids = similar_ids[:n_results]
-        logger.info(f"--- [Vector Search] Final suggested IDs: {final_ids} ---")
-        return final_ids
+    def _remove_stale_checkpoints(self, manifest: dict):
+        """Deletes checkpoint files other than the manifest's current and previous generation."""
+        keep = {manifest["index"], manifest["ids"]}
+        if manifest.get("previous"):
+            keep |= {manifest["previous"]["index"], manifest["previous"]["ids"]}
+        stale = [self.index_path, self.mapping_path]  # the single-file layout before generations
+        for path in (self.index_path, self.mapping_path):
+            stale += path.parent.glob(f"{path.stem}.{'[0-9]' * _GENERATION_DIGITS}{path.suffix}")
+        for path in stale:
+            if path.name in keep or not path.exists(): continue
+            try:
+                path.unlink()
+            except OSError as e:
+                # Retried after the next checkpoint.
+                logger.debug(f"Could not remove old checkpoint file {path}: {e}")
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            index_type, storage = index_factory.describe_index(self.index)
+            index_stats = {
+                "type": type(self.index).__name__,
+                "index_type": index_type,
+                "storage": storage,
+                "vectors": self.index.ntotal,
+                "live_vectors": self.index.ntotal - len(self.tombstones),
+                "tombstones": len(self.tombstones),
+                "pending_log_records": self._pending_records,
+                "rebuild_running": self._rebuild_thread is not None,
+                "index_memory_mapped": self._index_is_mapped,
+            }
+        engine_stats = self.engine.get_stats() if self.engine else {"ready": False}
+        return {"index": index_stats, "embedding_engine": engine_stats}
+
+    def close(self):
+        """Flushes outstanding log records into a checkpoint and releases the log file."""
+        if self.engine is not None:
+            self.engine.shutdown()
+        with self._lock:
+            if self._pending_records:
+                self.checkpoint()
+            if self._log_file is not None:
+                self._log_file.close()
+                self._log_file = None
+
+    def _maybe_start_rebuild(self):
+        """
+        Starts a background rebuild when either the index has grown past the
+        promotion threshold but is not yet the configured VECTOR_INDEX_TYPE /
+        VECTOR_STORAGE, or tombstones exceed the compaction threshold (rebuild
+        into the current type, dropping them).
+        """
+        with self._lock:
+            if self._rebuild_thread is not None or self.index.ntotal == 0: return
+
+            current_spec = index_factory.describe_index(self.index)
+            target_spec = index_factory.index_spec(settings.VECTOR_INDEX_TYPE, settings.VECTOR_STORAGE)
+            live = self.index.ntotal - len(self.tombstones)
+            if current_spec != target_spec and live >= settings.VECTOR_PROMOTION_THRESHOLD:
+                spec = target_spec
+            elif len(self.tombstones) / self.index.ntotal >= settings.VECTOR_COMPACTION_THRESHOLD:
+                spec = current_spec
+            else:
+                return
+
+            self._rebuild_thread = threading.Thread(target=self._rebuild_index, args=spec, name="faiss-rebuild", daemon=True)
+            self._rebuild_thread.start()
+
+    def _rebuild_index(self, target_type: str, storage: str):
+        """
+        Builds a fresh index of `target_type` / `storage` from a snapshot of the
+        live vectors, then, under the lock, catches up on vectors added and
+        removed meanwhile and swaps it in with renumbered id maps. Only the
+        snapshot, the short per-chunk copies and the final swap hold the lock.
+        """
+        staged_raw_path = None
+        try:
+            # 1. Snapshot which positions are live.
+            with self._lock:
+                snapshot_size = self.index.ntotal
+                live = np.ones(snapshot_size, dtype=bool)
+                if self.tombstones:
+                    live[np.fromiter(self.tombstones, dtype="int64", count=len(self.tombstones))] = False
+            live_positions = np.flatnonzero(live)
+            logger.info(f"Rebuilding FAISS index as '{target_type}' ({storage}) from {len(live_positions)} live vectors ({snapshot_size - len(live_positions)} tombstones dropped)...")
+
+            # 2. Copy them out chunk by chunk. Positions below the snapshot size
+            #    never change before the swap, but FAISS cannot be read while
+            #    another thread adds, so each chunk still takes the lock briefly.
+            vectors = np.empty((len(live_positions), self.embedding_dim), dtype="float32")
+            for start in range(0, len(live_positions), _RECONSTRUCT_CHUNK):
+                chunk = live_positions[start:start + _RECONSTRUCT_CHUNK]
+                with self._lock:
+                    vectors[start:start + len(chunk)] = self._reconstruct_positions(chunk)
+
+            # 3. Build the new index, and its exact-vector store if it keeps PQ codes.
+            if len(live_positions) == 0:
+                target_type, storage = "flat", "float32"
+            new_index = index_factory.build_index(
+                target_type, self.embedding_dim, len(live_positions), storage=storage,
+                nlist=settings.VECTOR_IVF_NLIST, pq_m=settings.VECTOR_PQ_M, hnsw_m=settings.VECTOR_HNSW_M,
+            )
+            index_factory.populate_index(new_index, vectors)
+            if index_factory.describe_index(new_index)[1] == "pq":
+                staged_raw_path = self.raw_vectors_path.with_name(self.raw_vectors_path.name + ".rebuild")
+                vectors.tofile(staged_raw_path)
+            del vectors
+
+            # 4. Catch up and swap.
+            with self._lock:
+                added_positions = np.arange(snapshot_size, self.index.ntotal, dtype="int64")
+                kept_positions = np.concatenate([live_positions, added_positions])
+                new_positions = np.full(self.index.ntotal, -1, dtype="int64")
+                new_positions[kept_positions] = np.arange(len(kept_positions))
+                index_to_id = self.id_map.all_ids()[kept_positions]
+                tombstones = new_positions[np.fromiter(self.tombstones, dtype="int64", count=len(self.tombstones))]
+                if len(added_positions):
+                    added = self._reconstruct_positions(added_positions)
+                    new_index.add(added)
+                    if staged_raw_path is not None:
+                        with open(staged_raw_path, "ab") as f: f.write(added.tobytes())
+
+                # PQ codes are lossy, so PQ indexes keep an exact copy of each vector on disk.
+                if staged_raw_path is not None:
+                    if self._raw_store is None:
+                        self._raw_store = RawVectorStore(self.raw_vectors_path, self.embedding_dim)
+                    self._raw_store.replace_with(staged_raw_path)
+                    staged_raw_path = None
+                elif self._raw_store is not None:
+                    self._raw_store.delete()
+                    self._raw_store = None
+
+                self.index = self._configure_index(new_index)
+                self._index_is_mapped = False
+                self.id_map = IdMap.from_ids(index_to_id, tombstones[tombstones >= 0])
+                self._tombstone_selector = None
+                self._filter_masks.clear()
+                self.checkpoint()
+            logger.info(f"FAISS index rebuilt as {type(self.index).__name__} with {self.index.ntotal} vectors.")
+        except Exception as e:
+            logger.error(f"FAISS index rebuild failed; keeping the current index: {e}", exc_info=True)
+        finally:
+            if staged_raw_path is not None and staged_raw_path.exists():
+                staged_raw_path.unlink()
+            with self._lock:
+                self._rebuild_thread = None
+
+    def _open_raw_store(self) -> RawVectorStore | None:
+        """Attaches the exact-vector store when the loaded index keeps only PQ codes."""
+        if index_factory.describe_index(self.index)[1] != "pq":
+            if self.raw_vectors_path.exists(): self.raw_vectors_path.unlink()
+            return None
+
+        store = RawVectorStore(self.raw_vectors_path, self.embedding_dim)
+        if len(store) < self.index.ntotal:
+            logger.warning(f"Exact vector store has {len(store)} of {self.index.ntotal} rows; filling the gap with PQ reconstructions.")
+            store.append(self.index.reconstruct_n(len(store), self.index.ntotal - len(store)))
+        # Rows beyond the checkpoint are re-added by the log replay.
+        store.truncate(self.index.ntotal)
+        return store
+
+    def _reconstruct_positions(self, positions: np.ndarray) -> np.ndarray:
+        if self._raw_store is not None:
+            return self._raw_store.get(positions) if len(positions) else np.empty((0, self.embedding_dim), dtype="float32")
+        if len(positions) == 0:
+            return np.empty((0, self.embedding_dim), dtype="float32")
+        if len(positions) == self.index.ntotal:
+            return self.index.reconstruct_n(0, self.index.ntotal)
+        return self.index.reconstruct_batch(positions)
+
+    def _search(self, queries: np.ndarray, k: int, selector=None):
+        """
+        Searches the index, letting FAISS skip tombstoned positions itself (or
+        anything `selector` rejects; it must reject tombstones too). A flat PQ
+        index takes no selector, so its results are filtered after the search
+        instead. PQ indexes fetch k * VECTOR_RERANK_FACTOR candidates and
+        re-score them against the exact vectors.
+        """
+        fetch = k if self._raw_store is None else min(k * settings.VECTOR_RERANK_FACTOR, self.index.ntotal)
+        if selector is None and self.tombstones:
+            if self._tombstone_selector is None:
+                self._tombstone_array = np.fromiter(self.tombstones, dtype="int64", count=len(self.tombstones))
+                self._tombstone_selector = faiss.IDSelectorNot(faiss.IDSelectorBatch(self._tombstone_array))
+            selector = self._tombstone_selector
+        if selector is None:
+            distances, indices = self.index.search(queries, fetch)
+        elif not index_factory.accepts_search_parameters(self.index):
+            distances, indices = index_factory.search_post_filtered(self.index, queries, fetch, self._admitted_positions(selector))
+        else:
+            params = index_factory.search_parameters(self.index, selector, settings.VECTOR_NPROBE, settings.VECTOR_EF_SEARCH)
+            distances, indices = self.index.search(queries, fetch, params=params)
+
+        if self._raw_store is None:
+            return distances, indices
+        return index_factory.rerank_exact(queries, indices, self._raw_store.get, k)
+
+    def _admitted_positions(self, selector) -> np.ndarray:
+        """The per-position mask behind a selector built by _search() or _selector(). Call with the lock held."""
+        if selector is self._tombstone_selector:
+            mask = np.ones(self.index.ntotal, dtype=bool)
+            mask[self._tombstone_array] = False
+            return mask
+        return np.unpackbits(selector.bitmap_array, count=self.index.ntotal, bitorder="little").astype(bool)
 
-    def _save_to_disk(self, index, id_to_index, index_to_id):
-        faiss.write_index(index, str(self.index_path))
-        with open(self.mapping_path, 'wb') as f: pickle.dump({'id_to_index': id_to_index, 'index_to_id': index_to_id}, f)
+    def _selector(self, id_filter, exclude_ids) -> tuple:
+        """
+        The FAISS selector for a filtered search (None: every live vector) and
+        how many vectors it admits. The filter's per-id mask is mapped onto index
+        positions once per index version; exclusions are cleared from a copy.
+        Call with the lock held.
+        """
+        n_live = self.index.ntotal - len(self.tombstones)
+        if id_filter is None and not exclude_ids:
+            return None, n_live
+
+        cached = self._filter_masks.get(id_filter.key) if id_filter is not None else None
+        if cached is not None and cached[0] == self.version:
+            mask = cached[1]
+        else:
+            ids = self.id_map.all_ids()
+            mask = np.ones(len(ids), dtype=bool)
+            if id_filter is not None:
+                allowed = ids < len(id_filter.mask)
+                mask &= allowed
+                mask[allowed] &= id_filter.mask[ids[allowed]]
+            if self.tombstones:
+                mask[np.fromiter(self.tombstones, dtype="int64", count=len(self.tombstones))] = False
+            if id_filter is not None:
+                if len(self._filter_masks) >= 32:
+                    self._filter_masks.clear()
+                self._filter_masks[id_filter.key] = (self.version, mask)
+
+        excluded = self.id_map.positions_of(exclude_ids) if exclude_ids else ()
+        if len(excluded):
+            mask = mask.copy()
+            mask[excluded] = False
+        n_eligible = int(mask.sum()) if id_filter is not None else n_live - len(excluded)
+        if n_eligible == n_live:
+            return None, n_live
+
+        bitmap = np.packbits(mask, bitorder="little")
+        selector = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+        selector.bitmap_array = bitmap  # the selector only holds a pointer into it
+        return selector, n_eligible
+
+    def _configure_index(self, index):
+        return index_factory.configure_search(index, nprobe=settings.VECTOR_NPROBE, ef_search=settings.VECTOR_EF_SEARCH)
+
+    def _add_to_index(self, image_id: int, embedding: np.ndarray):
+        if self._index_is_mapped:
+            # Normally done by the warmup thread; only a write before it finishes gets here.
+            logger.info("Copying the memory-mapped FAISS index into memory before its first write...")
+            self.index = self._configure_index(index_factory.materialize(self.index))
+            self._index_is_mapped = False
+        self.index.add(embedding.reshape(1, -1))
+        if self._raw_store is not None:
+            self._raw_store.append(embedding)
+        self.id_map.append(image_id)
+        self.version += 1
+
+    def _tombstone(self, image_id: int):
+        self.id_map.remove(image_id)
+        self.version += 1
+        self._tombstone_selector = None
+
+    def _append_to_log(self, op: bytes, image_id: int, embedding: np.ndarray | None = None):
+        # The log is opened lazily so a read-only instance never touches it.
+        if self._log_file is None:
+            self._log_file = open(self.log_path, "ab")
+        record = _LOG_HEADER.pack(op, image_id)
+        if embedding is not None:
+            record += embedding.astype("float32").tobytes()
+        self._log_file.write(record)
+        self._log_file.flush()
+        self._pending_records += 1
+
+    def _replay_log(self):
+        """Re-applies additions and deletions logged since the last checkpoint."""
+        if not self.log_path.exists(): return
+
+        data = self.log_path.read_bytes()
+        offset, replayed, records = 0, 0, 0
+        while offset + _LOG_HEADER.size <= len(data):
+            op, image_id = _LOG_HEADER.unpack_from(data, offset)
+            end = offset + _LOG_HEADER.size + (self._vector_bytes if op == _OP_ADD else 0)
+            if end > len(data): break
+            if op == _OP_ADD and image_id not in self.id_map:
+                vector = np.frombuffer(data, dtype="float32", count=self.embedding_dim, offset=offset + _LOG_HEADER.size)
+                self._add_to_index(image_id, vector)
+                replayed += 1
+            elif op == _OP_DELETE and image_id in self.id_map:
+                self._tombstone(image_id)
+                replayed += 1
+            offset, records = end, records + 1
+
+        if offset != len(data):
+            # A crash mid-write leaves a torn final record; drop it.
+            logger.warning(f"Discarding {len(data) - offset} trailing bytes of a partial record in {self.log_path}.")
+            with open(self.log_path, "r+b") as f: f.truncate(offset)
+
+        self._pending_records = records
+        logger.info(f"Replayed {replayed} records from the append log.")
+
+    def _checkpoint_candidates(self) -> list[dict]:
+        """Checkpoints to load, best first: the manifest's current and previous generation, or the pre-generation files."""
+        if self.manifest_path.exists():
+            manifest = json.loads(self.manifest_path.read_text())
+            return [c for c in (manifest, manifest.get("previous")) if c]
+        legacy_mapping_path = self.mapping_path.with_name(_LEGACY_MAPPING_NAME)
+        if self.index_path.exists() or self.mapping_path.exists() or legacy_mapping_path.exists():
+            ids_file = self.mapping_path if self.mapping_path.exists() or not legacy_mapping_path.exists() else legacy_mapping_path
+            return [{"generation": 0, "index": self.index_path.name, "ids": ids_file.name}]
+        return []
 
     def _load_or_create_index(self) -> tuple:
-        if self.index_path.exists() and self.mapping_path.exists():
+        """
+        Opens the newest readable checkpoint. If the current generation is
+        unreadable the previous one is used (images indexed after it need a
+        reindex); if no checkpoint is readable this raises rather than start an
+        empty index whose first checkpoint would replace the files on disk.
+        """
+        candidates = self._checkpoint_candidates()
+        if not candidates:
+            return index_factory.build_index("flat", self.embedding_dim), IdMap()
+
+        errors = []
+        for candidate in candidates:
+            index_file = self.index_path.with_name(candidate["index"])
+            ids_file = self.mapping_path.with_name(candidate["ids"])
             try:
-                index = faiss.read_index(str(self.index_path))
-                with open(self.mapping_path, 'rb') as f: mappings = pickle.load(f)
-                return index, mappings['id_to_index'], mappings['index_to_id']
+                index = index_factory.read_index(index_file, mmap=settings.VECTOR_INDEX_MMAP)
+                if ids_file.name == _LEGACY_MAPPING_NAME:
+                    id_map = self._migrate_legacy_mapping(ids_file)
+                    ids_file = self.mapping_path
+                else:
+                    id_map = IdMap.load(ids_file)
+                if index.ntotal != len(id_map):
+                    raise ValueError(f"index holds {index.ntotal} vectors but mapping has {len(id_map)} ids")
             except Exception as e:
-                logger.error(f"Error loading FAISS index or mappings: {e}. Recreating...")
-        
-        index = faiss.IndexFlatIP(self.embedding_dim)
-        return index, {}, []
-    
+                errors.append(f"{index_file.name} / {ids_file.name}: {e}")
+                logger.error(f"Could not load FAISS checkpoint {index_file.name} / {ids_file.name}: {e}")
+                continue
+            if candidate is not candidates[0]:
+                logger.error(f"Loaded the previous FAISS checkpoint (generation {candidate['generation']}); images indexed "
+                             "after it are missing until POST /api/tasks/reindex or scripts.reindex adds them back.")
+                # An exact-vector store written for the newer generation may be numbered differently.
+                if self.raw_vectors_path.exists(): self.raw_vectors_path.unlink()
+            self._generation = candidates[0]["generation"]
+            self._checkpoint_files = {"generation": candidate["generation"], "index": index_file.name,
+                                      "ids": ids_file.name, "vectors": index.ntotal}
+            self._index_is_mapped = settings.VECTOR_INDEX_MMAP
+            return self._configure_index(index), id_map
+
+        raise RuntimeError(
+            "No FAISS checkpoint could be loaded (" + "; ".join(errors) + "). Refusing to start with an empty "
+            "index that would overwrite them; move the files aside to start a fresh index."
+        )
+
+    def _migrate_legacy_mapping(self, legacy_mapping_path: Path) -> IdMap:
+        """One-off conversion of the old pickled dict/list mapping to the compact id map."""
+        with open(legacy_mapping_path, 'rb') as f: mappings = pickle.load(f)
+        id_map = IdMap.from_ids(mappings['index_to_id'], mappings.get('tombstones', []))
+        _atomic_write(self.mapping_path, id_map.save)
+        legacy_mapping_path.unlink()
+        logger.info(f"Converted {legacy_mapping_path} to the compact id map at {self.mapping_path}.")
+        return id_map
+
     def get_all_vectors(self) -> tuple[np.ndarray, list[int]] | tuple[None, None]:
         """
-        Exports all vectors from the FAISS index along with their corresponding
-        database image IDs.
-        
+        Exports all live (non-deleted) vectors from the FAISS index along with
+        their corresponding database image IDs.
+
         Returns:
             A tuple containing a numpy array of all vectors and a list of image IDs,
             or (None, None) if the index is empty.
         """
-        index, _, index_to_id = self._load_or_create_index()
-        if index.ntotal == 0:
-            return None, None
-            
-        logger.info(f"Exporting all {index.ntotal} vectors from the FAISS index.")
-        
-        # Reconstruct all vectors from the index
-        all_vectors = index.reconstruct_n(0, index.ntotal)
-        
-        return all_vectors, index_to_id
-
-try:
-    vector_service = VectorService()
-except Exception as e:
-    vector_service = None
\ No newline at end of file
+        with self._lock:
+            if self.index.ntotal == len(self.tombstones):
+                return None, None
+
+            logger.info(f"Exporting {self.index.ntotal - len(self.tombstones)} vectors from the FAISS index.")
+
+            # Reconstruct all vectors from the index, then drop tombstoned positions
+            all_vectors = self._reconstruct_positions(np.arange(self.index.ntotal, dtype="int64"))
+            all_ids = self.id_map.all_ids()
+            if not self.tombstones:
+                return all_vectors, all_ids.tolist()
+            live = np.ones(self.index.ntotal, dtype=bool)
+            live[list(self.tombstones)] = False
+            return all_vectors[live], all_ids[live].tolist()
+
+_instance: VectorService | None = None
+_instance_lock = threading.Lock()
+
+def get_vector_service() -> VectorService:
+    """Returns the process-wide VectorService, opening the index on first use."""
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                _instance = VectorService()
+    return _instance
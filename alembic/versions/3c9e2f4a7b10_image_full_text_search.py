@@ -0,0 +1,77 @@
+"""Image full-text search
+
+Revision ID: 3c9e2f4a7b10
+Revises: 70ab99971252
+Create Date: 2026-10-16 10:12:41.208355
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c9e2f4a7b10'
+down_revision: Union[str, Sequence[str], None] = '70ab99971252'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+POSTGRES_DOCUMENT = (
+    "setweight(to_tsvector('simple', coalesce(prompt, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(original_filename, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(negative_prompt, '')), 'C')"
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    dialect = op.get_bind().dialect.name
+    if dialect == "postgresql":
+        op.execute(f"CREATE INDEX IF NOT EXISTS ix_images_full_text ON images USING gin (({POSTGRES_DOCUMENT}))")
+        return
+    if dialect != "sqlite":
+        return
+
+    # External-content FTS5 table over images(id), kept in sync by triggers.
+    op.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS images_fts USING fts5(
+            prompt, negative_prompt, original_filename,
+            content='images', content_rowid='id',
+            tokenize="unicode61 remove_diacritics 2 tokenchars '_'"
+        )
+    """)
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS images_fts_insert AFTER INSERT ON images BEGIN
+            INSERT INTO images_fts(rowid, prompt, negative_prompt, original_filename)
+            VALUES (new.id, new.prompt, new.negative_prompt, new.original_filename);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS images_fts_delete AFTER DELETE ON images BEGIN
+            INSERT INTO images_fts(images_fts, rowid, prompt, negative_prompt, original_filename)
+            VALUES ('delete', old.id, old.prompt, old.negative_prompt, old.original_filename);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS images_fts_update AFTER UPDATE OF prompt, negative_prompt, original_filename ON images BEGIN
+            INSERT INTO images_fts(images_fts, rowid, prompt, negative_prompt, original_filename)
+            VALUES ('delete', old.id, old.prompt, old.negative_prompt, old.original_filename);
+            INSERT INTO images_fts(rowid, prompt, negative_prompt, original_filename)
+            VALUES (new.id, new.prompt, new.negative_prompt, new.original_filename);
+        END
+    """)
+    # Backfill from the existing rows.
+    op.execute("INSERT INTO images_fts(images_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    dialect = op.get_bind().dialect.name
+    if dialect == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_images_full_text")
+    elif dialect == "sqlite":
+        op.execute("DROP TRIGGER IF EXISTS images_fts_insert")
+        op.execute("DROP TRIGGER IF EXISTS images_fts_delete")
+        op.execute("DROP TRIGGER IF EXISTS images_fts_update")
+        op.execute("DROP TABLE IF EXISTS images_fts")
@@ -0,0 +1,51 @@
+"""Query-shaped composite indexes
+
+Revision ID: 8d41b7e6c2a9
+Revises: 3c9e2f4a7b10
+Create Date: 2026-10-16 14:37:09.551872
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d41b7e6c2a9'
+down_revision: Union[str, Sequence[str], None] = '3c9e2f4a7b10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Newest-first keyset pages: unfiltered, safe mode, media type.
+    op.create_index('ix_images_upload_date_id', 'images', ['upload_date', 'id'], unique=False, if_not_exists=True)
+    op.create_index('ix_images_is_nsfw_upload_date', 'images', ['is_nsfw', 'upload_date', 'id'], unique=False, if_not_exists=True)
+    op.create_index('ix_images_video_source_id_upload_date', 'images', ['video_source_id', 'upload_date', 'id'], unique=False, if_not_exists=True)
+    # Album views, in order_index order.
+    op.create_index('ix_images_album_id_order_index', 'images', ['album_id', 'order_index', 'id'], unique=False, if_not_exists=True)
+    # Tag -> images (the primary key only serves image -> tags).
+    op.create_index('ix_image_tags_tag_id_image_id', 'image_tags', ['tag_id', 'image_id'], unique=False, if_not_exists=True)
+
+    # The single-column indexes are now prefixes of the composite ones.
+    op.drop_index('ix_images_is_nsfw', table_name='images', if_exists=True)
+    op.drop_index('ix_images_album_id', table_name='images', if_exists=True)
+    op.drop_index('ix_images_video_source_id', table_name='images', if_exists=True)
+    # The primary key already is the rowid; an index on it only duplicates it.
+    op.drop_index('ix_images_id', table_name='images', if_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index('ix_images_id', 'images', ['id'], unique=False, if_not_exists=True)
+    op.create_index('ix_images_video_source_id', 'images', ['video_source_id'], unique=False, if_not_exists=True)
+    op.create_index('ix_images_album_id', 'images', ['album_id'], unique=False, if_not_exists=True)
+    op.create_index('ix_images_is_nsfw', 'images', ['is_nsfw'], unique=False, if_not_exists=True)
+
+    op.drop_index('ix_image_tags_tag_id_image_id', table_name='image_tags', if_exists=True)
+    op.drop_index('ix_images_album_id_order_index', table_name='images', if_exists=True)
+    op.drop_index('ix_images_video_source_id_upload_date', table_name='images', if_exists=True)
+    op.drop_index('ix_images_is_nsfw_upload_date', table_name='images', if_exists=True)
+    op.drop_index('ix_images_upload_date_id', table_name='images', if_exists=True)
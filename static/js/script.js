@@ -262,22 +262,24 @@ function initInfiniteScroll() {
     const galleryGrid = document.querySelector("#main-gallery-container .gallery-grid");
     if (!trigger || !galleryGrid) return;
 
-    let skip = 50;
+    // The server pages by (upload_date, id) cursor, so uploads landing mid-scroll
+    // neither shift nor repeat items; each chunk's X-Next-Cursor header points to the next.
+    let cursor = trigger.dataset.nextCursor;
     let isLoading = false;
 
     const observer = new IntersectionObserver(async (entries) => {
-        if (entries[0].isIntersecting && !isLoading) {
+        if (entries[0].isIntersecting && !isLoading && cursor) {
             isLoading = true;
-            const resp = await fetch(`/gallery-chunk?skip=${skip}&limit=50`);
+            const resp = await fetch(`/gallery-chunk?cursor=${encodeURIComponent(cursor)}&limit=50`);
             const html = await resp.text();
+            cursor = resp.ok ? resp.headers.get("X-Next-Cursor") : null;
             
             const parser = new DOMParser();
             const doc = parser.parseFromString(html, "text/html");
             const newItems = doc.querySelectorAll(".gallery-item");
+            newItems.forEach(item => galleryGrid.appendChild(item));
             
-            if (newItems.length > 0) {
-                newItems.forEach(item => galleryGrid.appendChild(item));
-                skip += 50;
+            if (cursor) {
                 isLoading = false;
             } else {
                 trigger.innerHTML = "No more images.";